@@ -0,0 +1,110 @@
+'''
+This file caches the final answers of the agent, so near-duplicate questions don't cost a full LLM round trip.
+
+An answer is reused when a new question has the same retrieved context (the ids of the products given to the LLM)
+and the same browsing flag, and its embedding is at least `threshold` cosine-similar to the cached question.
+Entries expire after a TTL, the cache keeps at most max_entries answers and evicts the least recently used ones,
+and the answers that were based on a product are dropped when that product changes in the database.
+'''
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def cosine_similarity(first, second) -> float:
+    dot = sum(float(a) * float(b) for a, b in zip(first, second))
+    norm = (sum(float(a) ** 2 for a in first) * sum(float(b) ** 2 for b in second)) ** 0.5
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+
+        self._entries = OrderedDict()  # entry id -> (key, embedding, answer, expires_at)
+        self._by_key = {}  # (context ids, browsing flag) -> ids of the entries with that key
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def key(context_ids: list, enable_browse: bool) -> tuple:
+        return tuple(sorted(set(context_ids))), bool(enable_browse)
+
+    def get(self, embedding, context_ids: list, enable_browse: bool):
+        '''
+        Returns the cached answer of the most similar question with the same context, or None
+        '''
+        key = self.key(context_ids, enable_browse)
+        now = time.time()
+        with self._lock:
+            best, best_similarity = None, self.threshold
+            for entry_id in list(self._by_key.get(key, ())):
+                _, cached_embedding, answer, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    self.stats["expirations"] += 1
+                    continue
+                similarity = cosine_similarity(embedding, cached_embedding)
+                if similarity >= best_similarity:
+                    best, best_similarity = entry_id, similarity
+
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best)
+            self.stats["hits"] += 1
+            return self._entries[best][2]
+
+    def set(self, embedding, context_ids: list, enable_browse: bool, answer: str):
+        key = self.key(context_ids, enable_browse)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, list(embedding), answer, time.time() + self.ttl)
+            self._by_key.setdefault(key, set()).add(entry_id)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, changed_ids: list):
+        '''
+        Drop the answers that were based on any of the changed products
+        '''
+        changed_ids = set(changed_ids)
+        with self._lock:
+            for key in [key for key in self._by_key if changed_ids.intersection(key[0])]:
+                for entry_id in list(self._by_key[key]):
+                    self._remove(entry_id)
+                    self.stats["invalidations"] += 1
+
+    def _remove(self, entry_id: int):
+        key = self._entries.pop(entry_id)[0]
+        entry_ids = self._by_key[key]
+        entry_ids.discard(entry_id)
+        if not entry_ids:
+            del self._by_key[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, session, stream_with_context
 from flask_cors import CORS
-from customer_agent import query_customer_agent
+from customer_agent import query_customer_agent, stream_customer_agent
+from chat_server import chat_turn, create_conversation_store, sse_error, sse_event, start_browser_pool, start_write_back
+from metrics import render as render_metrics
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import uuid
 
 load_dotenv()
 
@@ -17,6 +20,26 @@ CORS(app)
 
 llm_client = OpenAI()
 
+start_browser_pool()
+conversation_store = create_conversation_store(llm_client)
+write_back = start_write_back(llm_client)
+
+
+def agent_llm_client():
+    '''
+    llm_client without the retries of the OpenAI client, the agent retries its chat completions itself,
+    with jitter and within its deadline, see customer_agent.py
+    '''
+    with_options = getattr(llm_client, "with_options", None)
+    return with_options(max_retries=0) if with_options is not None else llm_client
+
+
+def get_session_id() -> str:
+    if "session_id" not in session:
+        session["session_id"] = uuid.uuid4().hex
+    return session["session_id"]
+
+
 # Receive the user message
 @app.route("/api/message", methods=["POST"])
 def handle_message():
@@ -26,29 +49,67 @@ def handle_message():
     if not user_message:
         return jsonify({"error": "No message provided"}), 400
 
-    # Create a session variable to hold the chat history
-    if "chat_history" not in session:
-        session["chat_history"] = []
+    session_id = get_session_id()
 
     # Query the LLM
     content = query_customer_agent(
-        user_message, session["chat_history"], llm_client, enable_browsing
+        user_message,
+        conversation_store.get_history(session_id),
+        agent_llm_client(),
+        enable_browsing,
     )
 
     # Append the message and the response to the chat history
-    session["chat_history"].append({"role": "user", "content": user_message})
-    session["chat_history"].append({"role": "assistant", "content": content.strip()})
-    session.modified = True
+    conversation_store.append(session_id, *chat_turn(user_message, content))
 
     return jsonify({"response": content.strip()})
 
 
+# Receive the user message and stream the response as server-sent events
+@app.route("/api/message/stream", methods=["POST"])
+def handle_message_stream():
+    data = request.get_json()
+    user_message = data.get("message", "")
+    enable_browsing = data.get("enable_browsing", True)
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+
+    session_id = get_session_id()
+    chat_history = conversation_store.get_history(session_id)
+
+    def generate():
+        try:
+            for event, value in stream_customer_agent(
+                user_message, chat_history, agent_llm_client(), enable_browsing
+            ):
+                if event == "done":
+                    # Append the message and the full response to the chat history once the stream completes
+                    conversation_store.append(session_id, *chat_turn(user_message, value))
+                yield sse_event(event, value)
+        except Exception as e:
+            yield sse_error(e)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Clear session related data, including the chat memory
 @app.route("/api/reset_session", methods=["POST"])
 def reset_session():
+    if "session_id" in session:
+        conversation_store.clear(session["session_id"])
     session.clear()
     return jsonify({"message": "Session memory reset successfully"})
 
 
+# Latency histograms and counters in the Prometheus text format
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,115 @@
+'''
+Async serving mode: the same API as app.py, served by an ASGI server with the AsyncOpenAI client.
+Database retrieval and browsing run in worker threads, so many conversations can be in flight in one process
+while a slow browse or LLM call is pending.
+
+Run from the backend directory with:
+    uvicorn asgi_app:app --port 5000
+'''
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.middleware.sessions import SessionMiddleware
+from customer_agent import query_customer_agent_async, stream_customer_agent_async
+from chat_server import chat_turn, create_conversation_store, sse_error, sse_event, start_browser_pool, start_write_back
+from metrics import render as render_metrics
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+import asyncio
+import os
+import uuid
+
+load_dotenv()
+
+app = FastAPI()
+app.add_middleware(SessionMiddleware, secret_key=os.getenv("FLASK_SECRET_KEY"))
+
+# Enable cross origin resource sharing to communicate with the React frontend
+# NOTE: A more secure approach is needed before deploying on a remote server
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+# The agent retries its chat completions itself, with jitter and within its deadline, see customer_agent.py
+llm_client = AsyncOpenAI(max_retries=0)
+
+start_browser_pool()
+# The conversation store and the write-back run in threads, with the sync client
+conversation_store = create_conversation_store(OpenAI())
+write_back = start_write_back(OpenAI())
+
+
+def get_session_id(request: Request) -> str:
+    if "session_id" not in request.session:
+        request.session["session_id"] = uuid.uuid4().hex
+    return request.session["session_id"]
+
+
+# Receive the user message
+@app.post("/api/message")
+async def handle_message(request: Request):
+    data = await request.json()
+    user_message = data.get("message", "")
+    enable_browsing = data.get("enable_browsing", True)
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_id = get_session_id(request)
+
+    # Query the LLM
+    content = await query_customer_agent_async(
+        user_message,
+        await asyncio.to_thread(conversation_store.get_history, session_id),
+        llm_client,
+        enable_browsing,
+    )
+
+    # Append the message and the response to the chat history
+    await asyncio.to_thread(conversation_store.append, session_id, *chat_turn(user_message, content))
+
+    return {"response": content.strip()}
+
+
+# Receive the user message and stream the response as server-sent events
+@app.post("/api/message/stream")
+async def handle_message_stream(request: Request):
+    data = await request.json()
+    user_message = data.get("message", "")
+    enable_browsing = data.get("enable_browsing", True)
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_id = get_session_id(request)
+    chat_history = await asyncio.to_thread(conversation_store.get_history, session_id)
+
+    async def generate():
+        try:
+            async for event, value in stream_customer_agent_async(
+                user_message, chat_history, llm_client, enable_browsing
+            ):
+                if event == "done":
+                    # Append the message and the full response to the chat history once the stream completes
+                    await asyncio.to_thread(conversation_store.append, session_id, *chat_turn(user_message, value))
+                yield sse_event(event, value)
+        except Exception as e:
+            yield sse_error(e)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Clear session related data, including the chat memory
+@app.post("/api/reset_session")
+async def reset_session(request: Request):
+    if "session_id" in request.session:
+        await asyncio.to_thread(conversation_store.clear, request.session["session_id"])
+    request.session.clear()
+    return {"message": "Session memory reset successfully"}
+
+
+# Latency histograms and counters in the Prometheus text format
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,143 @@
+'''
+Load test of the browsing admission control of browse_admission.py, with fake tools.
+
+Chats arrive at --rate per second on one event loop, like in the async server, and ask about part numbers the
+database doesn't have, so the fake LLM browses for every one of them. The fake browser takes --browse-latency seconds
+in the browse executor, and --failure-rate of the completions fail with a transient error and are retried.
+The same chats run with an unbounded queue in front of the browsers, as before admission control, and with the
+--max-active, --max-queued and --queue-timeout limits. Reports the latency, the peak of concurrent searches and of
+the queue depth, the chats answered without browsing, the rejected searches and the failed completions of each run.
+
+Run from the backend directory:
+    python -m benchmarks.bench_admission --chats 100 --rate 20 --browse-latency 1.0 --max-queued 8
+'''
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+import uuid
+import chromadb
+import customer_agent
+import vector_db
+from benchmarks.bench_retrieval import generate_catalog
+from benchmarks.fakes import AsyncFakeLLMClient
+from benchmarks.stats import print_summary, summarize
+from browse_admission import BrowseAdmission
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+
+
+async def run_chats(chats: list) -> dict:
+    '''
+    Runs the chats at their arrival offsets, returns the latencies, the failed chats and the peak queue depth
+    '''
+    admission = customer_agent.browse_admission
+    peaks = {"queue_depth": 0}
+    latencies, failed = [], []
+
+    async def chat(offset: float, part_number: str, llm_client):
+        await asyncio.sleep(offset)
+        start = time.perf_counter()
+        try:
+            await customer_agent.query_customer_agent_async(
+                f"How do I install {part_number}?", [], llm_client, True
+            )
+        except Exception as e:
+            failed.append(e)
+        latencies.append(time.perf_counter() - start)
+
+    async def monitor():
+        while True:
+            peaks["queue_depth"] = max(peaks["queue_depth"], admission.queue_depth())
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(monitor())
+    await asyncio.gather(*[chat(*arguments) for arguments in chats])
+    sampler.cancel()
+    return {"latencies": latencies, "failed": len(failed), "peak_queue_depth": peaks["queue_depth"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browsing admission control load test")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20, help="Chats arriving per second")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fake LLM takes to answer")
+    parser.add_argument("--browse-latency", type=float, default=1.0, help="Seconds the fake browser takes")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Share of the completions that fail")
+    parser.add_argument("--max-active", type=int, default=customer_agent.browse_admission.max_active)
+    parser.add_argument("--max-queued", type=int, default=8)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in generate_catalog(60)])
+    customer_agent.answer_cache = None
+    customer_agent.llm_retry_backoff = 0.05
+
+    searches = {"active": 0, "peak": 0}
+    searches_lock = threading.Lock()
+
+    def fake_search_partselect(part_number):
+        with searches_lock:
+            searches["active"] += 1
+            searches["peak"] = max(searches["peak"], searches["active"])
+        try:
+            time.sleep(args.browse_latency)
+            return f"# Part {part_number}\nPartSelect Number **{part_number}**\nFits most refrigerators."
+        finally:
+            with searches_lock:
+                searches["active"] -= 1
+
+    customer_agent.search_partselect = fake_search_partselect
+
+    offsets = []
+    offset = 0.0
+    for _ in range(args.chats):
+        offsets.append(offset)
+        offset += random.expovariate(args.rate)
+
+    runs = {
+        "unbounded queue": BrowseAdmission(args.max_active, max_queued=args.chats, wait_timeout=float("inf")),
+        "admission control": BrowseAdmission(args.max_active, args.max_queued, args.queue_timeout),
+    }
+    for name, admission in runs.items():
+        customer_agent.browse_admission = admission
+        searches["peak"] = 0
+        random.seed(args.seed)
+        chats = []
+        for i, offset in enumerate(offsets):
+            part_number = f"PS{80000000 + i}"
+            llm_client = AsyncFakeLLMClient(
+                tool_calls=[("search_partselect", {"part_number": part_number})],
+                latency=args.latency,
+                failure_rate=args.failure_rate,
+            )
+            chats.append((offset, part_number, llm_client))
+
+        start = time.perf_counter()
+        result = asyncio.run(run_chats(chats))
+        elapsed = time.perf_counter() - start
+        browse_busy = sum(
+            1 for _, _, llm_client in chats if llm_client.calls and llm_client.calls[0]["tools"] is None
+        )
+        failures = sum(llm_client.failures for _, _, llm_client in chats)
+
+        print_summary(name, summarize(result["latencies"]))
+        print(
+            f"  {len(chats)} chats in {elapsed:.1f}s, peak of {searches['peak']} concurrent searches and "
+            f"{result['peak_queue_depth']} queued, {browse_busy} answered without browsing"
+        )
+        print(
+            f"  admission {admission.stats}, {failures} failed completions, "
+            f"{result['failed']} chats failed after the retries"
+        )
+
+
+if __name__ == "__main__":
+    main()
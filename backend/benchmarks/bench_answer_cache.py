@@ -0,0 +1,105 @@
+'''
+Measures the semantic answer cache on a stream of near-duplicate customer questions.
+
+The fixture catalog is added to a new in-memory Chroma collection, and questions are picked at random from groups of
+paraphrases, the popular groups more often than the others, like support questions are. Every question is answered
+by the agent with a fake LLM of the given latency, with the answer cache enabled.
+Reports the hit rate and the latency of cache hits and misses. Then one product is updated in the database,
+to check that the answers based on it are invalidated.
+
+Run from the backend directory:
+    python -m benchmarks.bench_answer_cache --questions 200 --latency 1.0
+'''
+
+import argparse
+import random
+import time
+import uuid
+import chromadb
+import customer_agent
+import vector_db
+from answer_cache import AnswerCache
+from benchmarks.bench_retrieval import generate_catalog
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+
+paraphrases = [
+    [
+        "How do I install PS11701542?",
+        "how do i install PS11701542",
+        "How can I install PS11701542?",
+        "How do I install part PS11701542?",
+    ],
+    [
+        "The ice maker on my Whirlpool fridge is not working. How can I fix it?",
+        "The ice maker on my Whirlpool fridge is not working, how can I fix it?",
+        "My Whirlpool fridge ice maker is not working. How do I fix it?",
+    ],
+    [
+        "Is PS11752778 compatible with my WRS325FDAM04?",
+        "Is PS11752778 compatible with WRS325FDAM04?",
+        "is PS11752778 compatible with my WRS325FDAM04",
+    ],
+    [
+        "My dishwasher is not draining, what part do I need?",
+        "My dishwasher isn't draining, which part do I need?",
+        "Dishwasher not draining, what part do I need?",
+    ],
+    [
+        "What replaces W10321302?",
+        "What part replaces W10321302?",
+    ],
+    [
+        "How do I replace the door gasket of my Frigidaire refrigerator?",
+        "How can I replace the door gasket on my Frigidaire refrigerator?",
+    ],
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer cache benchmark")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds the fake LLM takes to answer")
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    catalog = [product_info for product_info, _ in generate_catalog(12)]
+    vector_db.add_products_to_vector_db(catalog)
+
+    cache = AnswerCache(threshold=args.threshold)
+    customer_agent.answer_cache = cache
+    vector_db.collection_listeners.append(cache.invalidate)
+    llm_client = FakeLLMClient(reply="Here is how to fix it.", latency=args.latency)
+
+    # Popular questions are asked more often
+    weights = [1 / (rank + 1) for rank in range(len(paraphrases))]
+    hits, misses = [], []
+    for _ in range(args.questions):
+        question = random.choice(random.choices(paraphrases, weights)[0])
+        hits_before = cache.stats["hits"]
+        start = time.perf_counter()
+        customer_agent.query_customer_agent(question, [], llm_client, False)
+        (hits if cache.stats["hits"] > hits_before else misses).append(time.perf_counter() - start)
+
+    print(f"hit rate: {cache.hit_rate():.1%}, {len(llm_client.calls)} LLM calls for {args.questions} questions")
+    print_summary("cache hits", summarize(hits))
+    print_summary("cache misses", summarize(misses))
+    print(f"cache stats: {cache.stats}")
+
+    # Updating a product drops the answers that were based on it
+    cached = len(cache)
+    vector_db.add_products_to_vector_db(
+        [product_info for product_info in catalog if product_info["PartSelect Number"] == "PS11752778"]
+    )
+    print(f"after updating PS11752778: {cached} cached answers -> {len(cache)}")
+
+
+if __name__ == "__main__":
+    main()
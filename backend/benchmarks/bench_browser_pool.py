@@ -0,0 +1,88 @@
+'''
+Compares search latency of the pooled browsers against launching a new browser for every search.
+Runs against the local fixture site, so it doesn't need network access to partselect.com.
+
+Run from the backend directory:
+    python -m benchmarks.bench_browser_pool --searches 40 --concurrency 4 --pool-size 4
+'''
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from playwright.sync_api import sync_playwright
+import search_part_tool
+import url_resolver
+from browser_pool import BrowserPool
+from benchmarks.fixture_server import FixtureSite
+from benchmarks.stats import print_summary, summarize
+
+
+def search_with_new_browser(search_term: str) -> str:
+    '''
+    The previous behaviour of search_partselect: launch, search and tear down a browser per call
+    '''
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch(headless=True)
+        page = browser.new_page()
+        try:
+            return search_part_tool.search_with_page(page, search_term)
+        finally:
+            browser.close()
+
+
+def timed_run(search, search_terms: list, concurrency: int) -> dict:
+    def timed(search_term):
+        start = time.perf_counter()
+        search(search_term)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, search_terms))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browser pool benchmark")
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--max-uses", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.0, help="Simulated network delay per request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, FixtureSite(delay=args.delay) as site:
+        # Keep the urls of the fixture site out of the url map of the server
+        url_resolver.url_map_path = os.path.join(directory, "url_map.json")
+        search_part_tool.partselect_url = site.url
+        part_numbers = [p["partselect_number"] for p in site.products]
+        search_terms = [part_numbers[i % len(part_numbers)] for i in range(args.searches)]
+
+        print_summary(
+            "per-call launch",
+            timed_run(search_with_new_browser, search_terms, args.concurrency),
+        )
+
+        pool = BrowserPool(
+            size=args.pool_size,
+            max_uses=args.max_uses,
+            headless=True,
+            warmup=search_part_tool.warm_up,
+        )
+        # Make sure every browser is launched and warm before timing
+        warm = [pool.submit(lambda page: None) for _ in range(args.pool_size)]
+        for future in warm:
+            future.result()
+
+        def pooled_search(search_term):
+            return pool.run(lambda page: search_part_tool.search_with_page(page, search_term))
+
+        print_summary("pooled", timed_run(pooled_search, search_terms, args.concurrency))
+        print(f"pool stats: {pool.stats}")
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
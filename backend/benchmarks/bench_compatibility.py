@@ -0,0 +1,109 @@
+'''
+Compares answering compatibility and part number questions with the compatibility index
+against the vector search the agent relied on before.
+
+The fixture catalog is added to a new in-memory Chroma collection and a temporary compatibility index.
+For every product and model pair (and as many pairs of a product with a model it doesn't fit), the index answers
+whether they are compatible, and the vector path counts as correct when the top 3 documents retrieved for the question
+contain the product and mention the model. Manufacturer and replaced part numbers are looked up the same way.
+
+Run from the backend directory:
+    python -m benchmarks.bench_compatibility
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+import chromadb
+import vector_db
+from benchmarks.bench_ingestion import render_markdown
+from benchmarks.fixture_server import load_products
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def retrieved_documents(question: str) -> list:
+    results = vector_db.query_chroma(question, 3, mode="vector")
+    return [document for documents in results["documents"] for document in documents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compatibility index benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    products = load_products()
+    with tempfile.TemporaryDirectory() as directory:
+        vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+        vector_db.compatibility_index = CompatibilityIndex(os.path.join(directory, "compatibility_index.db"))
+        product_infos = []
+        for product in products:
+            markdown = render_markdown(product, product["partselect_number"])
+            url = f"https://www.partselect.com/{product['partselect_number']}.htm"
+            product_infos.append(vector_db.extract_product_info(markdown, url, None))
+        vector_db.add_products_to_vector_db(product_infos)
+        index = vector_db.compatibility_index
+
+        all_models = sorted({model for product in products for model in product["models"]})
+        pairs = []
+        for product in products:
+            others = [model for model in all_models if model not in product["models"]]
+            pairs += [(product["partselect_number"], model, True) for model in product["models"]]
+            pairs += [
+                (product["partselect_number"], model, False)
+                for model in random.sample(others, len(product["models"]))
+            ]
+
+        index_correct, vector_correct = 0, 0
+        index_latencies, vector_latencies = [], []
+        for partselect_number, model, compatible in pairs:
+            answer, seconds = timed(index.is_compatible, partselect_number, model)
+            index_latencies.append(seconds)
+            index_correct += answer == compatible
+
+            documents, seconds = timed(retrieved_documents, f"Is {partselect_number} compatible with my {model}?")
+            vector_latencies.append(seconds)
+            evidence = any(partselect_number in document and model in document for document in documents)
+            vector_correct += evidence == compatible
+
+        print(f"compatibility questions: {len(pairs)}, half of them compatible")
+        print(f"  index accuracy: {index_correct / len(pairs):.1%}")
+        print_summary("  index lookup", summarize(index_latencies))
+        print(f"  vector accuracy: {vector_correct / len(pairs):.1%}")
+        print_summary("  vector search", summarize(vector_latencies))
+
+        lookups = [
+            (part_number, product["partselect_number"])
+            for product in products
+            for part_number in [product["manufacturer_part_number"], *product["replaces"]]
+        ]
+        index_correct, vector_correct = 0, 0
+        index_latencies, vector_latencies = [], []
+        for part_number, partselect_number in lookups:
+            parts, seconds = timed(index.parts_for, part_number)
+            index_latencies.append(seconds)
+            index_correct += partselect_number in parts
+
+            documents, seconds = timed(retrieved_documents, f"I need part {part_number}")
+            vector_latencies.append(seconds)
+            vector_correct += bool(documents) and partselect_number in documents[0]
+
+        print(f"part number lookups: {len(lookups)}")
+        print(f"  index accuracy: {index_correct / len(lookups):.1%}")
+        print_summary("  index lookup", summarize(index_latencies))
+        print(f"  vector top-1 accuracy: {vector_correct / len(lookups):.1%}")
+        print_summary("  vector search", summarize(vector_latencies))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+'''
+Measures the context given to the LLM with and without the context budgeter of context_budget.py.
+
+The baseline concatenates every retrieved document, duplicates included, and gives the browsed page to the LLM
+as it is, like the agent did before. Reports the context tokens of the database retrieval, then the prompt tokens
+and end-to-end latency of questions that make the agent browse a product page of the fixture site.
+The fake LLM takes longer on longer prompts, like a real model does.
+
+Run from the backend directory:
+    python -m benchmarks.bench_context --documents 240 --queries 25 --models 300
+'''
+
+import argparse
+import random
+import time
+import uuid
+import chromadb
+import customer_agent
+import vector_db
+from benchmarks.bench_retrieval import generate_catalog, generate_queries
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.fixture_server import load_products, render_product
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from html_markdown import html_to_markdown
+from lexical_index import BM25Index
+from tokens import count_message_tokens, count_tokens
+
+budgeted = {
+    "select_documents": customer_agent.select_documents,
+    "relevant_sections": customer_agent.relevant_sections,
+}
+baseline = {
+    "select_documents": lambda candidates, token_budget, max_distance=None: (
+        [(document_id, document) for document_id, document, _ in candidates],
+        {"candidates": len(candidates), "duplicates": 0, "distant": 0, "over_budget": 0, "tokens": 0},
+    ),
+    "relevant_sections": lambda markdown, query, token_budget: markdown,
+}
+
+
+def use(functions: dict):
+    for name, function in functions.items():
+        setattr(customer_agent, name, function)
+
+
+def browsed_pages(model_count: int) -> dict:
+    '''
+    Markdown of the product pages of the fixture site, with model_count models in their cross reference,
+    as popular parts have
+    '''
+    products = load_products()
+    pages = {}
+    for product in products:
+        models = product["models"] + [f"{product['manufacturer'][:3].upper()}{i:06d}" for i in range(model_count)]
+        pages[product["partselect_number"]] = html_to_markdown(render_product({**product, "models": models}, products))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context budget benchmark")
+    parser.add_argument("--documents", type=int, default=240)
+    parser.add_argument("--queries", type=int, default=25, help="Products to ask about, four queries each")
+    parser.add_argument("--models", type=int, default=300, help="Models in the cross reference of browsed pages")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake LLM takes to answer")
+    parser.add_argument(
+        "--prompt-token-latency", type=float, default=0.0001, help="Seconds the fake LLM takes per prompt token"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    catalog = generate_catalog(args.documents)
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in catalog])
+    queries = [query for _, query, _ in generate_queries(catalog, args.queries)]
+    customer_agent.answer_cache = None
+
+    print(f"Database retrieval, {len(queries)} queries")
+    for name, functions in (("baseline", baseline), ("budgeted", budgeted)):
+        use(functions)
+        tokens = [count_tokens(customer_agent.retrieve_context(query)[0]) for query in queries]
+        print(f"{name}: context tokens mean {sum(tokens) / len(tokens):.0f}, max {max(tokens)}")
+
+    pages = browsed_pages(args.models)
+    customer_agent.search_partselect = lambda part_number: pages.get(part_number, "")
+    browse_questions = [
+        (f"Is {partselect_number} compatible with my {random.choice(product['models'])}?", partselect_number)
+        for partselect_number, product in ((p["partselect_number"], p) for p in load_products())
+    ]
+    raw = [count_tokens(page) for page in pages.values()]
+    print(f"\nBrowsing, {len(browse_questions)} questions, pages of {sum(raw) / len(raw):.0f} tokens on average")
+    for name, functions in (("baseline", baseline), ("budgeted", budgeted)):
+        use(functions)
+        prompt_tokens, latencies = [], []
+        for question, partselect_number in browse_questions:
+            llm_client = FakeLLMClient(
+                tool_calls=[("search_partselect", {"part_number": partselect_number})],
+                latency=args.latency,
+                prompt_token_latency=args.prompt_token_latency,
+            )
+            start = time.perf_counter()
+            customer_agent.query_customer_agent(question, [], llm_client, True)
+            latencies.append(time.perf_counter() - start)
+            prompt_tokens.append(sum(count_message_tokens(call["messages"]) for call in llm_client.calls))
+        print(f"{name}: prompt tokens mean {sum(prompt_tokens) / len(prompt_tokens):.0f}, max {max(prompt_tokens)}")
+        print_summary(f"{name} latency", summarize(latencies))
+    use(budgeted)
+
+
+if __name__ == "__main__":
+    main()
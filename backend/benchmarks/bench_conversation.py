@@ -0,0 +1,119 @@
+'''
+Measures the prompt size and the latency of the agent over a long conversation, with the whole history sent
+on every turn and with the token budget of the conversation store, with and without summaries of the older turns.
+
+The fake LLM answers with a support-length reply and takes longer on longer prompts, like a real model does.
+The summaries are written by a fake LLM too. The store waits for them after each turn, so the runs are repeatable.
+
+Run from the backend directory:
+    python -m benchmarks.bench_conversation --turns 60 --budget 2000
+'''
+
+import argparse
+import functools
+import json
+import time
+import uuid
+import chromadb
+import customer_agent
+import vector_db
+from benchmarks.bench_retrieval import generate_catalog
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from conversation_store import ConversationStore, summarize_with_llm
+from lexical_index import BM25Index
+from tokens import count_message_tokens
+
+questions = [
+    "My Whirlpool fridge WRS325FDAM04 is not making ice, what can I do?",
+    "Is PS11752778 compatible with my WRS325FDAM04?",
+    "How do I install PS11752778?",
+    "The water dispenser on my fridge is also slow, which part should I check?",
+    "My dishwasher WDT780SAEM1 is not draining, what part do I need?",
+    "How long does it take to replace the drain pump?",
+    "What replaces W10321302?",
+    "Can you remind me which parts we talked about for my fridge?",
+]
+
+reply = (
+    "Based on the symptoms you describe, the most likely cause is the part below. Before ordering, unplug the "
+    "appliance and check the part for visible damage: a cracked housing, a burnt connector or a clogged inlet are "
+    "the usual signs. To replace it, remove the two mounting screws, disconnect the wire harness, install the new "
+    "part and reconnect the harness. It is compatible with your model according to the PartSelect compatibility "
+    "list. The installation takes about 15 minutes and only needs a screwdriver. Let me know if you need "
+    "anything else!"
+)
+
+
+def run(name: str, store: ConversationStore, turns: int, checkpoints: list, llm_client):
+    session_id = uuid.uuid4().hex
+    latencies, rows = [], []
+    for turn in range(1, turns + 1):
+        question = questions[(turn - 1) % len(questions)]
+        history = store.get_history(session_id)
+        start = time.perf_counter()
+        answer = customer_agent.query_customer_agent(question, history, llm_client, False)
+        latencies.append(time.perf_counter() - start)
+        store.append(
+            session_id,
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer},
+        )
+        store.wait()
+        if turn in checkpoints:
+            rows.append(
+                (turn, count_message_tokens(llm_client.calls[-1]["messages"]), len(json.dumps(history)),
+                 latencies[-1])
+            )
+
+    print(f"\n{name}")
+    print(f"{'turn':>6} {'prompt tokens':>14} {'history bytes':>14} {'latency ms':>11}")
+    for turn, tokens, size, latency in rows:
+        print(f"{turn:>6} {tokens:>14} {size:>14} {latency * 1000:>11.1f}")
+    print_summary("latency", summarize(latencies))
+    if store.stats["compactions"] or store.stats["dropped_messages"]:
+        print(f"store stats: {store.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation history benchmark")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--budget", type=int, default=2000, help="History token budget")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake LLM takes to answer")
+    parser.add_argument(
+        "--prompt-token-latency", type=float, default=0.00005, help="Seconds the fake LLM takes per prompt token"
+    )
+    args = parser.parse_args()
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in generate_catalog(12)])
+    customer_agent.answer_cache = None
+
+    checkpoints = sorted({1, 5, 10, 20, 40, args.turns} & set(range(1, args.turns + 1)))
+    summarizer_client = FakeLLMClient(
+        reply="The customer owns a Whirlpool WRS325FDAM04 fridge with an ice maker issue (PS11752778, compatible, "
+        "installation explained) and a WDT780SAEM1 dishwasher that doesn't drain (drain pump, W10321302).",
+        latency=args.latency,
+    )
+
+    def llm_client():
+        return FakeLLMClient(reply=reply, latency=args.latency, prompt_token_latency=args.prompt_token_latency)
+
+    run("whole history", ConversationStore(), args.turns, checkpoints, llm_client())
+    run(
+        f"trimmed to {args.budget} tokens",
+        ConversationStore(token_budget=args.budget),
+        args.turns, checkpoints, llm_client(),
+    )
+    run(
+        f"summarized, {args.budget} tokens",
+        ConversationStore(token_budget=args.budget, summarizer=functools.partial(summarize_with_llm, summarizer_client)),
+        args.turns, checkpoints, llm_client(),
+    )
+
+
+if __name__ == "__main__":
+    main()
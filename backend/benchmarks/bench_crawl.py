@@ -0,0 +1,69 @@
+'''
+Crawls the local fixture site at several concurrency levels and reports pages per second.
+Products are recorded instead of being extracted and added to the vector database, so only the crawl is measured.
+After each crawl, the site is re-crawled from the same frontier to measure how cheaply unchanged pages are skipped.
+
+Run from the backend directory:
+    python -m benchmarks.bench_crawl --concurrency 1 4 8 --delay 0.2
+'''
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from benchmarks.fixture_server import FixtureSite
+
+# The crawl creates an OpenAI client for the LLM fallback of the extraction, it just needs a key to be constructed
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+import crawl
+import ingestion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawler benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--requests-per-second", type=float, default=0, help="Per-host rate limit, 0 for none")
+    parser.add_argument("--delay", type=float, default=0.2, help="Simulated network delay per request")
+    args = parser.parse_args()
+
+    added = []
+    crawl.is_in_vector_db = lambda url: False
+    ingestion.extract_product_info = lambda markdown, url, llm_client: {"PartSelect Number": url, "URL": url}
+    ingestion.add_products_to_vector_db = lambda product_infos, batch_size: added.extend(
+        product_info["URL"] for product_info in product_infos
+    )
+
+    with FixtureSite(delay=args.delay) as site:
+        for concurrency in args.concurrency:
+            added.clear()
+            with tempfile.TemporaryDirectory() as directory:
+                frontier_path = os.path.join(directory, "frontier.db")
+                stats = asyncio.run(
+                    crawl.find_and_add_products_async(
+                        args.limit, site.url, concurrency, args.requests_per_second, frontier_path
+                    )
+                )
+                print(
+                    f"concurrency={concurrency}: {stats.pages} pages, {len(added)} products, "
+                    f"{stats.pages_per_second():.2f} pages/s"
+                )
+                if len(added) < len(site.products) and args.limit >= len(site.products):
+                    print(f"  expected {len(site.products)} products, the crawler missed some")
+
+                start = time.perf_counter()
+                recrawl_stats = asyncio.run(
+                    crawl.find_and_add_products_async(
+                        args.limit, site.url, concurrency, args.requests_per_second, frontier_path,
+                        recrawl_after=0,
+                    )
+                )
+                print(
+                    f"  re-crawl: {recrawl_stats.unchanged} unchanged pages skipped, "
+                    f"{recrawl_stats.pages} pages fetched in {time.perf_counter() - start:.2f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+'''
+Compares the embedding backends of encoders.py on CPU: load time, memory footprint, batch encode throughput,
+single query latency, and the cosine similarity of their embeddings with the sentence-transformers ones.
+
+Every backend runs in a fresh process, so the memory numbers don't include the other backends.
+The documents are synthetic product documents generated from the fixture catalog.
+
+Run from the backend directory:
+    python -m benchmarks.bench_encoders --documents 512
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+backends = {
+    "sentence-transformers": ("sentence-transformers", "1"),
+    "onnx": ("onnx", "0"),
+    "onnx int8": ("onnx", "1"),
+}
+
+
+def documents(count: int) -> list:
+    from benchmarks.bench_retrieval import generate_catalog
+    from vector_db import build_document
+
+    return [build_document(product_info) for product_info, _ in generate_catalog(count)]
+
+
+def measure(backend: str, count: int, queries: int, output_path: str):
+    '''
+    Runs in the child process, prints the measurements as JSON and saves the embeddings to output_path
+    '''
+    import numpy as np
+    import psutil
+    from benchmarks.stats import summarize
+    from encoders import create_encoder
+    from vector_db import embedding_model_name
+
+    texts = documents(count)
+    process = psutil.Process()
+    memory_before = process.memory_info().rss
+
+    start = time.perf_counter()
+    encoder = create_encoder(backend, embedding_model_name)
+    encoder.encode(["warm up"])
+    load_seconds = time.perf_counter() - start
+    memory_after_load = process.memory_info().rss
+
+    start = time.perf_counter()
+    embeddings = encoder.encode(texts, batch_size=32)
+    encode_seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        encoder.encode(f"my dishwasher model WDT780SAEM{i} is not draining")
+        latencies.append(time.perf_counter() - start)
+
+    np.save(output_path, np.asarray(embeddings, dtype=np.float32))
+    print(
+        json.dumps(
+            {
+                "load_seconds": round(load_seconds, 2),
+                "model_memory_mb": round((memory_after_load - memory_before) / 2**20, 1),
+                "peak_memory_mb": round(process.memory_info().rss / 2**20, 1),
+                "docs_per_second": round(len(texts) / encode_seconds, 1),
+                "query": summarize(latencies),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark")
+    parser.add_argument("--documents", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--measure", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.documents, args.queries, args.output)
+        return
+
+    import numpy as np
+    from encoders import cosine_similarities
+
+    backend_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        embeddings = {}
+        for name, (backend, quantize) in backends.items():
+            output_path = os.path.join(directory, f"{len(embeddings)}.npy")
+            completed = subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.bench_encoders", "--measure", backend,
+                    "--documents", str(args.documents), "--queries", str(args.queries), "--output", output_path,
+                ],
+                cwd=backend_directory,
+                env={**os.environ, "ENCODER_QUANTIZE": quantize},
+                capture_output=True,
+                text=True,
+            )
+            if completed.returncode != 0:
+                print(f"{name}: failed\n{completed.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            embeddings[name] = np.load(output_path)
+            query = result.pop("query")
+            fields = ", ".join(f"{key}={value}" for key, value in result.items())
+            print(f"{name}: {fields}, query_p50_ms={query['p50_ms']}, query_p95_ms={query['p95_ms']}")
+
+        reference = embeddings.get("sentence-transformers")
+        if reference is not None:
+            for name, other in embeddings.items():
+                if name != "sentence-transformers":
+                    similarities = cosine_similarities(reference, other)
+                    print(
+                        f"{name} vs sentence-transformers: cosine similarity min {min(similarities):.4f}, "
+                        f"mean {sum(similarities) / len(similarities):.4f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
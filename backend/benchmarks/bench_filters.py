@@ -0,0 +1,91 @@
+'''
+Compares the retrieval of vector_db.query_chroma with and without the metadata filters of metadata_filters.py.
+
+The collection is the catalog of bench_retrieval.py, the fixture products and their variants. Questions name the
+appliance and often the brand of a product, and describe a symptom or the part. Reports recall@k (a variant of the
+product is in the top k), precision@k (the share of the top k results for the right appliance and brand,
+according to the catalog, not to the classifier), and the latency of each mode.
+
+Run from the backend directory:
+    python -m benchmarks.bench_filters --documents 480 --queries 100 --k 3
+'''
+
+import argparse
+import random
+import time
+import uuid
+import chromadb
+import vector_db
+from benchmarks.bench_retrieval import generate_catalog
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+from metadata_filters import where_filter
+
+
+def generate_questions(catalog: list, count: int) -> list:
+    '''
+    Returns (question, relevant PartSelect numbers, on-topic PartSelect numbers)
+    '''
+    questions = []
+    for _, product in random.choices(catalog, k=count):
+        appliance = product["appliance"].lower()
+        brand = random.choice([product["manufacturer"], random.choice(product["manufactured_for"]), None])
+        owner = f"{brand} {appliance}" if brand else appliance
+        symptom = random.choice(product["symptoms"]).lower()
+        question = random.choice(
+            [
+                f"My {owner} is {symptom}, what should I replace?",
+                f"I need a {product['name'].lower().replace(appliance, '').strip()} for my {owner}",
+                f"Which part fixes a {owner} that is {symptom}?",
+            ]
+        )
+        relevant = {info["PartSelect Number"] for info, base in catalog if base is product}
+        on_topic = {
+            info["PartSelect Number"]
+            for info, base in catalog
+            if base["appliance"] == product["appliance"] and (not brand or brand in info["Manufactured for"])
+        }
+        questions.append((question, relevant, on_topic))
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata filter benchmark")
+    parser.add_argument("--documents", type=int, default=480)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    catalog = generate_catalog(args.documents)
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in catalog])
+    questions = generate_questions(catalog, args.queries)
+    filtered = sum(1 for question, _, _ in questions if where_filter(question))
+    print(f"{vector_db.collection.count()} documents, {len(questions)} questions, {filtered} with filters")
+
+    for mode in args.modes:
+        for filters in (False, True):
+            recalls, precisions, latencies = [], [], []
+            for question, relevant, on_topic in questions:
+                start = time.perf_counter()
+                results = vector_db.query_chroma(question, args.k, mode=mode, filters=filters)
+                latencies.append(time.perf_counter() - start)
+                ids = results["ids"][0][: args.k] if results["ids"] else []
+                recalls.append(bool(relevant & set(ids)))
+                precisions.append(sum(1 for document_id in ids if document_id in on_topic) / max(len(ids), 1))
+            name = f"{mode} {'with' if filters else 'without'} filters"
+            print(
+                f"{name}: recall@{args.k} {sum(recalls) / len(recalls):.1%}, "
+                f"precision@{args.k} {sum(precisions) / len(precisions):.1%}"
+            )
+            print_summary("  latency", summarize(latencies))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+'''
+Compares the single-pass converter of html_markdown.py with the previous BeautifulSoup and markdownify converter
+on a corpus of pages: conversion time, peak memory, output size, and whether the content is equivalent.
+The peak memory is measured with tracemalloc, so it doesn't include the memory lxml allocates in C.
+
+The content is equivalent when the words of the new markdown are the words the previous converter gives for the
+main content region of the page, without its menus, forms and pop-ups, and when the product parser reads the same
+fields from both. Exits with status 1 if a page isn't equivalent.
+
+The corpus is the pages of the fixture site, with many models in the cross reference of product pages like
+popular parts have, or a directory of saved .html pages. Run from the backend directory:
+    python -m benchmarks.bench_html_markdown --models 300 --repeat 20
+    python -m benchmarks.bench_html_markdown --pages saved_pages/
+'''
+
+import argparse
+import difflib
+import glob
+import os
+import re
+import sys
+import time
+import tracemalloc
+from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+from markdownify import markdownify
+from benchmarks.fixture_server import load_products, render_category, render_home, render_model, render_product
+from benchmarks.stats import print_summary, summarize
+from html_markdown import html_to_markdown, page_level_tags, skipped_tags
+from product_parser import parse_product_markdown
+
+
+def previous_html_to_markdown(html_content: str) -> str:
+    '''
+    The converter used before html_markdown.py
+    '''
+    soup = BeautifulSoup(html_content, "html.parser")
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.extract()
+    cleaned_html = soup.prettify()
+    return markdownify(cleaned_html, heading_style="ATX")
+
+
+def main_region_html(html_content: str) -> str:
+    '''
+    The main content region of a page without the elements html_markdown.py skips, as html
+    '''
+    tree = lxml_html.fromstring(html_content)
+    main_regions = tree.xpath("//main | //*[@id='main'] | //*[@role='main']")
+    region = (main_regions or tree.xpath("//body") or [tree])[0]
+    for element in region.xpath(".//*"):
+        if element.getparent() is None:
+            continue
+        page_level = element.tag in page_level_tags and not main_regions and not element.xpath("ancestor::article")
+        if (
+            element.tag in skipped_tags
+            or page_level
+            or element.get("role") == "dialog"
+            or element.get("hidden") is not None
+        ):
+            element.drop_tree()
+    return lxml_html.tostring(region, encoding="unicode")
+
+
+def words(markdown: str) -> list:
+    markdown = re.sub(r"!\[[^\]]*\]\([^)]*\)", " ", markdown)
+    markdown = re.sub(r"\]\([^)]*\)", " ", markdown)
+    return re.findall(r"\w+", markdown)
+
+
+def fixture_corpus(model_count: int) -> list:
+    products = load_products()
+    pages = []
+    for product in products:
+        models = product["models"] + [f"{product['manufacturer'][:3].upper()}{i:06d}" for i in range(model_count)]
+        pages.append((product["partselect_number"], render_product({**product, "models": models}, products)))
+    for model in sorted({model for product in products for model in product["models"]})[:10]:
+        pages.append((model, render_model(model, products)))
+    pages.append(("Refrigerator-Parts", render_category(products, "Refrigerator")))
+    pages.append(("Dishwasher-Parts", render_category(products, "Dishwasher")))
+    pages.append(("home", render_home(products)))
+    return pages
+
+
+def measure(converter, html_content: str, repeat: int) -> tuple:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        converter(html_content)
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    converter(html_content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return latencies, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML to markdown benchmark")
+    parser.add_argument("--pages", type=str, default=None, help="Directory of saved .html pages")
+    parser.add_argument("--models", type=int, default=300, help="Models in the cross reference of product pages")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            with open(path, encoding="utf-8") as file:
+                pages.append((os.path.basename(path), file.read()))
+    else:
+        pages = fixture_corpus(args.models)
+    print(f"{len(pages)} pages, {sum(len(page) for _, page in pages) / len(pages) / 1024:.0f} KB on average")
+
+    for name, converter in (("previous", previous_html_to_markdown), ("single pass", html_to_markdown)):
+        latencies, peaks, sizes = [], [], []
+        for _, page in pages:
+            page_latencies, peak = measure(converter, page, args.repeat)
+            latencies += page_latencies
+            peaks.append(peak)
+            sizes.append(len(converter(page)))
+        print_summary(name, summarize(latencies))
+        print(
+            f"  peak memory {max(peaks) / 2**20:.1f} MB, "
+            f"output {sum(sizes) / len(sizes) / 1024:.1f} KB on average"
+        )
+
+    different = 0
+    for name, page in pages:
+        new = html_to_markdown(page)
+        previous = previous_html_to_markdown(main_region_html(page))
+        if words(new) != words(previous):
+            different += 1
+            diff = difflib.unified_diff(words(previous), words(new), "previous", "single pass", n=2, lineterm="")
+            print(f"{name}: the content differs\n  " + "\n  ".join(list(diff)[:20]))
+            continue
+        new_fields, previous_fields = parse_product_markdown(new), parse_product_markdown(previous)
+        fields = [field for field in new_fields if new_fields[field] != previous_fields[field]]
+        if fields:
+            different += 1
+            print(f"{name}: the parser reads different {', '.join(fields)}")
+    print(f"equivalent content: {len(pages) - different}/{len(pages)} pages")
+    sys.exit(1 if different else 0)
+
+
+if __name__ == "__main__":
+    main()
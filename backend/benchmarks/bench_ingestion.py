@@ -0,0 +1,120 @@
+'''
+Measures how many product pages per second are ingested into the vector database,
+one product at a time with add_to_vector_db and through the batched ingestion pipeline at several batch sizes.
+
+The pages are synthetic product pages generated from the fixture catalog, and every run writes to a new
+in-memory Chroma collection, so the persistent database isn't touched. The real embedding model is used.
+With --llm-latency the products are extracted by a fake LLM with that latency instead of the parser,
+to show the effect of running the extractions in parallel.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ingestion --documents 256 --batch-sizes 1 8 32 128
+'''
+
+import argparse
+import time
+import uuid
+import yaml
+import chromadb
+import vector_db
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.fixture_server import load_products
+from ingestion import IngestionPipeline
+from product_parser import parse_product_markdown
+
+
+def render_markdown(product: dict, partselect_number: str) -> str:
+    models = "\n".join(
+        f"{product['manufacturer']} | [{model}](/Models/{model}/) | {product['appliance']}" for model in product["models"]
+    )
+    return f"""# {product['name']} {product['manufacturer_part_number']}
+PartSelect Number **{partselect_number}**
+Manufacturer Part Number **{product['manufacturer_part_number']}**
+Manufactured by **{product['manufacturer']}** for {', '.join(product['manufactured_for'])}
+{product['price']}
+## Product Description
+{product['description']}
+## Troubleshooting
+This part fixes the following symptoms:
+{' | '.join(product['symptoms'])}
+This part works with the following products:
+{product['appliance']}.
+Part replaces these:
+{', '.join(product['replaces'])}
+## Model Cross Reference
+Brand | Model Number | Description
+---|---|---
+{models}
+"""
+
+
+def generate_pages(count: int) -> list:
+    '''
+    Returns (markdown, url) for count products with distinct PartSelect numbers
+    '''
+    products = load_products()
+    pages = []
+    for i in range(count):
+        partselect_number = f"PS{90000000 + i}"
+        markdown = render_markdown(products[i % len(products)], partselect_number)
+        pages.append((markdown, f"https://www.partselect.com/{partselect_number}.htm"))
+    return pages
+
+
+def fake_llm_reply(messages: list) -> str:
+    # Answer like the LLM would, with the fields of the page in the prompt as YAML
+    markdown_content = messages[0]["content"].split("---", 1)[1]
+    product = parse_product_markdown(markdown_content)
+    del product["confidence"], product["Compatible Models"]
+    return yaml.dump(product, sort_keys=False)
+
+
+def use_new_collection():
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion benchmark")
+    parser.add_argument("--documents", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--max-extractions", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=None, help="Extract with a fake LLM of this latency")
+    args = parser.parse_args()
+
+    pages = generate_pages(args.documents)
+    llm_client = FakeLLMClient(reply=fake_llm_reply, latency=args.llm_latency or 0.0)
+    if args.llm_latency is not None:
+        # No page reaches this confidence, so every page goes to the LLM
+        vector_db.parser_confidence_threshold = 2.0
+
+    # Load the model before measuring
+    vector_db.get_embedding_model().encode(["warm up"])
+
+    use_new_collection()
+    start = time.perf_counter()
+    for markdown, url in pages:
+        vector_db.add_to_vector_db(markdown, url, llm_client)
+    elapsed = time.perf_counter() - start
+    print(f"one at a time: {len(pages) / elapsed:.1f} docs/s ({vector_db.collection.count()} in the collection)")
+
+    results = []
+    for batch_size in args.batch_sizes:
+        use_new_collection()
+        pipeline = IngestionPipeline(llm_client, batch_size, args.max_extractions)
+        start = time.perf_counter()
+        written = [pipeline.submit(markdown, url) for markdown, url in pages]
+        pipeline.close()
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for future in written if future.exception())
+        results.append((batch_size, len(pages) / elapsed))
+        print(
+            f"batch size {batch_size}: {len(pages) / elapsed:.1f} docs/s, {pipeline.stats['batches']} batches, "
+            f"{failed} failed ({vector_db.collection.count()} in the collection)"
+        )
+
+    best_batch_size, best = max(results, key=lambda result: result[1])
+    print(f"fastest: batch size {best_batch_size} with {best:.1f} docs/s")
+
+
+if __name__ == "__main__":
+    main()
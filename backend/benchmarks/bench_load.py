@@ -0,0 +1,140 @@
+'''
+Load test of the sync Flask server against the async ASGI server, with a fake LLM, a fake browser and a fake database.
+Reports requests per second and tail latency of /api/message for each server.
+
+The sync server handles requests with a fixed number of worker threads, like a gunicorn deployment with sync workers.
+
+Run from the backend directory:
+    python -m benchmarks.bench_load --requests 200 --concurrency 50 --sync-workers 4
+'''
+
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+from benchmarks.fakes import AsyncFakeLLMClient, FakeLLMClient
+from benchmarks.stats import print_summary, summarize
+
+# The OpenAI clients created by the apps are replaced by fakes, they just need a key to be constructed
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("FLASK_SECRET_KEY", "benchmark")
+import app as flask_app
+import asgi_app
+import customer_agent
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    '''
+    A WSGI server that handles requests with a fixed number of threads
+    '''
+
+    def __init__(self, host: str, port: int, app, workers: int):
+        super().__init__(host, port, app)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def install_fakes(args):
+    '''
+    Replace the database and the browser with fakes that only add latency
+    '''
+
+    def fake_query_chroma(query, top_n=4, **kwargs):
+        time.sleep(args.retrieval_latency)
+        return {"documents": [["Product Name: Refrigerator Door Shelf Bin"]], "ids": [["PS11752778"]]}
+
+    def fake_search_partselect(search_term):
+        time.sleep(args.browse_latency)
+        return f"# {search_term}\nRefrigerator Door Shelf Bin"
+
+    customer_agent.query_chroma = fake_query_chroma
+    customer_agent.query_chroma_with_exact_id = lambda id: ""
+    customer_agent.search_partselect = fake_search_partselect
+    customer_agent.browse_executor = ThreadPoolExecutor(max_workers=args.browse_workers)
+
+    tool_calls = [("search_partselect", {"part_number": "PS11752778"})] if args.browse else None
+    flask_app.llm_client = FakeLLMClient(latency=args.llm_latency, tool_calls=tool_calls)
+    asgi_app.llm_client = AsyncFakeLLMClient(latency=args.llm_latency, tool_calls=tool_calls)
+
+
+async def generate_load(url: str, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    body = {"message": "Does PS11752778 fit my WRS325FDAM04 fridge?", "enable_browsing": True}
+
+    async with httpx.AsyncClient(timeout=300, limits=httpx.Limits(max_connections=concurrency)) as client:
+
+        async def one_request():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url + "/api/message", json=body)
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[one_request() for _ in range(requests)])
+        return summarize(latencies, time.perf_counter() - start)
+
+
+def run_sync(args) -> dict:
+    port = free_port()
+    server = PooledWSGIServer("127.0.0.1", port, flask_app.app, args.sync_workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        return asyncio.run(generate_load(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+    finally:
+        server.shutdown()
+
+
+def run_async(args) -> dict:
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        return asyncio.run(generate_load(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+    finally:
+        server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async server load test")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sync-workers", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake completion")
+    parser.add_argument("--browse-latency", type=float, default=2.0, help="Seconds per fake browse")
+    parser.add_argument("--retrieval-latency", type=float, default=0.02, help="Seconds per fake database query")
+    parser.add_argument("--browse-workers", type=int, default=4, help="Concurrent browses in the async server")
+    parser.add_argument("--no-browse", dest="browse", action="store_false", help="Don't request the browsing tool")
+    args = parser.parse_args()
+
+    install_fakes(args)
+    print_summary(f"sync flask ({args.sync_workers} workers)", run_sync(args))
+    print_summary("async asgi", run_async(args))
+
+
+if __name__ == "__main__":
+    main()
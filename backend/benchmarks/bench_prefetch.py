@@ -0,0 +1,76 @@
+'''
+Measures the speculative browsing of speculative_browse.py: questions about part numbers the database doesn't have
+are answered with and without prefetching the PartSelect search during the first completion.
+
+The LLM is a fake that asks for the search in --tool-rate of the questions and answers directly in the others,
+whose prefetches are wasted. The browser is a fake that takes --browse-latency seconds.
+Reports the latency of both runs, and the time saved and wasted by the prefetches.
+
+Run from the backend directory:
+    python -m benchmarks.bench_prefetch --questions 20 --latency 1.0 --browse-latency 2.0 --tool-rate 0.8
+'''
+
+import argparse
+import random
+import time
+import uuid
+import chromadb
+import customer_agent
+import speculative_browse
+import vector_db
+from benchmarks.bench_retrieval import generate_catalog
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative browsing benchmark")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds the fake LLM takes to answer")
+    parser.add_argument("--browse-latency", type=float, default=2.0, help="Seconds the fake browser takes")
+    parser.add_argument("--tool-rate", type=float, default=0.8, help="Share of the questions the LLM browses for")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in generate_catalog(60)])
+    customer_agent.answer_cache = None
+
+    def fake_search_partselect(part_number):
+        time.sleep(args.browse_latency)
+        return f"# Part {part_number}\nPartSelect Number **{part_number}**\nFits most refrigerators."
+
+    customer_agent.search_partselect = fake_search_partselect
+
+    # Part numbers that aren't in the database
+    questions = [
+        (f"How do I install PS{80000000 + i}?", f"PS{80000000 + i}", random.random() < args.tool_rate)
+        for i in range(args.questions)
+    ]
+    for speculative in (False, True):
+        customer_agent.speculative_browse_enabled = speculative
+        latencies = []
+        for question, part_number, browses in questions:
+            tool_calls = [("search_partselect", {"part_number": part_number})] if browses else None
+            llm_client = FakeLLMClient(tool_calls=tool_calls, latency=args.latency)
+            start = time.perf_counter()
+            customer_agent.query_customer_agent(question, [], llm_client, True)
+            latencies.append(time.perf_counter() - start)
+        print_summary("speculative" if speculative else "after the completion", summarize(latencies))
+
+    # Let the wasted searches finish, they are counted when they are done
+    customer_agent.browse_executor.shutdown(wait=True)
+    stats = speculative_browse.stats
+    print(
+        f"prefetches: {stats['started']} started, {stats['used']} used, saving {stats['saved_seconds']:.1f}s, "
+        f"{stats['wasted']} wasted, costing {stats['wasted_seconds']:.1f}s of browsing, {stats['cancelled']} cancelled"
+    )
+
+
+if __name__ == "__main__":
+    main()
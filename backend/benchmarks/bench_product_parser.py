@@ -0,0 +1,139 @@
+'''
+Measures how fast the deterministic product parser is, and how often its fields agree with the LLM extraction.
+
+The corpus is the product pages in fixtures/product_pages, saved from the crawler with the LLM output for each page
+next to it as YAML, plus every product page of the local fixture site converted to markdown like the search tool does,
+compared against the catalog the site is rendered from.
+With --llm the LLM extraction is also run on every page, to compare speed and agreement with the real thing.
+
+Run from the backend directory:
+    python -m benchmarks.bench_product_parser --repeat 200
+'''
+
+import argparse
+import glob
+import os
+import re
+import time
+import yaml
+from benchmarks.fixture_server import load_products, render_product
+from product_parser import parse_product_markdown
+
+corpus_directory = os.path.join(os.path.dirname(__file__), "fixtures", "product_pages")
+
+compared_fields = (
+    "Product Name",
+    "Product Description",
+    "PartSelect Number",
+    "Manufacturer Part Number",
+    "Manufactured by",
+    "Manufactured for",
+    "This part fixes the following symptoms",
+    "This part works with the following products",
+    "Part replaces these",
+)
+
+
+def normalize(value) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+
+def fields_agree(parsed, expected) -> bool:
+    '''
+    Lists are compared as sets, text is compared without case, spacing and punctuation
+    '''
+    if isinstance(expected, list) or isinstance(parsed, list):
+        as_set = lambda value: {normalize(item) for item in (value if isinstance(value, list) else [value]) if item}
+        return as_set(parsed) == as_set(expected)
+    return normalize(parsed) == normalize(expected or "")
+
+
+def load_corpus() -> list:
+    '''
+    Returns (name, markdown, expected fields) for the saved pages and the fixture site pages
+    '''
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(corpus_directory, "*.md"))):
+        with open(path) as file:
+            markdown = file.read()
+        with open(path[: -len(".md")] + ".yaml") as file:
+            expected = yaml.safe_load(file)
+        corpus.append((os.path.basename(path), markdown, expected))
+
+    from html_markdown import html_to_markdown
+
+    products = load_products()
+    for product in products:
+        expected = {
+            "Product Name": product["name"],
+            "Product Description": product["description"],
+            "PartSelect Number": product["partselect_number"],
+            "Manufacturer Part Number": product["manufacturer_part_number"],
+            "Manufactured by": product["manufacturer"],
+            "Manufactured for": product["manufactured_for"],
+            "This part fixes the following symptoms": product["symptoms"],
+            "Part replaces these": product["replaces"],
+        }
+        corpus.append((product["partselect_number"], html_to_markdown(render_product(product, products)), expected))
+    return corpus
+
+
+def report_agreement(name: str, results: list, corpus: list):
+    agreed = {field: 0 for field in compared_fields}
+    totals = {field: 0 for field in compared_fields}
+    for result, (page, _, expected) in zip(results, corpus):
+        for field in compared_fields:
+            if field not in expected or result is None:
+                continue
+            totals[field] += 1
+            if fields_agree(result.get(field), expected[field]):
+                agreed[field] += 1
+            else:
+                print(f"  {page} {field}: got {result.get(field)!r}, expected {expected[field]!r}")
+
+    print(f"{name} field agreement:")
+    for field in compared_fields:
+        if totals[field]:
+            print(f"  {field}: {agreed[field]}/{totals[field]}")
+    overall = sum(agreed.values()) / max(sum(totals.values()), 1)
+    print(f"  overall: {overall:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product parser benchmark")
+    parser.add_argument("--repeat", type=int, default=200, help="Times the corpus is parsed to measure throughput")
+    parser.add_argument("--llm", action="store_true", help="Also run the LLM extraction, needs OPENAI_API_KEY")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    results = [parse_product_markdown(markdown) for _, markdown, _ in corpus]
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for _, markdown, _ in corpus:
+            parse_product_markdown(markdown)
+    elapsed = time.perf_counter() - start
+    parsed = args.repeat * len(corpus)
+    print(f"parser: {parsed} pages in {elapsed:.2f}s, {parsed / elapsed:.0f} products/s")
+    print(f"  confidence: min {min(r['confidence'] for r in results)}, "
+          f"mean {sum(r['confidence'] for r in results) / len(results):.2f}")
+    report_agreement("parser", results, corpus)
+
+    if args.llm:
+        from openai import OpenAI
+        from vector_db import extract_product_info_with_llm
+
+        llm_client = OpenAI()
+        start = time.perf_counter()
+        llm_results = [extract_product_info_with_llm(markdown, page, llm_client) for page, markdown, _ in corpus]
+        elapsed = time.perf_counter() - start
+        print(f"llm: {len(corpus)} pages in {elapsed:.2f}s, {len(corpus) / elapsed:.2f} products/s")
+        report_agreement("llm", llm_results, corpus)
+
+        # How often the parser and the LLM return the same value for a field
+        as_expected = [(page, markdown, llm or {}) for (page, markdown, _), llm in zip(corpus, llm_results)]
+        report_agreement("parser vs llm", results, as_expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+'''
+Offline evaluation of the retrieval modes of vector_db.query_chroma: vector only, keyword (BM25) only,
+and both fused with reciprocal-rank fusion or a weighted sum of scores.
+
+The collection is a new in-memory Chroma collection filled with the fixture catalog, plus variants of every product
+with their own PartSelect, manufacturer and replaced part numbers, so exact part numbers have to be told apart
+from near-identical documents. Queries ask for a part number, a PartSelect number, or describe a part,
+and recall@k is the share of queries with a relevant product in the top k results.
+
+Run from the backend directory:
+    python -m benchmarks.bench_retrieval --documents 240 --k 1 3 5
+'''
+
+import argparse
+import random
+import string
+import time
+import uuid
+import chromadb
+import vector_db
+from benchmarks.fixture_server import load_products
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+
+modes = {
+    "vector": ("vector", None),
+    "lexical": ("lexical", None),
+    "hybrid rrf": ("hybrid", "rrf"),
+    "hybrid weighted": ("hybrid", "weighted"),
+}
+
+
+def random_part_number(like: str) -> str:
+    '''
+    A part number with the same shape, letters stay letters and digits stay digits
+    '''
+    return "".join(
+        random.choice(string.ascii_uppercase) if c.isalpha() else random.choice(string.digits) if c.isdigit() else c
+        for c in like
+    )
+
+
+def generate_catalog(count: int) -> list:
+    '''
+    Returns (product info, base product) for count products, the first ones are the fixture catalog itself
+    '''
+    products = load_products()
+    catalog = []
+    for i in range(count):
+        product = products[i % len(products)]
+        original = i < len(products)
+        partselect_number = product["partselect_number"] if original else f"PS{90000000 + i}"
+        catalog.append(
+            (
+                {
+                    "Product Name": product["name"],
+                    "Product Description": product["description"],
+                    "PartSelect Number": partselect_number,
+                    "Manufacturer Part Number": product["manufacturer_part_number"]
+                    if original else random_part_number(product["manufacturer_part_number"]),
+                    "Manufactured by": product["manufacturer"],
+                    "Manufactured for": product["manufactured_for"],
+                    "This part fixes the following symptoms": product["symptoms"],
+                    "This part works with the following products": [product["appliance"]],
+                    "Part replaces these": product["replaces"]
+                    if original else [random_part_number(part) for part in product["replaces"]],
+                    "URL": f"https://www.partselect.com/{partselect_number}.htm",
+                },
+                product,
+            )
+        )
+    return catalog
+
+
+def generate_queries(catalog: list, count: int) -> list:
+    '''
+    Returns (kind, query, relevant PartSelect numbers)
+    '''
+    queries = []
+    for product_info, product in random.sample(catalog, min(count, len(catalog))):
+        partselect_number = product_info["PartSelect Number"]
+        queries.append(("part number", f"I need part {product_info['Manufacturer Part Number']}", {partselect_number}))
+        queries.append(
+            ("replaced part", f"What replaces {random.choice(product_info['Part replaces these'])}?", {partselect_number})
+        )
+        queries.append(("partselect number", f"How much is {partselect_number}?", {partselect_number}))
+
+        same_product = {info["PartSelect Number"] for info, base in catalog if base is product}
+        symptom = random.choice(product["symptoms"]).lower()
+        queries.append(
+            ("description", f"My {product['manufacturer']} {product['appliance'].lower()} is {symptom}, "
+             f"do I need a new {product['name'].lower()}?", same_product)
+        )
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval evaluation")
+    parser.add_argument("--documents", type=int, default=240)
+    parser.add_argument("--queries", type=int, default=50, help="Products to ask about, four queries each")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--lexical-weight", type=float, default=None, help="Overrides RETRIEVAL_LEXICAL_WEIGHT")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    if args.lexical_weight is not None:
+        vector_db.lexical_weight = args.lexical_weight
+
+    vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+    vector_db.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    catalog = generate_catalog(args.documents)
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in catalog])
+    queries = generate_queries(catalog, args.queries)
+    print(f"{vector_db.collection.count()} documents, {len(queries)} queries")
+
+    top_n = max(args.k)
+    for name, (mode, strategy) in modes.items():
+        if strategy:
+            vector_db.fusion_strategy = strategy
+        hits = {k: {} for k in args.k}
+        latencies = []
+        for kind, query, relevant in queries:
+            start = time.perf_counter()
+            results = vector_db.query_chroma(query, top_n, mode=mode)
+            latencies.append(time.perf_counter() - start)
+            ids = results["ids"][0] if results["ids"] else []
+            for k in args.k:
+                hits[k].setdefault(kind, []).append(bool(relevant & set(ids[:k])))
+
+        print(f"{name}:")
+        for k in args.k:
+            overall = [hit for kind_hits in hits[k].values() for hit in kind_hits]
+            per_kind = ", ".join(f"{kind} {sum(kind_hits) / len(kind_hits):.0%}" for kind, kind_hits in hits[k].items())
+            print(f"  recall@{k}: {sum(overall) / len(overall):.1%} ({per_kind})")
+        print_summary("  latency", summarize(latencies))
+
+
+if __name__ == "__main__":
+    main()
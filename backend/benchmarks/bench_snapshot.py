@@ -0,0 +1,102 @@
+'''
+Measures the snapshots of snapshot.py against building the database from the extracted products.
+
+The collection is the catalog of bench_retrieval.py. Reports the time to add the products by encoding them, to export
+the collection to a snapshot and to import the snapshot into an empty collection, the size of the snapshot, then the
+latency of vector_db.query_chroma on Chroma and on the memory-mapped SnapshotIndex, and how many of the top k
+results of both agree, the float16 embeddings change the distances slightly.
+
+Run from the backend directory:
+    python -m benchmarks.bench_snapshot --documents 480 --queries 100 --k 4
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+import chromadb
+import vector_db
+from benchmarks.bench_filters import generate_questions
+from benchmarks.bench_retrieval import generate_catalog
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+from snapshot import SnapshotIndex, export_snapshot, import_snapshot
+
+
+def use_collection(collection):
+    vector_db.collection = collection
+    vector_db.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+
+
+def new_collection():
+    return chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector database snapshot benchmark")
+    parser.add_argument("--documents", type=int, default=480)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    catalog = generate_catalog(args.documents)
+    questions = [question for question, _, _ in generate_questions(catalog, args.queries)]
+    # Load the embedding model before timing
+    vector_db.get_embedding_model()
+
+    use_collection(new_collection())
+    start = time.perf_counter()
+    vector_db.add_products_to_vector_db([product_info for product_info, _ in catalog])
+    print(f"Encoding {vector_db.collection.count()} products: {time.perf_counter() - start:.2f}s")
+    chroma = vector_db.collection
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot.bin")
+        start = time.perf_counter()
+        count = export_snapshot(path)
+        elapsed = time.perf_counter() - start
+        print(f"Export of {count} products: {elapsed:.2f}s, {os.path.getsize(path) / 1024:.0f} KB")
+
+        use_collection(new_collection())
+        start = time.perf_counter()
+        import_snapshot(path)
+        print(f"Import into an empty collection: {time.perf_counter() - start:.2f}s")
+
+        index = SnapshotIndex(path)
+        print(
+            f"Snapshot index: {index.vectors.nbytes / 1024:.0f} KB of float16 embeddings memory-mapped, "
+            f"{index.vectors.size * 4 / 1024:.0f} KB as float32"
+        )
+
+        rankings = {}
+        for name, collection in (("chroma", chroma), ("snapshot index", index)):
+            use_collection(collection)
+            vector_db.compatibility_index.add_products([product_info for product_info, _ in catalog])
+            latencies, rankings[name] = [], []
+            for question in questions:
+                start = time.perf_counter()
+                results = vector_db.query_chroma(question, args.k, mode="vector")
+                latencies.append(time.perf_counter() - start)
+                rankings[name].append(results["ids"][0] if results["ids"] else [])
+            print_summary(name, summarize(latencies))
+
+        overlap = [
+            len(set(expected) & set(found)) / max(len(expected), 1)
+            for expected, found in zip(rankings["chroma"], rankings["snapshot index"])
+        ]
+        identical = sum(1 for expected, found in zip(rankings["chroma"], rankings["snapshot index"]) if expected == found)
+        print(
+            f"Top {args.k} agreement: {sum(overlap) / len(overlap):.1%} of the results, "
+            f"{identical}/{len(questions)} rankings identical"
+        )
+        del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+'''
+Measures the startup cost of the backend modules and the time to encode a query.
+
+Every startup measurement runs in a fresh Python process:
+- importing vector_db and customer_agent, which no longer load the model or open the database,
+- importing vector_db and then opening the collection and loading the model, what every import used to cost,
+- the first query, which pays for the lazy initialization.
+Then queries are encoded once uncached and again from the query embedding cache.
+With --encoder-address the same queries are encoded by a running encoder_server.py process.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup --queries 200
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks.stats import print_summary, summarize
+
+backend_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+startup_script = '''
+import json, os, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter() - start
+{after_import}
+print(json.dumps({{"import": imported, "total": time.perf_counter() - start}}))
+'''
+
+startup_cases = {
+    "import vector_db": ("vector_db", ""),
+    "import customer_agent": ("customer_agent", ""),
+    "import vector_db, open the collection and load the model": (
+        "vector_db", "vector_db.get_collection(); vector_db.get_embedding_model()"
+    ),
+    "import vector_db and run the first query": ("vector_db", "vector_db.query_chroma('ice maker not working', 3)"),
+}
+
+
+def run_startup_case(module: str, after_import: str) -> dict:
+    environment = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark")}
+    output = subprocess.run(
+        [sys.executable, "-c", startup_script.format(module=module, after_import=after_import)],
+        cwd=backend_directory, env=environment, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def encode_latencies(queries: list) -> list:
+    import vector_db
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        vector_db.embed_query(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup and query encoding benchmark")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--encoder-address", type=str, default=None, help="host:port of a running encoder_server.py")
+    args = parser.parse_args()
+
+    for name, (module, after_import) in startup_cases.items():
+        result = run_startup_case(module, after_import)
+        print(f"{name}: import {result['import']:.2f}s, total {result['total']:.2f}s")
+
+    import vector_db
+
+    queries = [f"my model WDT780SAEM{i} dishwasher is not draining, question {i}" for i in range(args.queries)]
+    vector_db.get_embedding_model().encode("warm up")
+    print_summary("encode, not cached", summarize(encode_latencies(queries)))
+    print_summary("encode, cached", summarize(encode_latencies(queries)))
+    print(f"query embedding cache: {vector_db.query_embedding_stats}")
+
+    if args.encoder_address:
+        from encoder_server import RemoteEncoder
+
+        vector_db.embedding_model = RemoteEncoder(args.encoder_address)
+        vector_db._query_embeddings.clear()
+        print_summary("encode with the encoder process, not cached", summarize(encode_latencies(queries)))
+
+
+if __name__ == "__main__":
+    main()
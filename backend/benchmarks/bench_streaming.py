@@ -0,0 +1,53 @@
+'''
+Compares time-to-first-token and total latency of /api/message and /api/message/stream with a fake streaming LLM client.
+
+Run from the backend directory:
+    python -m benchmarks.bench_streaming --requests 10 --latency 0.5 --token-delay 0.02
+'''
+
+import argparse
+import os
+import time
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.stats import print_summary, summarize
+
+# The OpenAI client created by app.py is replaced by the fake below, it just needs a key to be constructed
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("FLASK_SECRET_KEY", "benchmark")
+import app as app_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming response benchmark")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the fake LLM starts answering")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed words")
+    args = parser.parse_args()
+
+    reply = " ".join(["The door shelf bin fits your refrigerator."] * 10)
+    app_module.llm_client = FakeLLMClient(reply=reply, latency=args.latency, token_delay=args.token_delay)
+    client = app_module.app.test_client()
+    body = {"message": "Does PS11752778 fit my fridge?", "enable_browsing": False}
+
+    blocking = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        client.post("/api/message", json=body)
+        blocking.append(time.perf_counter() - start)
+
+    first_token, streamed = [], []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        response = client.post("/api/message/stream", json=body, buffered=False)
+        for chunk in response.iter_encoded():
+            if len(first_token) < len(streamed) + 1 and chunk.startswith(b"event: token"):
+                first_token.append(time.perf_counter() - start)
+        streamed.append(time.perf_counter() - start)
+
+    print_summary("blocking, full response", summarize(blocking))
+    print_summary("streaming, first token", summarize(first_token))
+    print_summary("streaming, full response", summarize(streamed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+'''
+Measures the direct product-url fast path against the browser search flow on the local fixture site.
+The first round searches every part through the browser, which teaches the resolver their urls,
+the second round searches the same parts again and should be served by direct fetches.
+
+Run from the backend directory:
+    python -m benchmarks.bench_url_resolver --rounds 2
+'''
+
+import argparse
+import os
+import tempfile
+import search_part_tool
+import url_resolver
+from benchmarks.fixture_server import FixtureSite
+
+
+def main():
+    parser = argparse.ArgumentParser(description="URL resolver fast path benchmark")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--delay", type=float, default=0.0, help="Simulated network delay per request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, FixtureSite(delay=args.delay) as site:
+        url_resolver.url_map_path = os.path.join(directory, "url_map.json")
+        search_part_tool.partselect_url = site.url
+        search_part_tool.browser_pool.headless = True
+
+        for _ in range(args.rounds):
+            # Measure the fetch paths, not the page cache
+            search_part_tool.page_cache.clear()
+            for product in site.products:
+                search_part_tool.search_partselect(product["manufacturer_part_number"])
+
+        for key, value in search_part_tool.get_search_stats().items():
+            print(f"{key}: {round(value, 3) if isinstance(value, float) else value}")
+        search_part_tool.browser_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
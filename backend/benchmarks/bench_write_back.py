@@ -0,0 +1,107 @@
+'''
+Measures the write-back of browsed product pages into the database by write_back.py.
+
+Questions ask about the parts of the fixture site, the popular parts more often than the others, and the database
+starts empty. The fake LLM browses when the part isn't in the context it was given, and the fake browser fetches the
+product page from the fixture site after --browse-latency seconds. Without write-back every question about a part
+browses again, with it only the first questions about each part do.
+Reports the browses, the latency and the products in the database at the end of each run.
+
+Run from the backend directory:
+    python -m benchmarks.bench_write_back --questions 100 --browse-latency 1.0
+'''
+
+import argparse
+import random
+import time
+import urllib.request
+import uuid
+import chromadb
+import customer_agent
+import search_part_tool
+import vector_db
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.fixture_server import FixtureSite
+from benchmarks.stats import print_summary, summarize
+from compatibility_index import CompatibilityIndex
+from html_markdown import html_to_markdown
+from lexical_index import BM25Index
+from write_back import WriteBackQueue
+
+
+class BrowseWhenUnknownLLMClient(FakeLLMClient):
+    '''
+    Asks for the search only if the part number of the question isn't in the messages it was given
+    '''
+
+    def __init__(self, part_number: str, **kwargs):
+        super().__init__(tool_calls=[("search_partselect", {"part_number": part_number})], **kwargs)
+        self.part_number = part_number
+
+    def respond(self, messages: list, tools, tool_choice=None):
+        context = " ".join(str(message.get("content")) for message in messages[:-1] if isinstance(message, dict))
+        if f"PartSelect Number: {self.part_number}" in context:
+            return self.reply, []
+        return super().respond(messages, tools, tool_choice)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write-back of browsed pages benchmark")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake LLM takes to answer")
+    parser.add_argument("--browse-latency", type=float, default=1.0, help="Seconds the fake browser takes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    customer_agent.answer_cache = None
+
+    with FixtureSite() as site:
+        products = site.products
+        # The popular parts are asked about much more often, with Zipf weights
+        asked = random.choices(products, weights=[1 / rank for rank in range(1, len(products) + 1)], k=args.questions)
+        browses = []
+
+        def fake_search_partselect(part_number):
+            product = next(product for product in products if product["partselect_number"] == part_number)
+            url = site.product_url(product)
+            time.sleep(args.browse_latency)
+            with urllib.request.urlopen(url) as response:
+                markdown_content = html_to_markdown(response.read().decode("utf-8"), url)
+            browses.append(part_number)
+            search_part_tool.notify_page_listeners(markdown_content, url)
+            return markdown_content
+
+        customer_agent.search_partselect = fake_search_partselect
+
+        for write_back in (False, True):
+            vector_db.collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex}")
+            vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+            vector_db.lexical_index = BM25Index()
+            search_part_tool.page_listeners.clear()
+            queue = None
+            if write_back:
+                queue = WriteBackQueue(FakeLLMClient(), flush_interval=0.2)
+                search_part_tool.page_listeners.append(queue.submit)
+            browses.clear()
+
+            latencies = []
+            for product in asked:
+                part_number = product["partselect_number"]
+                llm_client = BrowseWhenUnknownLLMClient(part_number, latency=args.latency)
+                start = time.perf_counter()
+                customer_agent.query_customer_agent(f"How do I install {part_number}?", [], llm_client, True)
+                latencies.append(time.perf_counter() - start)
+            if queue is not None:
+                queue.close()
+
+            name = "write-back" if write_back else "no write-back"
+            print_summary(name, summarize(latencies))
+            print(
+                f"  {len(browses)} browses for {len(asked)} questions about {len(set(browses))} parts, "
+                f"{vector_db.collection.count()} products in the database"
+                + (f", write-back stats {queue.stats}" if queue is not None else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
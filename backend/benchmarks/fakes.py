@@ -0,0 +1,163 @@
+'''
+Deterministic stand-ins for the OpenAI client, so the agent can be exercised without network access or an API key.
+The fakes mimic the parts of the chat completions API the agent uses, including streamed chunks and tool calls.
+'''
+
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+
+def prompt_tokens(messages: list) -> int:
+    return sum(len(str(m)) // 4 for m in messages)
+
+
+def _tool_call(index: int, name: str, arguments: dict):
+    return SimpleNamespace(
+        id=f"call_{index}",
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+class FakeAPIError(Exception):
+    '''
+    A transient error of the API, with a status code like the errors of the OpenAI client
+    '''
+
+    def __init__(self, status_code: int = 503):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+
+class FakeCompletions:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model: str, messages: list, tools=None, tool_choice=None, stream=False, **kwargs):
+        self.client.calls.append({"model": model, "messages": messages, "tools": tools})
+        time.sleep(self.client.completion_latency(messages))
+        self.client.maybe_fail()
+
+        content, tool_calls = self.client.respond(messages, tools, tool_choice)
+        if stream:
+            return self._stream(content, tool_calls, self.client.token_delay)
+        return self._completion(messages, content, tool_calls)
+
+    def _completion(self, messages, content, tool_calls):
+        message = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls or None)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message, finish_reason="tool_calls" if tool_calls else "stop")],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens(messages),
+                completion_tokens=len(content or "") // 4,
+            ),
+        )
+
+    def _stream(self, content, tool_calls, token_delay: float):
+        def chunk(**delta):
+            delta.setdefault("content", None)
+            delta.setdefault("tool_calls", None)
+            return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(**delta))])
+
+        for index, tool_call in enumerate(tool_calls or []):
+            yield chunk(
+                tool_calls=[
+                    SimpleNamespace(
+                        index=index,
+                        id=tool_call.id,
+                        function=SimpleNamespace(name=tool_call.function.name, arguments=""),
+                    )
+                ]
+            )
+            # Split the arguments the way the API does, a few characters per chunk
+            arguments = tool_call.function.arguments
+            for i in range(0, len(arguments), 8):
+                yield chunk(
+                    tool_calls=[
+                        SimpleNamespace(
+                            index=index,
+                            id=None,
+                            function=SimpleNamespace(name=None, arguments=arguments[i : i + 8]),
+                        )
+                    ]
+                )
+
+        if content:
+            for i, word in enumerate(content.split(" ")):
+                time.sleep(token_delay)
+                yield chunk(content=word if i == 0 else " " + word)
+
+
+class AsyncFakeCompletions(FakeCompletions):
+    async def create(self, model: str, messages: list, tools=None, tool_choice=None, stream=False, **kwargs):
+        self.client.calls.append({"model": model, "messages": messages, "tools": tools})
+        await asyncio.sleep(self.client.completion_latency(messages))
+        self.client.maybe_fail()
+
+        content, tool_calls = self.client.respond(messages, tools, tool_choice)
+        if stream:
+            return self._async_stream(content, tool_calls)
+        return self._completion(messages, content, tool_calls)
+
+    async def _async_stream(self, content, tool_calls):
+        # Reuse the sync chunks, sleeping on the event loop between words instead of blocking it
+        for chunk in self._stream(content, tool_calls, 0.0):
+            if chunk.choices[0].delta.content:
+                await asyncio.sleep(self.client.token_delay)
+            yield chunk
+
+
+class FakeLLMClient:
+    '''
+    A fake OpenAI client.
+    If tool_calls is given, the first completion that is allowed to call tools asks for them,
+    e.g. tool_calls=[("search_partselect", {"part_number": "PS11752778"})].
+    Completions that follow a tool result, or that aren't offered tools, answer with reply,
+    which can also be a function of the messages.
+    latency is added to every completion, prompt_token_latency to every prompt token (to model the prompt
+    processing time) and token_delay to every streamed word.
+    failure_rate is the share of the completions that fail with a FakeAPIError after their latency.
+    '''
+
+    def __init__(self, reply: str = "This part is compatible with your model.", tool_calls: list = None,
+                 latency: float = 0.0, token_delay: float = 0.0, prompt_token_latency: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.reply = reply
+        self.tool_calls = tool_calls or []
+        self.latency = latency
+        self.token_delay = token_delay
+        self.prompt_token_latency = prompt_token_latency
+        self.failure_rate = failure_rate
+        self.failures = 0
+        self.calls = []
+        self.chat = SimpleNamespace(completions=FakeCompletions(self))
+
+    def completion_latency(self, messages: list) -> float:
+        return self.latency + self.prompt_token_latency * prompt_tokens(messages)
+
+    def maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeAPIError()
+
+    def respond(self, messages: list, tools, tool_choice=None):
+        last_role = messages[-1]["role"] if isinstance(messages[-1], dict) else messages[-1].role
+        if tools and tool_choice != "none" and self.tool_calls and last_role != "tool":
+            return None, [
+                _tool_call(index, name, arguments)
+                for index, (name, arguments) in enumerate(self.tool_calls)
+            ]
+        return self.reply(messages) if callable(self.reply) else self.reply, []
+
+
+class AsyncFakeLLMClient(FakeLLMClient):
+    '''
+    The same fake with the interface of the AsyncOpenAI client
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=AsyncFakeCompletions(self))
@@ -0,0 +1,339 @@
+'''
+This file serves a small local stand-in for partselect.com, so benchmarks don't depend on the live website.
+Pages are rendered from the synthetic catalog in fixtures/products.json and follow the structure of the real site:
+a home page with pop-ups and a search box, category pages listing products, product pages and model pages.
+'''
+
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+fixtures_directory = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_products() -> list:
+    with open(os.path.join(fixtures_directory, "products.json")) as f:
+        return json.load(f)
+
+
+def product_path(product: dict) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", product["name"]).strip("-")
+    return f"/{product['partselect_number']}-{product['manufacturer']}-{product['manufacturer_part_number']}-{slug}.htm"
+
+
+def model_path(model: str) -> str:
+    return f"/Models/{quote(model, safe='')}/"
+
+
+page_template = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title} | PartSelect.com</title>
+<script>window.dataLayer = window.dataLayer || []; function gtag(){{dataLayer.push(arguments);}}</script>
+<style>.header {{ background: #337778; }} .btn--teal {{ color: white; }}</style>
+</head>
+<body>
+<header class="header">
+<div class="header__logo"><a href="/">PartSelect</a></div>
+<nav class="header__nav">
+<ul>
+<li><a href="/Refrigerator-Parts.htm">Refrigerator Parts</a></li>
+<li><a href="/Dishwasher-Parts.htm">Dishwasher Parts</a></li>
+<li><a href="/Washer-Parts.htm">Washer Parts</a></li>
+</ul>
+</nav>
+<form class="search" action="/api/search/" method="get">
+<input id="searchboxInput" name="searchterm" type="text" placeholder="Search model or part number">
+<button class="btn--teal" type="submit">Search</button>
+</form>
+</header>
+{popup}
+<main id="main" class="{main_class}" data-page-type="{page_type}">
+{body}
+</main>
+<footer class="footer">
+<ul>
+<li><a href="/Contact/">Contact Us</a></li>
+<li><a href="/Returns/">Return Policy</a></li>
+<li><a href="/Privacy/">Privacy Policy</a></li>
+</ul>
+<p>&copy; 1999-2025 PartSelect.com All Rights Reserved</p>
+</footer>
+<script>document.querySelectorAll('[data-dismiss]').forEach(function(b){{b.onclick=function(){{b.closest('[role=dialog]').remove();}};}});</script>
+</body>
+</html>
+"""
+
+popup_html = """<div role="dialog" class="modal" style="display:block">
+<p>Sign up for 10% off your first order!</p>
+<button aria-label="Decline; close the dialog" data-dismiss="modal">No thanks</button>
+</div>"""
+
+
+def render_page(title: str, body: str, page_type: str, popup: bool = False) -> str:
+    return page_template.format(
+        title=html.escape(title),
+        body=body,
+        page_type=page_type,
+        main_class="pd__wrap" if page_type == "product" else "container",
+        popup=popup_html if popup else "",
+    )
+
+
+def render_product_list(products: list) -> str:
+    items = []
+    for product in products:
+        items.append(
+            f"""<div class="nf__part">
+<a class="nf__part__detail__title" href="{product_path(product)}">{html.escape(product['manufacturer'])} {html.escape(product['name'])}</a>
+<div class="nf__part__detail__part-number">PartSelect Number <strong>{product['partselect_number']}</strong></div>
+<div class="nf__part__detail__part-number">Manufacturer Part Number <strong>{product['manufacturer_part_number']}</strong></div>
+<div class="price">{product['price']}</div>
+</div>"""
+        )
+    return "\n".join(items)
+
+
+def render_home(products: list) -> str:
+    body = """<h1>Appliance Parts &amp; Repair Help</h1>
+<p>Find the right part for your refrigerator or dishwasher.</p>
+<h2>Shop by Appliance</h2>
+<ul>
+<li><a href="/Refrigerator-Parts.htm">Refrigerator Parts</a></li>
+<li><a href="/Dishwasher-Parts.htm">Dishwasher Parts</a></li>
+</ul>"""
+    return render_page("Appliance Parts", body, "home", popup=True)
+
+
+def render_category(products: list, appliance: str) -> str:
+    in_category = [p for p in products if p["appliance"] == appliance]
+    brands = sorted({p["manufacturer"] for p in in_category})
+    brand_links = "\n".join(
+        f'<li><a href="/{brand}-{appliance}-Parts.htm">{brand} {appliance} Parts</a></li>'
+        for brand in brands
+    )
+    body = f"""<h1>{appliance} Parts</h1>
+<h2>Popular {appliance} Brands</h2>
+<ul>
+{brand_links}
+</ul>
+<h2>Popular {appliance} Parts</h2>
+{render_product_list(in_category)}"""
+    return render_page(f"{appliance} Parts", body, "category")
+
+
+def render_brand_category(products: list, brand: str, appliance: str) -> str:
+    in_category = [
+        p for p in products if p["appliance"] == appliance and p["manufacturer"] == brand
+    ]
+    body = f"""<h1>{brand} {appliance} Parts</h1>
+{render_product_list(in_category)}"""
+    return render_page(f"{brand} {appliance} Parts", body, "category")
+
+
+def render_product(product: dict, products: list) -> str:
+    models = "\n".join(
+        f"""<div class="row">
+<a class="col-6 col-md-3 col-lg-2" href="{model_path(model)}">{html.escape(model)}</a>
+<div class="col-6 col-md-3 col-lg-2">{html.escape(product['manufacturer'])}</div>
+<div class="col col-md-6 col-lg-4">{product['appliance']}</div>
+</div>"""
+        for model in product["models"]
+    )
+    related = render_product_list(
+        [
+            p
+            for p in products
+            if p["appliance"] == product["appliance"]
+            and p["partselect_number"] != product["partselect_number"]
+        ][:3]
+    )
+    body = f"""<div class="breadcrumbs"><a href="/">Home</a> &gt; <a href="/{product['appliance']}-Parts.htm">{product['appliance']} Parts</a></div>
+<h1 class="title-lg" itemprop="name">{html.escape(product['manufacturer'])} {product['manufacturer_part_number']} {html.escape(product['name'])}</h1>
+<div class="pd__part-number">PartSelect Number <span itemprop="productID">{product['partselect_number']}</span></div>
+<div class="pd__part-number">Manufacturer Part Number <span itemprop="mpn">{product['manufacturer_part_number']}</span></div>
+<div class="pd__manufacturer">Manufactured by <span itemprop="brand">{html.escape(product['manufacturer'])}</span> for {html.escape(', '.join(product['manufactured_for']))}</div>
+<div class="price pd__price"><span itemprop="price">{product['price']}</span> In Stock</div>
+<h2 id="ProductDescription">Product Description</h2>
+<div class="pd__description" itemprop="description">{html.escape(product['description'])}</div>
+<h2 id="Troubleshooting">Troubleshooting</h2>
+<div class="pd__troubleshooting">
+<div class="bold">This part fixes the following symptoms:</div>
+<div>{html.escape(' | '.join(product['symptoms']))}</div>
+<div class="bold">This part works with the following products:</div>
+<div>{product['appliance']}.</div>
+<div class="bold">Part replaces these:</div>
+<div data-collapse-container="">{html.escape(', '.join(product['replaces']))}</div>
+</div>
+<h2 id="ModelCrossReference">Model Cross Reference</h2>
+<div class="pd__crossref__list">
+{models}
+</div>
+<h2 id="RelatedParts">Related Parts</h2>
+<div class="pd__related-parts">
+{related}
+</div>"""
+    title = f"Official {product['manufacturer']} {product['manufacturer_part_number']} {product['name']}"
+    return render_page(title, body, "product")
+
+
+def render_model(model: str, products: list) -> str:
+    compatible = [p for p in products if model in p["models"]]
+    if not compatible:
+        return None
+    body = f"""<h1 class="title-main">{html.escape(model)} {compatible[0]['manufacturer']} {compatible[0]['appliance']} - Overview</h1>
+<h2>Parts for {html.escape(model)}</h2>
+{render_product_list(compatible)}"""
+    return render_page(f"{model} {compatible[0]['appliance']} Parts", body, "model")
+
+
+def render_not_found() -> str:
+    return render_page(
+        "Page Not Found",
+        "<h1>Page Not Found</h1><p>We couldn't find the page you were looking for.</p>",
+        "error",
+    )
+
+
+class FixtureSite:
+    '''
+    Run the fixture site on a background thread.
+    delay adds a fixed number of seconds to every response to approximate network latency.
+    '''
+
+    def __init__(self, products: list = None, delay: float = 0.0, port: int = 0):
+        self.products = products if products is not None else load_products()
+        self.delay = delay
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def product_url(self, product: dict) -> str:
+        return self.url.rstrip("/") + product_path(product)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, path: str, query: dict):
+        '''
+        Returns (status, body, location) for the given path
+        '''
+        products = self.products
+        if path in ("/", "/index.html"):
+            return 200, render_home(products), None
+
+        if path == "/api/search/":
+            term = query.get("searchterm", [""])[0].strip().upper()
+            for product in products:
+                if term in (
+                    product["partselect_number"],
+                    product["manufacturer_part_number"].upper(),
+                ):
+                    return 302, "", product_path(product)
+            if any(term in (m.upper() for m in p["models"]) for p in products):
+                return 302, "", model_path(term)
+            return 404, render_not_found(), None
+
+        match = re.fullmatch(r"/(Refrigerator|Dishwasher)-Parts\.htm", path)
+        if match:
+            return 200, render_category(products, match.group(1)), None
+
+        match = re.fullmatch(r"/([A-Za-z\-]+?)-(Refrigerator|Dishwasher)-Parts\.htm", path)
+        if match:
+            return 200, render_brand_category(products, match.group(1), match.group(2)), None
+
+        match = re.fullmatch(r"/(PS\d+)-.*\.htm", path)
+        if match:
+            for product in products:
+                if product["partselect_number"] == match.group(1):
+                    return 200, render_product(product, products), None
+
+        match = re.fullmatch(r"/Models/([^/]+)/", path)
+        if match:
+            page = render_model(match.group(1), products)
+            if page:
+                return 200, page, None
+
+        return 404, render_not_found(), None
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._respond(include_body=True)
+
+            def do_HEAD(self):
+                self._respond(include_body=False)
+
+            def _respond(self, include_body: bool):
+                site.requests += 1
+                if site.delay:
+                    time.sleep(site.delay)
+
+                parsed = urlparse(self.path)
+                status, body, location = site.route(parsed.path, parse_qs(parsed.query))
+                encoded = body.encode()
+                etag = '"' + hashlib.sha1(encoded).hexdigest() + '"'
+
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                if location:
+                    self.send_header("Location", location)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(encoded)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", formatdate(0, usegmt=True))
+                self.end_headers()
+                if include_body:
+                    self.wfile.write(encoded)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the PartSelect fixture site")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    site = FixtureSite(delay=args.delay, port=args.port)
+    print(f"Serving the fixture site at {site.url}")
+    site._server.serve_forever()
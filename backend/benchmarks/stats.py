@@ -0,0 +1,37 @@
+'''
+Shared helpers for summarizing benchmark timings.
+'''
+
+import math
+
+
+def percentile(values: list, pct: float) -> float:
+    '''
+    Nearest-rank percentile of a list of numbers
+    '''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: list, wall_time: float = None) -> dict:
+    '''
+    Summarize a list of latencies in seconds as milliseconds
+    '''
+    summary = {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+    }
+    if wall_time:
+        summary["per_second"] = round(len(latencies) / wall_time, 2)
+    return summary
+
+
+def print_summary(name: str, summary: dict):
+    fields = ", ".join(f"{key}={value}" for key, value in summary.items())
+    print(f"{name}: {fields}")
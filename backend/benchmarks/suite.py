@@ -0,0 +1,254 @@
+'''
+Runs the whole stack offline and writes the results as JSON, so runs can be compared to find regressions.
+
+Nothing leaves the machine: the LLM is the fake client of fakes.py, the browser is replaced by fetches from the local
+fixture site, and the database is a Chroma directory in a temporary directory, seeded with the synthetic catalog.
+The suite measures:
+    api        throughput and latency of /api/message on the Flask server, browsing the fixture site
+    retrieval  queries per second and latency of query_chroma
+    ingestion  documents per second through the ingestion pipeline
+    crawl      pages per second crawling the fixture site
+
+With --compare, the results are compared with a previous results file and the suite exits with status 1 if a
+throughput dropped or a latency rose by more than --tolerance.
+
+Run from the backend directory:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --output new.json --compare results.json --tolerance 0.2
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from benchmarks.bench_ingestion import fake_llm_reply, generate_pages
+from benchmarks.bench_retrieval import generate_catalog, generate_queries
+from benchmarks.fakes import FakeLLMClient
+from benchmarks.fixture_server import FixtureSite, load_products
+from benchmarks.stats import print_summary, summarize
+
+# The OpenAI clients created by the apps are replaced by fakes, they just need a key to be constructed
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("FLASK_SECRET_KEY", "benchmark")
+import customer_agent
+import ingestion
+import vector_db
+from compatibility_index import CompatibilityIndex
+from html_markdown import html_to_markdown
+from ingestion import IngestionPipeline
+from lexical_index import BM25Index
+
+results_version = 1
+benchmarks = ("api", "retrieval", "ingestion", "crawl")
+
+
+def use_database(directory: str, name: str = vector_db.collection_name):
+    '''
+    Opens a Chroma collection in the given directory with empty indexes next to it
+    '''
+    vector_db.persist_directory = directory
+    vector_db.collection_name = name
+    vector_db.client = vector_db.collection = None
+    vector_db.compatibility_index = customer_agent.compatibility_index = CompatibilityIndex()
+    vector_db.lexical_index = BM25Index()
+    return vector_db.get_collection()
+
+
+def fixture_browser(site: FixtureSite):
+    '''
+    A search_partselect that searches the fixture site instead of opening a browser on partselect.com
+    '''
+
+    def search_partselect(search_term: str) -> str:
+        url = site.url + "api/search/?" + urllib.parse.urlencode({"searchterm": search_term})
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                return html_to_markdown(response.read().decode("utf-8"), response.geturl())
+        except urllib.error.HTTPError:
+            return "No results found"
+
+    return search_partselect
+
+
+def run_api(args, site: FixtureSite) -> dict:
+    from benchmarks.bench_load import PooledWSGIServer, free_port, generate_load
+    import app as flask_app
+    from conversation_store import ConversationStore
+
+    product = load_products()[0]
+    tool_calls = [("search_partselect", {"part_number": product["partselect_number"]})] if args.browse else None
+    flask_app.llm_client = FakeLLMClient(latency=args.llm_latency, tool_calls=tool_calls)
+    flask_app.conversation_store = ConversationStore(token_budget=2000)
+    customer_agent.search_partselect = fixture_browser(site)
+    customer_agent.answer_cache = None
+
+    port = free_port()
+    server = PooledWSGIServer("127.0.0.1", port, flask_app.app, args.sync_workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        return asyncio.run(generate_load(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+    finally:
+        server.shutdown()
+
+
+def run_retrieval(args, catalog: list) -> dict:
+    queries = [query for _, query, _ in generate_queries(catalog, args.queries)]
+    # Warm up the embedding model and the collection before measuring
+    vector_db.query_chroma(queries[0])
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        vector_db.query_chroma(query)
+        latencies.append(time.perf_counter() - query_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_ingestion(args, directory: str) -> dict:
+    use_database(directory, "bench_ingestion")
+    pages = generate_pages(args.documents)
+    llm_client = FakeLLMClient(reply=fake_llm_reply, latency=args.llm_latency)
+    pipeline = IngestionPipeline(llm_client, args.batch_size)
+    start = time.perf_counter()
+    written = [pipeline.submit(markdown, url) for markdown, url in pages]
+    pipeline.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": len(pages),
+        "failed": sum(1 for future in written if future.exception()),
+        "seconds": round(elapsed, 3),
+        "per_second": round(len(pages) / elapsed, 2),
+    }
+
+
+def run_crawl(args, site: FixtureSite, directory: str) -> dict:
+    import crawl
+
+    # Only the crawl is measured, products are recorded instead of being extracted and written
+    added = []
+    functions = (crawl.is_in_vector_db, ingestion.extract_product_info, ingestion.add_products_to_vector_db)
+    crawl.is_in_vector_db = lambda url: False
+    ingestion.extract_product_info = lambda markdown, url, llm_client: {"PartSelect Number": url, "URL": url}
+    ingestion.add_products_to_vector_db = lambda product_infos, batch_size: added.extend(product_infos)
+    try:
+        stats = asyncio.run(
+            crawl.find_and_add_products_async(
+                args.crawl_limit, site.url, args.crawl_concurrency, 0, os.path.join(directory, "frontier.db")
+            )
+        )
+    finally:
+        crawl.is_in_vector_db, ingestion.extract_product_info, ingestion.add_products_to_vector_db = functions
+    return {
+        "pages": stats.pages,
+        "products": len(added),
+        "failures": stats.failures,
+        "per_second": round(stats.pages_per_second(), 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    '''
+    Returns the regressions of results against baseline: throughputs that dropped and latencies that rose
+    by more than the tolerance, as (benchmark, metric, baseline value, new value)
+    '''
+    regressions = []
+    for name, metrics in results["results"].items():
+        for metric, value in metrics.items():
+            previous = baseline.get("results", {}).get(name, {}).get(metric)
+            if not previous or not isinstance(value, (int, float)):
+                continue
+            if metric.endswith("per_second") and value < previous * (1 - tolerance):
+                regressions.append((name, metric, previous, value))
+            elif metric.endswith("_ms") and value > previous * (1 + tolerance):
+                regressions.append((name, metric, previous, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark suite")
+    parser.add_argument("--benchmarks", nargs="+", choices=benchmarks, default=list(benchmarks))
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, default=None, help="Results file of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before a regression")
+    parser.add_argument("--products", type=int, default=240, help="Products seeded into the database")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--sync-workers", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake completion")
+    parser.add_argument("--no-browse", dest="browse", action="store_false", help="Don't request the browsing tool")
+    parser.add_argument("--delay", type=float, default=0.0, help="Simulated network delay of the fixture site")
+    parser.add_argument("--queries", type=int, default=50, help="Products to query, four queries each")
+    parser.add_argument("--documents", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--crawl-limit", type=int, default=100)
+    parser.add_argument("--crawl-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    results = {
+        "version": results_version,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory, FixtureSite(delay=args.delay) as site:
+        use_database(os.path.join(directory, "chroma"))
+        catalog = generate_catalog(args.products)
+        vector_db.add_products_to_vector_db([product_info for product_info, _ in catalog])
+        print(f"Seeded {vector_db.collection.count()} products in {directory}")
+
+        # In this order, the ingestion benchmark writes to another collection
+        for name in (name for name in benchmarks if name in args.benchmarks):
+            if name == "api":
+                result = run_api(args, site)
+            elif name == "retrieval":
+                result = run_retrieval(args, catalog)
+            elif name == "ingestion":
+                result = run_ingestion(args, os.path.join(directory, "chroma"))
+            else:
+                result = run_crawl(args, site, directory)
+            results["results"][name] = result
+            print_summary(name, result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("version") != results_version:
+            print(f"{args.compare} has results of version {baseline.get('version')}, expected {results_version}")
+            sys.exit(1)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, previous, value in regressions:
+            print(f"Regression in {name} {metric}: {previous} -> {value}")
+        print(f"{len(regressions)} regressions against {args.compare} (commit {baseline.get('commit')})")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+'''
+This file admits the searches of the browsing tool, so a burst of browse-heavy chats can't pile up unbounded work
+in front of the browser pool.
+
+At most max_active searches run at a time and at most max_queued wait for a free slot, first come first served.
+A search that finds the queue full is rejected right away, and one that waits longer than its wait timeout gives up,
+so the agent answers without browsing instead of making the customer wait for a browser.
+Slots are handed over through futures, so the waiters of every thread and event loop share the same queue.
+'''
+
+import asyncio
+import collections
+import threading
+from concurrent.futures import Future
+
+
+class AdmissionRejected(Exception):
+    '''
+    Raised when a search isn't admitted, reason is "queue_full" or "timeout"
+    '''
+
+    def __init__(self, reason: str):
+        super().__init__(f"Browsing is saturated ({reason})")
+        self.reason = reason
+
+
+class BrowseAdmission:
+    '''
+    A semaphore of max_active slots with a bounded FIFO queue of max_queued waiters.
+    Every acquire that succeeds must be followed by one release.
+    '''
+
+    def __init__(self, max_active: int = 4, max_queued: int = 16, wait_timeout: float = 10.0):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.wait_timeout = wait_timeout
+        self._active = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def _enter(self, queue: bool = True) -> Future:
+        '''
+        Returns a future that is done once a slot is granted, already done if one is free.
+        Raises AdmissionRejected if no slot is free and the queue is full, or queue is False.
+        '''
+        future = Future()
+        with self._lock:
+            if self._active < self.max_active and not self._waiters:
+                self._active += 1
+                self.stats["admitted"] += 1
+                future.set_result(True)
+                return future
+            if not queue or len(self._waiters) >= self.max_queued:
+                self.stats["rejected"] += 1
+                raise AdmissionRejected("queue_full")
+            self._waiters.append(future)
+            self.stats["queued"] += 1
+        return future
+
+    def _abandon(self, future: Future, timed_out: bool = True) -> bool:
+        '''
+        Takes a waiter out of the queue, returns False if the slot was granted in the meantime
+        '''
+        with self._lock:
+            try:
+                self._waiters.remove(future)
+            except ValueError:
+                return False
+            if timed_out:
+                self.stats["timed_out"] += 1
+        return True
+
+    def try_acquire(self) -> bool:
+        '''
+        Takes a slot if one is free now, without queueing, for work that is only worth doing on an idle pool
+        '''
+        try:
+            self._enter(queue=False)
+            return True
+        except AdmissionRejected:
+            return False
+
+    async def acquire(self, timeout: float = None):
+        '''
+        Waits for a slot at most timeout seconds, wait_timeout by default, without blocking the event loop.
+        Raises AdmissionRejected if none is granted.
+        '''
+        future = self._enter()
+        timeout = self.wait_timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(future):
+                raise AdmissionRejected("timeout")
+        except asyncio.CancelledError:
+            # The slot may have been granted to a request that went away, pass it on
+            if not self._abandon(future, timed_out=False):
+                self.release()
+            raise
+
+    def release(self):
+        '''
+        Hands the slot to the first waiter, or frees it
+        '''
+        with self._lock:
+            if self._waiters:
+                self.stats["admitted"] += 1
+                self._waiters.popleft().set_result(True)
+            else:
+                self._active -= 1
+
+    def saturated(self) -> bool:
+        '''
+        True when every slot is taken and the queue is full, a new search would be rejected
+        '''
+        with self._lock:
+            return self._active >= self.max_active and len(self._waiters) >= self.max_queued
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def active(self) -> int:
+        with self._lock:
+            return self._active
@@ -0,0 +1,168 @@
+'''
+This file keeps a pool of long-lived Playwright browsers for the browsing tool.
+Launching Chromium on every tool call costs seconds of latency and hundreds of MB of memory,
+so instead each worker thread owns one warm browser and serves searches from a shared job queue.
+
+Playwright's sync API is bound to the thread that started it, which is why every browser lives in its own worker thread
+and callers hand work over through futures instead of sharing pages directly.
+'''
+
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from playwright.sync_api import sync_playwright
+
+
+class BrowserPool:
+    '''
+    A fixed number of browsers, each leased to one search at a time.
+    The pool size caps how many searches run concurrently; extra searches wait in the queue.
+    Browsers are health-checked before every lease and recycled after max_uses searches.
+    '''
+
+    def __init__(self, size: int = 2, max_uses: int = 50, headless: bool = False, warmup=None):
+        self.size = size
+        self.max_uses = max_uses
+        self.headless = headless
+        # Optional callable that receives a page on a freshly launched browser, e.g. to accept cookies or close pop-ups
+        self.warmup = warmup
+
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self.stats = {
+            "leases": 0,
+            "launches": 0,
+            "recycles": 0,
+            "health_check_failures": 0,
+            "errors": 0,
+        }
+
+    def start(self):
+        '''
+        Launch the worker threads. Each worker launches its browser right away so the first searches find it warm.
+        '''
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.size):
+                worker = threading.Thread(
+                    target=self._worker, name=f"browser-pool-{i}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, fn) -> Future:
+        '''
+        Queue fn(page) to run on the next free browser and return a future with its result.
+        '''
+        self.start()
+        future = Future()
+        self._jobs.put((fn, future))
+        return future
+
+    def run(self, fn, timeout: float = None):
+        '''
+        Run fn(page) on a pooled browser and wait for the result.
+        '''
+        future = self.submit(fn)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Don't let an abandoned job occupy a browser if it hasn't started yet
+            future.cancel()
+            raise
+
+    def queue_depth(self) -> int:
+        return self._jobs.qsize()
+
+    def shutdown(self, timeout: float = 10):
+        '''
+        Stop all workers and close their browsers.
+        '''
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._jobs.put(None)
+        for worker in workers:
+            worker.join(timeout=timeout)
+
+    def _increment(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _worker(self):
+        with sync_playwright() as playwright:
+            browser, context, uses = None, None, 0
+            try:
+                browser, context = self._launch(playwright)
+            except Exception as e:
+                print(f"Failed to pre-launch browser: {e}")
+
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                fn, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                # Health-check the browser and recycle it once it has served enough searches
+                healthy = browser is not None and browser.is_connected()
+                if not healthy or uses >= self.max_uses:
+                    self._increment("recycles" if healthy else "health_check_failures")
+                    self._close(browser)
+                    browser, context, uses = None, None, 0
+                    try:
+                        browser, context = self._launch(playwright)
+                    except Exception as e:
+                        self._increment("errors")
+                        future.set_exception(e)
+                        continue
+
+                self._increment("leases")
+                uses += 1
+                page = None
+                try:
+                    page = context.new_page()
+                    future.set_result(fn(page))
+                except Exception as e:
+                    self._increment("errors")
+                    future.set_exception(e)
+                    # The page or browser may be left in a bad state, serve the next search from a fresh one
+                    uses = self.max_uses
+                finally:
+                    if page is not None:
+                        try:
+                            page.close()
+                        except Exception:
+                            pass
+
+            self._close(browser)
+
+    def _launch(self, playwright):
+        '''
+        Launch a browser with a single context that is shared by every search it serves,
+        so cookies set during warm-up (e.g. dismissed pop-ups) carry over.
+        '''
+        browser = playwright.chromium.launch(headless=self.headless)
+        context = browser.new_context()
+        self._increment("launches")
+        if self.warmup:
+            page = context.new_page()
+            try:
+                self.warmup(page)
+            except Exception as e:
+                print(f"Browser warm-up failed: {e}")
+            finally:
+                page.close()
+        return browser, context
+
+    @staticmethod
+    def _close(browser):
+        if browser is None:
+            return
+        try:
+            browser.close()
+        except Exception:
+            pass
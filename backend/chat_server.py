@@ -0,0 +1,95 @@
+'''
+The parts of the API shared by the Flask server (app.py) and the async server (asgi_app.py), so the two modes
+can't drift apart: the conversation store, the write-back of browsed pages and the server-sent events of the
+streamed answers.
+'''
+
+import atexit
+import functools
+import json
+import os
+from conversation_store import ConversationStore, summarize_with_llm
+from metrics import register_stats
+from search_part_tool import browser_pool, page_listeners
+from write_back import WriteBackQueue
+
+# Sent in the error event of a stream that failed, the details of the failure stay in the server logs
+stream_error_message = "The answer could not be completed, please try again."
+
+
+def start_browser_pool():
+    # Launch the pooled browsers at startup instead of on the first search
+    if os.getenv("BROWSER_POOL_PREWARM") == "1":
+        browser_pool.start()
+
+
+def create_conversation_store(summary_client) -> ConversationStore:
+    '''
+    Chat histories are kept on the server, the session cookie only holds the session id.
+    The history sent to the LLM is limited to HISTORY_TOKEN_BUDGET tokens, older turns are summarized with the sync
+    summary_client, in the threads of the store.
+    '''
+    history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+    conversation_store = ConversationStore(
+        path=os.getenv("CONVERSATION_STORE_PATH"),
+        token_budget=history_token_budget or None,
+        summarizer=(
+            functools.partial(summarize_with_llm, summary_client)
+            if os.getenv("HISTORY_SUMMARIES", "1") == "1"
+            else None
+        ),
+    )
+    register_stats(
+        "partselect_conversation_store_total", "Conversation history compactions", lambda: conversation_store.stats
+    )
+    return conversation_store
+
+
+def start_write_back(llm_client) -> WriteBackQueue:
+    '''
+    Product pages browsed during chats are added to the database in the background with the sync llm_client,
+    so the next question about the part doesn't browse again. WRITE_BACK=0 turns it off, and a read-only snapshot
+    index (SNAPSHOT_INDEX) can't be written to, None is returned then.
+    '''
+    if os.getenv("WRITE_BACK", "1") != "1" or os.getenv("SNAPSHOT_INDEX"):
+        return None
+    write_back = WriteBackQueue(
+        llm_client,
+        batch_size=int(os.getenv("WRITE_BACK_BATCH_SIZE", 8)),
+        max_extractions=int(os.getenv("WRITE_BACK_WORKERS", 2)),
+        max_pending=int(os.getenv("WRITE_BACK_QUEUE_SIZE", 256)),
+    )
+    page_listeners.append(write_back.submit)
+    atexit.register(write_back.close)
+    register_stats("partselect_write_back_total", "Browsed pages written back to the database", lambda: write_back.stats)
+    return write_back
+
+
+def chat_turn(user_message: str, content: str) -> tuple:
+    '''
+    The messages appended to the chat history for a question and its answer
+    '''
+    return {"role": "user", "content": user_message}, {"role": "assistant", "content": content.strip()}
+
+
+def sse_event(event: str, value: str) -> str:
+    '''
+    A server-sent event for an event of the agent, see customer_agent.stream_customer_agent, or an error event
+    '''
+    if event == "progress":
+        payload = {"message": value}
+    elif event == "token":
+        payload = {"content": value}
+    elif event == "done":
+        payload = {"response": value.strip()}
+    else:
+        payload = {"error": value}
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_error(error: Exception) -> str:
+    '''
+    The event ending a stream that failed once the response started, instead of cutting it off
+    '''
+    print(f"Failed to stream the answer: {error!r}")
+    return sse_event("error", stream_error_message)
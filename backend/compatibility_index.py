@@ -0,0 +1,162 @@
+'''
+This file keeps an inverted index of the compatibility data of the products in the database:
+the models each part fits, its manufacturer part number and the part numbers it replaces.
+
+Questions like "is PS11752778 compatible with WDT780SAEM1?" are answered with dictionary lookups
+instead of relying on the vector search to retrieve the right product and the LLM to read the model list.
+The index is kept in memory and persisted in SQLite, it is filled when products are added to the database.
+The SQLite file is only opened and loaded on first use, so creating the index is cheap.
+'''
+
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from product_parser import model_pattern
+
+MODEL = "model"
+MANUFACTURER_PART_NUMBER = "manufacturer_part_number"
+REPLACES = "replaces"
+
+# A part number can be listed both as the manufacturer part number and as a replaced part, the first kind wins
+kinds = (MODEL, MANUFACTURER_PART_NUMBER, REPLACES)
+
+
+def normalize_identifier(identifier: str) -> str:
+    '''
+    Model and part numbers are written with or without dashes, slashes and spaces, compare only letters and digits
+    '''
+    return re.sub(r"[^A-Z0-9]", "", str(identifier).upper())
+
+
+def product_identifiers(product_info: dict) -> list:
+    '''
+    Returns (kind, identifier) for the compatibility data of an extracted product
+    '''
+    identifiers = []
+    models = list(product_info.get("Compatible Models") or [])
+    # The LLM puts model numbers here when the page lists them, otherwise it is the appliance type
+    models += [
+        item for item in product_info.get("This part works with the following products") or []
+        if model_pattern.match(str(item).strip())
+    ]
+    identifiers += [(MODEL, model) for model in models]
+    if product_info.get("Manufacturer Part Number"):
+        identifiers.append((MANUFACTURER_PART_NUMBER, product_info["Manufacturer Part Number"]))
+    identifiers += [(REPLACES, part) for part in product_info.get("Part replaces these") or []]
+    return [(kind, str(identifier).strip()) for kind, identifier in identifiers if normalize_identifier(identifier)]
+
+
+class CompatibilityIndex:
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._parts = defaultdict(dict)  # normalized identifier -> {PartSelect number: kind}
+        self._identifiers = defaultdict(dict)  # PartSelect number -> {(kind, normalized identifier): identifier}
+
+        self._db = None
+        self._opened = False
+
+    def _open(self):
+        '''
+        Opens the file and loads the index on first use. Call with the lock held.
+        '''
+        if self._opened:
+            return
+        self._opened = True
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS compatibility (
+                    partselect_number TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    identifier TEXT NOT NULL,
+                    PRIMARY KEY (partselect_number, kind, identifier)
+                )
+                """
+            )
+            self._db.commit()
+            for partselect_number, kind, identifier in self._db.execute(
+                "SELECT partselect_number, kind, identifier FROM compatibility"
+            ):
+                self._add_in_memory(partselect_number, kind, identifier)
+
+    def _add_in_memory(self, partselect_number: str, kind: str, identifier: str):
+        normalized = normalize_identifier(identifier)
+        current = self._parts[normalized].get(partselect_number)
+        if current is None or kinds.index(kind) < kinds.index(current):
+            self._parts[normalized][partselect_number] = kind
+        self._identifiers[partselect_number][(kind, normalized)] = identifier
+
+    def _remove_in_memory(self, partselect_number: str):
+        for _, normalized in self._identifiers.pop(partselect_number, {}):
+            parts = self._parts.get(normalized)
+            if parts is not None:
+                parts.pop(partselect_number, None)
+                if not parts:
+                    del self._parts[normalized]
+
+    def add_products(self, product_infos: list):
+        '''
+        Index the compatibility data of extracted products, replacing what was indexed for them before
+        '''
+        with self._lock:
+            self._open()
+            for product_info in product_infos:
+                partselect_number = product_info["PartSelect Number"]
+                identifiers = product_identifiers(product_info)
+                self._remove_in_memory(partselect_number)
+                for kind, identifier in identifiers:
+                    self._add_in_memory(partselect_number, kind, identifier)
+
+                if self._db:
+                    self._db.execute("DELETE FROM compatibility WHERE partselect_number = ?", (partselect_number,))
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO compatibility (partselect_number, kind, identifier) VALUES (?, ?, ?)",
+                        [(partselect_number, kind, identifier) for kind, identifier in identifiers],
+                    )
+            if self._db:
+                self._db.commit()
+
+    def parts_for(self, identifier: str) -> dict:
+        '''
+        Returns {PartSelect number: kind} of the parts that fit a model, or have this manufacturer or replaced part number
+        '''
+        with self._lock:
+            self._open()
+            return dict(self._parts.get(normalize_identifier(identifier), {}))
+
+    def identifiers_for(self, partselect_number: str, kind: str = None) -> list:
+        '''
+        Returns the identifiers of a part, e.g. the models it fits with kind=MODEL
+        '''
+        with self._lock:
+            self._open()
+            identifiers = self._identifiers.get(partselect_number, {})
+            return [identifier for (k, _), identifier in identifiers.items() if kind is None or k == kind]
+
+    def is_compatible(self, partselect_number: str, model: str) -> bool:
+        with self._lock:
+            self._open()
+            return (MODEL, normalize_identifier(model)) in self._identifiers.get(partselect_number, {})
+
+    def is_indexed(self, partselect_number: str) -> bool:
+        with self._lock:
+            self._open()
+            return partselect_number in self._identifiers
+
+    def find_identifiers(self, text: str) -> list:
+        '''
+        Returns the words of the text that are indexed model or part numbers, one lookup per word
+        '''
+        found = []
+        for word in re.findall(r"[A-Za-z0-9][A-Za-z0-9\-/.]*[A-Za-z0-9]", text):
+            if any(character.isdigit() for character in word) and self.parts_for(word) and word not in found:
+                found.append(word)
+        return found
+
+    def __len__(self):
+        with self._lock:
+            self._open()
+            return len(self._identifiers)
@@ -0,0 +1,160 @@
+'''
+This file assembles the context given to the LLM within a token budget.
+
+Retrieved documents are deduplicated by product id, vector hits that are too far from the query are dropped,
+and the documents are added in priority order until the budget is spent.
+Browsed pages are reduced to the sections relevant to the question: link urls, navigation menus and footers are
+removed, and the sections that mention the words of the question are kept first.
+'''
+
+import re
+from lexical_index import tokenize
+from tokens import count_tokens
+
+stopwords = {
+    "the", "and", "for", "with", "what", "how", "can", "does", "this", "that", "my", "is", "it", "do", "you",
+    "your", "are", "part", "parts", "need", "which", "where", "when", "will", "there", "have", "has", "not",
+}
+
+link_pattern = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+
+
+def select_documents(candidates: list, token_budget: int, max_distance: float = None) -> tuple:
+    '''
+    candidates: (id, document, distance) in priority order, distance is None for exact matches.
+    Returns the (id, document) pairs that fit in the token budget, the last one possibly truncated,
+    and counters of what was dropped.
+    '''
+    selected, seen = [], set()
+    stats = {"candidates": len(candidates), "duplicates": 0, "distant": 0, "over_budget": 0, "tokens": 0}
+    for document_id, document, distance in candidates:
+        if document_id in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(document_id)
+        if max_distance is not None and distance is not None and distance > max_distance:
+            stats["distant"] += 1
+            continue
+
+        document = document.strip()
+        remaining = token_budget - stats["tokens"]
+        tokens = count_tokens(document)
+        if tokens > remaining:
+            # A truncated document is still worth it if a good part of it fits
+            if remaining < min(tokens, 100):
+                stats["over_budget"] += 1
+                continue
+            document = truncate_to_tokens(document, remaining)
+            tokens = count_tokens(document)
+        selected.append((document_id, document))
+        stats["tokens"] += tokens
+    return selected, stats
+
+
+def truncate_to_tokens(text: str, token_budget: int) -> str:
+    '''
+    Keeps the first lines of the text that fit in the token budget
+    '''
+    lines, used = [], 0
+    for line in text.splitlines():
+        tokens = count_tokens(line) + 1
+        if used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(lines)
+
+
+def relevant_sections(markdown: str, query: str, token_budget: int) -> str:
+    '''
+    Reduces the markdown of a browsed page to the sections relevant to the query, within the token budget
+    '''
+    # Urls are most of the tokens of a page and the LLM doesn't need them, only the link texts.
+    # Twice, for the images inside links.
+    markdown = _drop_navigation(markdown)
+    for _ in range(2):
+        markdown = link_pattern.sub(lambda match: match.group(1), markdown)
+    markdown = re.sub(r"\n\s*\n+", "\n\n", markdown).strip()
+    if count_tokens(markdown) <= token_budget:
+        return markdown
+
+    terms = {term for term in tokenize(query) if len(term) > 2 and term not in stopwords}
+    sections = _split_sections(markdown)
+    scores = []
+    for section in sections:
+        # The section under the title has the product name, numbers and price
+        if section.startswith("# "):
+            scores.append(float("inf"))
+        else:
+            scores.append(len(terms.intersection(tokenize(section))))
+
+    kept, remaining = {}, token_budget
+    for position in sorted(range(len(sections)), key=lambda i: (-scores[i], i)):
+        if remaining <= 0:
+            break
+        section = sections[position]
+        tokens = count_tokens(section)
+        if tokens > remaining:
+            if scores[position] == 0:
+                continue
+            section = _matching_lines(section, terms, remaining)
+            tokens = count_tokens(section)
+        kept[position] = section
+        remaining -= tokens
+    return "\n\n".join(kept[position] for position in sorted(kept))
+
+
+def _drop_navigation(markdown: str) -> str:
+    '''
+    Removes the runs of lines that are only links, like menus, footers and lists of related products
+    '''
+    lines = markdown.splitlines()
+    is_link = [bool(line.strip()) and link_pattern.sub("", line).strip(" *-|>0123456789.") == "" for line in lines]
+    kept, run = [], []
+    for line, link in zip(lines, is_link):
+        if link or (run and not line.strip()):
+            run.append((line, link))
+            continue
+        kept += _close_run(run)
+        run = []
+        kept.append(line)
+    kept += _close_run(run)
+    return "\n".join(kept)
+
+
+def _close_run(run: list) -> list:
+    if sum(link for _, link in run) >= 3:
+        return []
+    return [line for line, _ in run]
+
+
+def _split_sections(markdown: str) -> list:
+    sections, current = [], []
+    for line in markdown.splitlines():
+        if line.startswith("#") and current:
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+    return [section for section in sections if section]
+
+
+def _matching_lines(section: str, terms: set, token_budget: int) -> str:
+    '''
+    Shortens a section to its first lines and the lines that mention the query terms, then the other lines
+    '''
+    lines = section.splitlines()
+    # The heading and the header of a table come first
+    order = list(range(min(3, len(lines))))
+    order += [i for i in range(3, len(lines)) if terms.intersection(tokenize(lines[i]))]
+    chosen = set(order)
+    order += [i for i in range(3, len(lines)) if i not in chosen]
+    kept, used = set(), 0
+    for i in order:
+        tokens = count_tokens(lines[i]) + 1
+        if used + tokens > token_budget:
+            break
+        kept.add(i)
+        used += tokens
+    return "\n".join(lines[i] for i in sorted(kept))
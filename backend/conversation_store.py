@@ -0,0 +1,236 @@
+'''
+This file keeps the chat history of each session on the server, keyed by a session id stored in the Flask session cookie.
+
+The history can't live in the cookie itself once responses are streamed:
+the cookie is sent with the response headers, before the streamed answer is complete.
+
+The histories are kept in memory, or in an SQLite file when a path is given, so they survive restarts and can be
+shared by several workers: every read goes to the file, and every change reads and writes the session in one
+transaction, so workers don't overwrite the messages the others appended. At most max_sessions sessions are kept,
+the least recently used ones are dropped.
+
+To keep the prompt bounded, get_history returns at most token_budget tokens of history: once a session goes over
+the budget, its older turns are folded into a running summary by the summarizer (in a background thread, so the
+answer isn't delayed), or dropped when there is no summarizer.
+'''
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from tokens import count_message_tokens, count_tokens, tokens_per_message
+
+summary_prompt = '''
+You maintain the memory of a conversation between a customer and the PartSelect support assistant.
+Update the summary with the new messages. Keep every appliance model number, part number (PS numbers and
+manufacturer part numbers), symptom, and the answers and instructions that were given, drop the pleasantries.
+Answer with the summary only, in less than 150 words.
+'''
+
+
+def summarize_with_llm(llm_client, summary: str, messages: list) -> str:
+    '''
+    Summarizer of ConversationStore using the LLM, e.g. functools.partial(summarize_with_llm, OpenAI())
+    '''
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    response = llm_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": summary_prompt},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"},
+        ],
+    )
+    return response.choices[0].message.content.strip()
+
+
+def summary_message(summary: str) -> dict:
+    return {"role": "system", "content": f"Summary of the earlier conversation with the customer:\n{summary}"}
+
+
+class ConversationStore:
+    '''
+    token_budget: maximum prompt tokens of the history returned by get_history, None for no limit.
+    keep_recent: number of most recent messages that are never summarized.
+    summarizer: function (summary, messages) -> new summary, or None to drop the older turns instead.
+    max_sessions: number of sessions kept, the least recently used ones are dropped, or in the file the least
+    recently updated ones.
+    '''
+
+    def __init__(self, path: str = None, token_budget: int = None, keep_recent: int = 4, summarizer=None,
+                 max_sessions: int = 10000):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.max_sessions = max_sessions
+
+        self._sessions = OrderedDict()  # session id -> {"summary": str, "messages": list}
+        self._compacting = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4) if summarizer else None
+        self._pending = set()
+        self.stats = {"compactions": 0, "summarized_messages": 0, "dropped_messages": 0, "failures": 0}
+
+        self._db = None
+        if path:
+            # Transactions are started explicitly, see _transaction
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "session_id TEXT PRIMARY KEY, summary TEXT, messages TEXT, updated_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)")
+
+    @contextmanager
+    def _transaction(self):
+        '''
+        Reads and writes of the file in one write transaction, which other workers wait for. Call with the lock held.
+        '''
+        if self._db is None:
+            yield
+            return
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _session(self, session_id: str, create: bool = False):
+        '''
+        Returns the state of a session, read from the file if there is one. Call with the lock held.
+        '''
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT summary, messages FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row:
+                return {"summary": row[0] or "", "messages": json.loads(row[1])}
+            return {"summary": "", "messages": []} if create else None
+
+        state = self._sessions.get(session_id)
+        if state is None and create:
+            state = {"summary": "", "messages": []}
+        if state is not None:
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                evicted = next(iter(self._sessions))
+                if evicted in self._compacting:
+                    break
+                del self._sessions[evicted]
+        return state
+
+    def _save(self, session_id: str, state: dict):
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (session_id, summary, messages, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, state["summary"], json.dumps(state["messages"]), time.time()),
+            )
+            self._db.execute(
+                "DELETE FROM conversations WHERE session_id IN "
+                "(SELECT session_id FROM conversations ORDER BY updated_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def get_history(self, session_id: str) -> list:
+        '''
+        Returns the chat history of a session to send to the LLM: the summary of the older turns if any,
+        then the most recent messages that fit in the token budget
+        '''
+        with self._lock:
+            state = self._session(session_id)
+            if state is None:
+                return []
+            summary, messages = state["summary"], list(state["messages"])
+
+        history = [summary_message(summary)] if summary else []
+        if self.token_budget is None:
+            return history + messages
+
+        # Keep the most recent messages that fit, the older ones are being summarized or were dropped
+        budget = self.token_budget - count_message_tokens(history)
+        recent = []
+        for message in reversed(messages):
+            budget -= tokens_per_message + count_tokens(message["content"])
+            if budget < 0:
+                break
+            recent.append(message)
+        return history + recent[::-1]
+
+    def append(self, session_id: str, *messages: dict):
+        with self._lock:
+            with self._transaction():
+                state = self._session(session_id, create=True)
+                state["messages"].extend(messages)
+                if self._over_budget(state) and self.summarizer is None:
+                    self._drop_oldest(state)
+                self._save(session_id, state)
+            if self.summarizer is None or not self._over_budget(state) or session_id in self._compacting:
+                return
+            self._compacting.add(session_id)
+            future = self._executor.submit(self._compact, session_id)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+
+    def _over_budget(self, state: dict) -> bool:
+        if self.token_budget is None:
+            return False
+        history = ([summary_message(state["summary"])] if state["summary"] else []) + state["messages"]
+        return count_message_tokens(history) > self.token_budget
+
+    def _drop_oldest(self, state: dict):
+        while len(state["messages"]) > 1 and self._over_budget(state):
+            state["messages"].pop(0)
+            self.stats["dropped_messages"] += 1
+
+    def _compact(self, session_id: str):
+        '''
+        Folds the messages before the keep_recent last ones into the summary of the session
+        '''
+        try:
+            with self._lock:
+                state = self._session(session_id)
+                if state is None:
+                    return
+                previous_summary = state["summary"]
+                older = state["messages"][: max(len(state["messages"]) - self.keep_recent, 0)]
+            if not older:
+                return
+            try:
+                summary = self.summarizer(previous_summary, older)
+            except Exception as e:
+                print(f"Failed to summarize the history of session {session_id}: {e}")
+                self.stats["failures"] += 1
+                return
+
+            with self._lock, self._transaction():
+                # New messages are only ever appended, but the session may have been cleared or compacted
+                # meanwhile, by this worker or another one sharing the file
+                state = self._session(session_id)
+                if state is None or state["summary"] != previous_summary or state["messages"][: len(older)] != older:
+                    return
+                state["summary"] = summary
+                del state["messages"][: len(older)]
+                self.stats["compactions"] += 1
+                self.stats["summarized_messages"] += len(older)
+                self._save(session_id, state)
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+    def wait(self):
+        '''
+        Waits for the summaries being written
+        '''
+        for future in list(self._pending):
+            future.result()
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
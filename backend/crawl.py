@@ -4,34 +4,105 @@ It uses asynchronous web crawling to gather markdown content from specified URLs
 The script also processes the extracted data, adding product details to a vector database if not already present.
 Command-line arguments allow customization of the starting URL and the number of products to scrape.
 
+The whole crawl runs as a single asyncio program: one shared crawler, a fixed number of concurrent workers,
+and a per-host rate limit with backoff on failures.
+
 Check README.md for instruction on how to use this script.
 '''
 
+import aiohttp
 import asyncio
+import os
+import random
+import time
+from collections import defaultdict
 from crawl4ai import AsyncWebCrawler
 from crawl4ai.async_configs import BrowserConfig, CrawlerRunConfig
+from urllib.parse import urlparse
 import re
-import queue
 import argparse
-from vector_db import add_to_vector_db, is_in_vector_db
-from app import llm_client
+from vector_db import is_in_vector_db
+from ingestion import IngestionPipeline
+from crawl_frontier import PENDING, CrawlFrontier, content_hash
+from openai import OpenAI
+from dotenv import load_dotenv
+
+partselect_url = "https://www.partselect.com/"
+
+# Responses worth retrying, other failures (e.g. 404) are final
+retry_status_codes = {429, 500, 502, 503, 504}
 
 
-async def crawl_async(url):
+class HostRateLimiter:
+    '''
+    Spaces out requests to the same host so there are at most requests_per_second of them.
+    Each failure doubles an extra delay for that host, and each success halves it again.
+    '''
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_request = defaultdict(float)
+        self._penalty = defaultdict(float)
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url: str):
+        host = urlparse(url).netloc
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            start = max(now, self._next_request[host])
+            self._next_request[host] = start + self.interval + self._penalty[host]
+        await asyncio.sleep(start - now)
+
+    def backoff(self, url: str):
+        host = urlparse(url).netloc
+        self._penalty[host] = min(max(self._penalty[host] * 2, 0.5), 30.0)
+
+    def success(self, url: str):
+        host = urlparse(url).netloc
+        self._penalty[host] /= 2
+
+
+class CrawlStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.products_added = 0
+        self.products_skipped = 0
+        self.unchanged = 0
+        self.failures = 0
+        self.retries = 0
+
+    def pages_per_second(self) -> float:
+        return self.pages / max(time.perf_counter() - self.start, 1e-9)
+
+    def __str__(self):
+        return (
+            f"{self.pages} pages crawled ({self.pages_per_second():.2f} pages/s), "
+            f"{self.products_added} products added, {self.products_skipped} already in the database, "
+            f"{self.unchanged} unchanged, "
+            f"{self.failures} failures, {self.retries} retries"
+        )
+
+
+async def crawl_async(url, crawler=None):
     '''
     Crawl a given url with crawl4AI, return the resulting document in a markdown format.
+    Reuses the given crawler, otherwise launches a new one for this url.
     '''
-    browser_config = BrowserConfig()
     run_config = CrawlerRunConfig()
+    if crawler:
+        result = await crawler.arun(url=url, config=run_config)
+        return result.markdown
 
-    async with AsyncWebCrawler(config=browser_config) as crawler:
+    async with AsyncWebCrawler(config=BrowserConfig()) as crawler:
         result = await crawler.arun(url=url, config=run_config)
         return result.markdown
 
 
 def crawl(url):
     '''
-    Calls the async crawl function. 
+    Calls the async crawl function.
     Other files should use this instead of crawl_async so that the async operations are handled within this file
     '''
     return asyncio.run(crawl_async(url))
@@ -39,60 +110,239 @@ def crawl(url):
 
 def crawl_multiple(urls: list) -> list:
     '''
-    Crawls multiple urls, returns a list of markdown content
+    Crawls multiple urls with a single crawler, returns a list of markdown content
     '''
-    res = []
-    for url in urls:
-        res.append(asyncio.run(crawl_async(url)))
-    return res
 
+    async def crawl_all():
+        async with AsyncWebCrawler(config=BrowserConfig()) as crawler:
+            return await asyncio.gather(*[crawl_async(url, crawler) for url in urls])
+
+    return asyncio.run(crawl_all())
 
-def find_and_add_products(limit: int, starting_url: str):
+
+async def fetch_with_retries(
+    crawler, url: str, rate_limiter: HostRateLimiter, stats: CrawlStats, max_retries: int = 3
+):
+    '''
+    Crawl a url respecting the rate limit of its host, retrying with exponential backoff on transient failures.
+    Returns the crawl result, or None if the page couldn't be crawled.
+    '''
+    run_config = CrawlerRunConfig()
+    for attempt in range(max_retries + 1):
+        await rate_limiter.wait(url)
+        try:
+            result = await crawler.arun(url=url, config=run_config)
+            if result.success:
+                rate_limiter.success(url)
+                return result
+            retry = result.status_code is None or result.status_code in retry_status_codes
+            print(f"Failed to crawl {url}: {result.status_code} {result.error_message}")
+        except Exception as e:
+            retry = True
+            print(f"Failed to crawl {url}: {e}")
+
+        if not retry or attempt == max_retries:
+            break
+        stats.retries += 1
+        rate_limiter.backoff(url)
+        await asyncio.sleep(2**attempt + random.random())
+
+    stats.failures += 1
+    return None
+
+
+async def is_unchanged(session, url: str, validators: dict, rate_limiter: HostRateLimiter) -> bool:
+    '''
+    Cheaply check whether a page changed since it was last fetched, with a conditional HEAD request
+    '''
+    headers = {}
+    if validators["etag"]:
+        headers["If-None-Match"] = validators["etag"]
+    if validators["last_modified"]:
+        headers["If-Modified-Since"] = validators["last_modified"]
+    if not headers:
+        return False
+
+    await rate_limiter.wait(url)
+    try:
+        async with session.head(url, headers=headers, allow_redirects=True) as response:
+            if response.status == 304:
+                return True
+            etag = response.headers.get("ETag")
+            return response.status == 200 and etag is not None and etag == validators["etag"]
+    except aiohttp.ClientError:
+        return False
+
+
+async def find_and_add_products_async(
+    limit: int,
+    starting_url: str,
+    concurrency: int = 4,
+    requests_per_second: float = 2.0,
+    frontier_path: str = "./crawl_frontier.db",
+    recrawl_after: float = None,
+    batch_size: int = 32,
+    max_extractions: int = 8,
+) -> CrawlStats:
     '''
     Crawls websites in a breadth-first manner, starting from the starting_url.
     Continues until it can't find additional pages to crawl or limit is reached.
-    Limit specifies the maximum amount of product pages the algorithm will crawl.
-    '''
-
-    # Make sure we visit each url only once
-    visited_urls = set()
-    visited_product_urls = set()
+    Limit specifies the maximum amount of product pages the algorithm will crawl in this run.
+    Up to concurrency pages are crawled at the same time, sharing a single crawler.
 
-    urls = queue.Queue()
-    urls.put(starting_url)
+    The frontier is persisted at frontier_path, so calling this again resumes an interrupted crawl.
+    With recrawl_after (in seconds), pages fetched longer ago than that are crawled again,
+    skipping the ones whose ETag, Last-Modified or content hash show they haven't changed.
 
-    # Continue until the queue has no items left or we reach the limit
-    while urls and len(visited_product_urls) < limit:
-        url = urls.get()
-        if url in visited_urls:
-            continue
-
-        visited_urls.add(url)
-        markdown = asyncio.run(crawl_async(url))
-        # add urls with potential product links into the queue to be processed later
-        for url in extract_general_urls(markdown):
-            if url not in visited_urls:
-                urls.put(url) 
-
-        # process the product links in the current url
-        product_urls = extract_product_urls(markdown)
-        for product_url in product_urls:
-            if len(visited_product_urls) >= limit:
-                break
-            if product_url in visited_product_urls:
-                continue
-            visited_urls.add(product_url)
-            visited_product_urls.add(product_url)
-            # no need to crawl again if the product is already in the database
-            if is_in_vector_db(product_url):
+    Product pages are handed to an ingestion pipeline that extracts up to max_extractions products at the same time
+    and writes them to the database in batches of batch_size. A product page is only marked as done once it is written.
+    '''
+    parsed = urlparse(starting_url)
+    base_url = f"{parsed.scheme}://{parsed.netloc}/"
+
+    # Make sure we visit each url only once, across runs
+    frontier = CrawlFrontier(frontier_path)
+    frontier.add(starting_url, is_product=False)
+    if recrawl_after is not None:
+        print(f"Scheduled {frontier.schedule_recrawl(recrawl_after)} pages to be re-crawled.")
+    print(f"Crawl frontier: {frontier.counts()}")
+
+    rate_limiter = HostRateLimiter(requests_per_second)
+    stats = CrawlStats()
+    in_flight = 0
+    products_claimed = 0
+    # The LLM only extracts the product pages the parser isn't confident about
+    ingestion = IngestionPipeline(OpenAI(), batch_size, max_extractions)
+    ingesting = set()
+
+    async def finish_product(written, url: str, etag: str, last_modified: str, hash: str):
+        try:
+            await written
+        except Exception as e:
+            stats.failures += 1
+            frontier.fail(url)
+            print(f"Failed to add {url}: {e}")
+            return
+        stats.products_added += 1
+        frontier.complete(url, etag, last_modified, hash)
+
+    def enough_products() -> bool:
+        # The products of earlier runs and the unchanged ones don't count, only the ones crawled in this run
+        # and the ones waiting, so pages scheduled to be re-crawled don't keep the crawl from expanding
+        return products_claimed + frontier.product_count(PENDING) >= limit
+
+    async def process(crawler, session, url: str, is_product: bool):
+        nonlocal products_claimed
+        validators = frontier.validators(url)
+
+        # no need to crawl again if the product is already in the database and we haven't crawled it before
+        if is_product and validators["content_hash"] is None and await asyncio.to_thread(is_in_vector_db, url):
+            stats.products_skipped += 1
+            products_claimed -= 1
+            frontier.complete(url)
+            return
+
+        # the page was crawled before, skip it if the server says it hasn't changed
+        if await is_unchanged(session, url, validators, rate_limiter):
+            stats.unchanged += 1
+            products_claimed -= is_product
+            frontier.complete(url)
+            return
+
+        result = await fetch_with_retries(crawler, url, rate_limiter, stats)
+        stats.pages += 1
+        if not result or not result.markdown:
+            frontier.fail(url)
+            return
+
+        headers = {key.lower(): value for key, value in (getattr(result, "response_headers", None) or {}).items()}
+        hash = content_hash(result.markdown)
+        if hash == validators["content_hash"]:
+            # same content as last time, the products and the links in it are already known
+            stats.unchanged += 1
+        elif is_product:
+            # scrape the product page and pass the markdown to add to the database, the url is completed once it is written
+            written = asyncio.wrap_future(ingestion.submit(result.markdown, url))
+            task = asyncio.create_task(
+                finish_product(written, url, headers.get("etag"), headers.get("last-modified"), hash)
+            )
+            ingesting.add(task)
+            task.add_done_callback(ingesting.discard)
+            return
+        else:
+            # process the product links in the current url, products are crawled before other pages
+            for product_url in extract_product_urls(result.markdown, base_url):
+                if enough_products():
+                    break
+                frontier.add(product_url, is_product=True, priority=1)
+
+            # add urls with potential product links into the frontier to be processed later
+            for general_url in extract_general_urls(result.markdown, base_url):
+                frontier.add(general_url, is_product=False)
+
+        frontier.complete(url, headers.get("etag"), headers.get("last-modified"), hash)
+
+    async def worker(crawler, session):
+        nonlocal in_flight, products_claimed
+        while True:
+            # Stop expanding the crawl once we have discovered enough products, but finish the products
+            claimed = frontier.claim(products_only=enough_products())
+            if claimed is None:
+                if in_flight == 0:
+                    return
+                # other workers may still discover new urls
+                await asyncio.sleep(0.1)
                 continue
 
-            # scrape the product page and pass the markdown to add to the database
-            product_markdown = asyncio.run(crawl_async(product_url))
-            add_to_vector_db(product_markdown, product_url, llm_client)
+            url, is_product = claimed
+            products_claimed += is_product
+            in_flight += 1
+            try:
+                await process(crawler, session, url, is_product)
+            except Exception as e:
+                stats.failures += 1
+                frontier.fail(url)
+                print(f"Failed to process {url}: {e}")
+            finally:
+                in_flight -= 1
+            if stats.pages and stats.pages % 25 == 0:
+                print(stats)
+
+    try:
+        async with AsyncWebCrawler(config=BrowserConfig()) as crawler, aiohttp.ClientSession() as session:
+            await asyncio.gather(*[worker(crawler, session) for _ in range(concurrency)])
+        # write the products left in the last batch
+        await asyncio.to_thread(ingestion.close)
+        await asyncio.gather(*ingesting)
+    finally:
+        print(f"Finished crawling: {stats}")
+        print(f"Crawl frontier: {frontier.counts()}")
+        frontier.close()
+    return stats
+
+
+def find_and_add_products(
+    limit: int,
+    starting_url: str,
+    concurrency: int = 4,
+    requests_per_second: float = 2.0,
+    frontier_path: str = "./crawl_frontier.db",
+    recrawl_after: float = None,
+    batch_size: int = 32,
+    max_extractions: int = 8,
+) -> CrawlStats:
+    '''
+    Calls the async crawl, see find_and_add_products_async
+    '''
+    return asyncio.run(
+        find_and_add_products_async(
+            limit, starting_url, concurrency, requests_per_second, frontier_path, recrawl_after,
+            batch_size, max_extractions,
+        )
+    )
 
 
-def extract_product_urls(text):
+def extract_product_urls(text, base_url=partselect_url):
     '''
     Given a text in markdown format, extracts all the urls that leads to a product page
     '''
@@ -102,6 +352,7 @@ def extract_product_urls(text):
 
     # This pattern indicates the line above contains a link to a product page
     partselect_pattern = r"PartSelect Number \*\*PS(\d{8})\*\*"
+    url_pattern = re.escape(base_url) + r"(?:<[^>]*>|[^\s)]*)"
     lines = text.splitlines()
     extracted_urls = []
 
@@ -112,15 +363,15 @@ def extract_product_urls(text):
             previous_line = lines[i - 1]
 
             # Extract the url for the product page
-            url_match = re.search(r"https://www\.partselect\.com/.*?\) ", previous_line)
+            url_match = re.search(url_pattern, previous_line)
             if url_match:
                 url = url_match.group(0)
-                extracted_urls.append(clean_url(url))
+                extracted_urls.append(clean_url(url, base_url))
 
     return extracted_urls
 
 
-def extract_general_urls(text):
+def extract_general_urls(text, base_url=partselect_url):
     '''
     Given a text in markdown format, extract urls that may contain links to product pages
     '''
@@ -128,7 +379,7 @@ def extract_general_urls(text):
     if "page not found" in text.lower():
         return []
 
-    general_pattern = r"\*\s+\[.*?\]\((https://www\.partselect\.com/.*?)\)"
+    general_pattern = r"\*\s+\[.*?\]\((" + re.escape(base_url) + r"(?:<[^>]*>|[^\s)]*))\)"
     lines = text.splitlines()
     extracted_urls = []
 
@@ -136,7 +387,7 @@ def extract_general_urls(text):
         match = re.search(general_pattern, line)
         if not match:
             continue
-        url = clean_url(match.group(1))
+        url = clean_url(match.group(1), base_url)
         # Make sure the resulting page is contains the keywords dishwashers and refrigerators
         # otherwise it's most likely to be irrelevant
         if "dishwasher" in url.lower() or "refrigerator" in url.lower():
@@ -145,9 +396,14 @@ def extract_general_urls(text):
     return extracted_urls
 
 
-def clean_url(url):
+def clean_url(url, base_url=partselect_url):
+    '''
+    Links with special characters come as <path> after the base url, rebuild those into plain urls
+    '''
+    if "</" not in url:
+        return url.strip()
     extracted_part = url.split("</")[-1].split(">")[0]
-    cleaned_url = f"https://www.partselect.com/{extracted_part}"
+    cleaned_url = f"{base_url}{extracted_part}"
     return cleaned_url
 
 
@@ -155,6 +411,7 @@ if __name__ == "__main__":
     '''
     Parse command line arguments and call find_and_add_products with the given arguments
     '''
+    load_dotenv()
 
     parser = argparse.ArgumentParser(description="PartSelect Customer Support Agent")
     parser.add_argument(
@@ -169,7 +426,62 @@ if __name__ == "__main__":
         default=10,
         help="Limit to the number of products to scrape or fetch",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of pages to crawl at the same time (default: 4)",
+    )
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=2.0,
+        help="Maximum requests per second to a single host, 0 for no limit (default: 2)",
+    )
+    parser.add_argument(
+        "--frontier",
+        type=str,
+        default="./crawl_frontier.db",
+        help="Where the crawl state is stored, an interrupted crawl resumes from it (default: ./crawl_frontier.db)",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Discard the stored crawl state and start over",
+    )
+    parser.add_argument(
+        "--recrawl-after",
+        type=float,
+        default=None,
+        help="Re-crawl pages fetched more than this many hours ago, skipping the ones that haven't changed",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=32,
+        help="Number of products encoded and written to the database together (default: 32)",
+    )
+    parser.add_argument(
+        "--max-extractions",
+        type=int,
+        default=8,
+        help="Number of product pages whose information is extracted at the same time (default: 8)",
+    )
     args = parser.parse_args()
 
+    if args.fresh:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.frontier + suffix):
+                os.remove(args.frontier + suffix)
+
     print("Starting to scrape PartSelect and fill the database.")
-    find_and_add_products(args.limit, args.starting_url)
+    find_and_add_products(
+        args.limit,
+        args.starting_url,
+        args.concurrency,
+        args.requests_per_second,
+        args.frontier,
+        args.recrawl_after * 3600 if args.recrawl_after is not None else None,
+        args.batch_size,
+        args.max_extractions,
+    )
@@ -0,0 +1,142 @@
+'''
+This file keeps the state of a crawl in SQLite, so an interrupted crawl can resume where it stopped
+instead of re-crawling category pages to rediscover products.
+
+Every url discovered by the crawler is a row with its state, priority, retry count, the time it was last fetched,
+and the validators (ETag, Last-Modified and a hash of the content) used to skip unchanged pages on a re-crawl.
+'''
+
+import hashlib
+import sqlite3
+import time
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class CrawlFrontier:
+    def __init__(self, path: str = "./crawl_frontier.db"):
+        self.path = path
+        # The crawler is a single asyncio program, so one connection is used from one thread
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                is_product INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                retries INTEGER NOT NULL DEFAULT 0,
+                last_fetched REAL,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS urls_pending ON urls (state, priority DESC)"
+        )
+        # Urls that were being crawled when the previous run stopped have to be crawled again
+        self._db.execute("UPDATE urls SET state = ? WHERE state = ?", (PENDING, IN_PROGRESS))
+        self._db.commit()
+
+    def add(self, url: str, is_product: bool, priority: int = 0) -> bool:
+        '''
+        Add a url to the frontier, returns False if it was already discovered before
+        '''
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO urls (url, is_product, state, priority) VALUES (?, ?, ?, ?)",
+            (url, int(is_product), PENDING, priority),
+        )
+        self._db.commit()
+        return cursor.rowcount > 0
+
+    def claim(self, products_only: bool = False):
+        '''
+        Mark the pending url with the highest priority as in progress and return (url, is_product),
+        or None if there are no pending urls
+        '''
+        row = self._db.execute(
+            "SELECT url, is_product FROM urls WHERE state = ? AND is_product >= ? ORDER BY priority DESC, rowid LIMIT 1",
+            (PENDING, int(products_only)),
+        ).fetchone()
+        if not row:
+            return None
+        self._db.execute("UPDATE urls SET state = ? WHERE url = ?", (IN_PROGRESS, row[0]))
+        self._db.commit()
+        return row[0], bool(row[1])
+
+    def complete(self, url: str, etag: str = None, last_modified: str = None, hash: str = None):
+        '''
+        Mark a url as crawled and store the validators of the fetched content
+        '''
+        self._db.execute(
+            """
+            UPDATE urls SET state = ?, last_fetched = ?, retries = 0,
+                etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+                content_hash = COALESCE(?, content_hash)
+            WHERE url = ?
+            """,
+            (DONE, time.time(), etag, last_modified, hash, url),
+        )
+        self._db.commit()
+
+    def fail(self, url: str, max_retries: int = 3):
+        '''
+        Put a url back in the frontier to be retried later, or give up on it after max_retries failures
+        '''
+        self._db.execute(
+            "UPDATE urls SET retries = retries + 1, state = CASE WHEN retries + 1 >= ? THEN ? ELSE ? END WHERE url = ?",
+            (max_retries, FAILED, PENDING, url),
+        )
+        self._db.commit()
+
+    def validators(self, url: str) -> dict:
+        '''
+        Returns the ETag, Last-Modified and content hash from the last time the url was fetched
+        '''
+        row = self._db.execute(
+            "SELECT etag, last_modified, content_hash FROM urls WHERE url = ?", (url,)
+        ).fetchone()
+        if not row:
+            return {"etag": None, "last_modified": None, "content_hash": None}
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2]}
+
+    def schedule_recrawl(self, older_than: float) -> int:
+        '''
+        Put crawled urls that were last fetched more than older_than seconds ago back in the frontier
+        '''
+        cursor = self._db.execute(
+            "UPDATE urls SET state = ? WHERE state = ? AND last_fetched < ?",
+            (PENDING, DONE, time.time() - older_than),
+        )
+        self._db.commit()
+        return cursor.rowcount
+
+    def product_count(self, state: str = None) -> int:
+        '''
+        Number of product urls, in the given state or in any state
+        '''
+        if state is None:
+            return self._db.execute("SELECT COUNT(*) FROM urls WHERE is_product = 1").fetchone()[0]
+        return self._db.execute(
+            "SELECT COUNT(*) FROM urls WHERE is_product = 1 AND state = ?", (state,)
+        ).fetchone()[0]
+
+    def counts(self) -> dict:
+        '''
+        Number of urls in each state
+        '''
+        return dict(self._db.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+
+    def close(self):
+        self._db.close()
@@ -3,10 +3,33 @@ This file defines the tools, prompts, and logic for handling interactions with t
 It manages querying PartSelect for appliance parts and generates responses based on user queries.
 """
 
+import asyncio
+import functools
+import inspect
 import json
+import os
+import random
 import re
-from search_part_tool import search_partselect
-from vector_db import query_chroma, query_chroma_with_exact_id
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from search_part_tool import browser_pool, search_partselect
+from answer_cache import AnswerCache
+from browse_admission import AdmissionRejected, BrowseAdmission
+from context_budget import relevant_sections, select_documents
+from metrics import RequestTrace, counter, gauge, register_stats, span, stage_seconds
+from compatibility_index import MANUFACTURER_PART_NUMBER, MODEL
+from product_parser import model_pattern
+from speculative_browse import BrowsePrefetch
+import speculative_browse
+from vector_db import (
+    collection_listeners,
+    compatibility_index,
+    embed_query,
+    query_chroma,
+    query_chroma_with_exact_id,
+)
+from tokens import count_message_tokens, count_tokens
 
 tools = [
     {
@@ -75,28 +98,138 @@ no_search_prompt = {
     "content": "A tool that would help you browse PartSelect for information about a specific part number is disabled. If you can't find any relevant information about the specified part, instruct user to enable the browsing functionality, so that you can browse the PartSelect website to retrieve what they need.",
 }
 
+browse_busy_prompt = {
+    "role": "system",
+    "content": "A tool that would help you browse PartSelect for information about a specific part number is temporarily unavailable because of high demand. If you can't find any relevant information about the specified part, tell the user you can't look it up on PartSelect right now and ask them to try again in a few minutes.",
+}
 
-def query_customer_agent(
-    query: str, chat_history: list, llm_client, enable_browse: bool
-):
+browse_busy_message = (
+    "Browsing PartSelect is busy right now, no result is available. Answer with the information you have."
+)
+
+
+# Browsing runs in a bounded pool of threads, so slow searches don't block the event loop in the async server
+browse_workers = int(os.getenv("BROWSE_WORKERS", 4))
+browse_executor = ThreadPoolExecutor(max_workers=browse_workers, thread_name_prefix="browse")
+
+# At most BROWSE_MAX_ACTIVE searches run at a time and BROWSE_MAX_QUEUED wait for a slot, at most BROWSE_QUEUE_TIMEOUT
+# seconds each, see browse_admission.py. Questions asked while the queue is full are answered without browsing.
+# By default no more searches are admitted than there are pooled browsers, an admitted search would otherwise wait
+# for a browser inside the pool, where neither the queue timeout nor the answer without browsing apply.
+browse_admission = BrowseAdmission(
+    max_active=int(os.getenv("BROWSE_MAX_ACTIVE", min(browse_workers, browser_pool.size))),
+    max_queued=int(os.getenv("BROWSE_MAX_QUEUED", 16)),
+    wait_timeout=float(os.getenv("BROWSE_QUEUE_TIMEOUT", 10)),
+)
+
+# Seconds a chat completion may take before it fails, and retries of the completions that fail with a timeout,
+# a connection error, a rate limit or a server error, after a random delay of up to LLM_RETRY_BACKOFF * 2^attempt
+llm_timeout = float(os.getenv("LLM_TIMEOUT", 30))
+llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", 2))
+llm_retry_backoff = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))
+
+# Rounds of tool calls the LLM may make before it has to answer
+max_tool_rounds = int(os.getenv("MAX_TOOL_ROUNDS", 3))
+
+# Seconds a single tool call may take, and seconds all the tool rounds of a request may take together
+tool_call_timeout = float(os.getenv("TOOL_CALL_TIMEOUT", 30))
+agent_deadline = float(os.getenv("AGENT_DEADLINE", 60))
+
+# Tokens of retrieved documents and of each browsed page given to the LLM, see context_budget.py.
+# Vector hits farther than CONTEXT_MAX_DISTANCE (squared L2 of normalized embeddings, 2 - 2 * cosine) are dropped.
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+context_max_distance = float(os.getenv("CONTEXT_MAX_DISTANCE", 1.3))
+browse_token_budget = int(os.getenv("BROWSE_TOKEN_BUDGET", 2000))
+
+# With SPECULATIVE_BROWSE=1, part numbers the database doesn't know are searched on PartSelect while the first
+# completion runs, at most SPECULATIVE_BROWSE_MAX of them per question, see speculative_browse.py
+speculative_browse_enabled = os.getenv("SPECULATIVE_BROWSE") == "1"
+speculative_browse_max = int(os.getenv("SPECULATIVE_BROWSE_MAX", 1))
+
+# Opt-in cache of the answers to first questions, see answer_cache.py
+answer_cache = None
+if os.getenv("ANSWER_CACHE") == "1":
+    answer_cache = AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", 512)),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    )
+    collection_listeners.append(answer_cache.invalidate)
+
+requests_total = counter("partselect_agent_requests_total", "Questions answered by the agent", ("outcome",))
+tool_calls_total = counter("partselect_tool_calls_total", "Tool calls by tool and outcome", ("tool", "outcome"))
+llm_calls_total = counter("partselect_llm_calls_total", "Chat completions", ("stage",))
+llm_tokens_total = counter("partselect_llm_tokens_total", "Tokens of the chat completions", ("kind",))
+llm_retries_total = counter("partselect_llm_retries_total", "Retried chat completions", ("error",))
+gauge("partselect_browse_active", "Searches holding a browsing slot", lambda: {(): browse_admission.active()})
+gauge(
+    "partselect_browse_queue_depth", "Searches waiting for a browsing slot", lambda: {(): browse_admission.queue_depth()}
+)
+register_stats("partselect_browse_admission_total", "Browsing admission decisions", lambda: browse_admission.stats)
+register_stats(
+    "partselect_speculative_browse_total", "Speculative PartSelect searches",
+    lambda: speculative_browse.stats if speculative_browse_enabled else None,
+)
+register_stats(
+    "partselect_answer_cache_total", "Answer cache lookups", lambda: answer_cache.stats if answer_cache is not None else None
+)
+
+
+def build_messages(
+    query: str, chat_history: list, enable_browse: bool, context_message: str = None, browse_busy: bool = False
+) -> list:
     """
-    Query the LLM with a user query. It attempts to gather context from the database and optionally browse PartSelect if enabled.
+    Gather context from the database and put together the messages for the first LLM call.
+    browse_busy tells the LLM browsing is unavailable for now instead of disabled.
+    """
+    if context_message is None:
+        context_message, _ = retrieve_context(query)
+
+    # Add all the prompts, chat history, chroma_db context
+    return [
+        system_prompt,
+        (
+            search_prompt if enable_browse else browse_busy_prompt if browse_busy else no_search_prompt
+        ),  # let the LLM know if search tool is available or not
+        *chat_history,
+        {"role": "system", "content": context_message},
+        {"role": "user", "content": query},
+    ]
+
+
+def retrieve_context(query: str) -> tuple:
+    """
+    Gather context from the database, returns the context message and the ids of the products in it
     """
 
-    chroma_context = ""
+    # Exact compatibility and part number lookups come first, they don't depend on the vector search
+    index_context, candidates = compatibility_context(query)
 
     # If there is an exact match to a Part Number, query for the exact product id
     match = re.search(r"PS\d{8}", query)
     if match:
-        chroma_context += query_chroma_with_exact_id(match.group())
+        document = query_chroma_with_exact_id(match.group())
+        if document:
+            candidates.append((match.group(), document, None))
 
     # Query the vector-db with the whole message
     results = query_chroma(query, 3)
     if results["documents"]:
-        flattened_documents = [
-            doc for sublist in results["documents"] for doc in sublist
-        ]
-        chroma_context += "\n\n".join(flattened_documents)
+        ids, documents = results["ids"][0], results["documents"][0]
+        distances = results["distances"][0] if results.get("distances") else [None] * len(ids)
+        candidates += zip(ids, documents, distances)
+
+    # The same product often comes from several lookups, and far vector hits are noise
+    selected, stats = select_documents(
+        candidates, context_token_budget - count_tokens(index_context), context_max_distance
+    )
+    chroma_context = index_context + "\n\n".join(document for _, document in selected)
+    context_ids = [document_id for document_id, _ in selected]
+    print(
+        f"Context: {len(selected)} of {stats['candidates']} documents, {stats['duplicates']} duplicates, "
+        f"{stats['distant']} too distant, {stats['over_budget']} over budget, "
+        f"{stats['tokens'] + count_tokens(index_context)} tokens"
+    )
 
     # Let the LLM know whether it could receive relevant information from the vector db
     if len(chroma_context) > 0:
@@ -104,53 +237,469 @@ def query_customer_agent(
     else:
         context_message = "No relevant context was found in the database for the query."
 
-    # Add all the prompts, chat history, chroma_db context
-    messages = [
-        system_prompt,
-        (
-            search_prompt if enable_browse else no_search_prompt
-        ),  # let the LLM know if search tool is available or not
-        *chat_history,
-        {"role": "system", "content": context_message},
-        {"role": "user", "content": query},
-    ]
+    return context_message, context_ids
 
-    completion = llm_client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        tools=(
-            tools if enable_browse else None
-        ),  # enable tool use only if browsing is enabled
-        tool_choice=(
-            "auto" if enable_browse else None
-        ),  # enable tool use only if browsing is enabled
-    )
 
-    # return the response if the LLM didn't have a tool call (for the browsing functionality)
-    response = completion.choices[0].message
-    if not response.tool_calls:
-        return response.content
+def compatibility_context(query: str, max_parts: int = 5) -> tuple:
+    """
+    Answer compatibility and part number questions from the compatibility index.
+    Every model or part number in the query is a single lookup, no embedding is computed.
+    Returns the context and the (id, document, distance) candidates of the products it mentions.
+    """
+    lines = []
+    products = []
+    partselect_numbers = re.findall(r"PS\d{8}", query)
+
+    for identifier in compatibility_index.find_identifiers(query):
+        parts = compatibility_index.parts_for(identifier)
+        models = [part for part, kind in parts.items() if kind == MODEL]
+        if models:
+            lines.append(f"Model {identifier} is compatible with {len(models)} parts in the database: {', '.join(models[:20])}")
+            for partselect_number in partselect_numbers:
+                if compatibility_index.is_indexed(partselect_number):
+                    compatible = "is" if partselect_number in models else "is not"
+                    lines.append(f"{partselect_number} {compatible} listed as compatible with model {identifier}.")
+            products += [part for part in models if part not in partselect_numbers]
+        for part, kind in parts.items():
+            if kind == MANUFACTURER_PART_NUMBER:
+                lines.append(f"{identifier} is the manufacturer part number of {part}.")
+                products.append(part)
+            elif kind != MODEL:
+                lines.append(f"{identifier} is replaced by {part}.")
+                products.append(part)
 
-    # if the LLM decided to browse part select, gather results from search_partselect function
-    args = json.loads(response.tool_calls[0].function.arguments)
-    result = search_partselect(args["part_number"])
+    for partselect_number in partselect_numbers:
+        models = compatibility_index.identifiers_for(partselect_number, MODEL)
+        if models:
+            lines.append(f"{partselect_number} fits {len(models)} models, including: {', '.join(models[:20])}")
+
+    if not lines:
+        return "", []
+
+    context = "Compatibility index:\n" + "\n".join(lines) + "\n\n"
+    candidates = []
+    for partselect_number in list(dict.fromkeys(products))[:max_parts]:
+        document = query_chroma_with_exact_id(partselect_number)
+        if document:
+            candidates.append((partselect_number, document, None))
+    return context, candidates
+
+
+def unknown_part_numbers(query: str, context_ids: list, limit: int) -> list:
+    """
+    The PartSelect numbers, then the other part or model numbers, of the query that the database doesn't know.
+    These are the ones the LLM will want to search PartSelect for.
+    """
+    unknown = []
+    for partselect_number in dict.fromkeys(re.findall(r"PS\d{8}", query)):
+        if partselect_number not in context_ids and not query_chroma_with_exact_id(partselect_number):
+            unknown.append(partselect_number)
+    for word in re.findall(r"[A-Za-z0-9][A-Za-z0-9\-/.]*[A-Za-z0-9]", query):
+        word = word.upper()
+        if (
+            model_pattern.match(word)
+            and not re.fullmatch(r"PS\d{8}", word)
+            and word not in unknown
+            and not compatibility_index.parts_for(word)
+        ):
+            unknown.append(word)
+    return unknown[:limit]
+
+
+def run_tool_call(tool_call, query: str = "", result: str = None) -> dict:
+    """
+    Browse PartSelect for the part number requested by a tool call and return the tool message with the result,
+    the sections of the page relevant to the query within browse_token_budget tokens.
+    If the page was prefetched, its markdown is given as result and only reduced.
+    """
+    if tool_call.function.name != "search_partselect":
+        result = f"There is no tool named {tool_call.function.name}"
+    else:
+        args = json.loads(tool_call.function.arguments)
+        if result is None:
+            result = search_partselect(args["part_number"])
+        if result:
+            result = relevant_sections(result, f"{query} {args['part_number']}", browse_token_budget)
     if not result:
         result = "Search part select function has not returned a proper result"
 
-    messages.append(response)
-    messages.append(
-        {
-            "role": "tool",
-            "tool_call_id": response.tool_calls[0].id,
-            "content": result,
-        }
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call.id,
+        "content": result,
+    }
+
+
+async def run_tool_calls(
+    tool_calls: list,
+    deadline: float,
+    query: str = "",
+    trace: RequestTrace = None,
+    prefetch: BrowsePrefetch = None,
+    state: dict = None,
+) -> list:
+    """
+    Run all the tool calls of a round concurrently in the browse executor and return their tool messages in order.
+    Each call gets at most tool_call_timeout seconds, and none may run past the deadline of the whole request.
+    Searches wait for a slot of browse_admission first, the ones that aren't admitted get browse_busy_message.
+    Searches started by the prefetch are awaited instead of being started again.
+    If a call times out, fails or isn't admitted, state["tools_failed"] is set.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def timed_tool_call(tool_call):
+        start = loop.time()
+        timeout = max(0.0, min(tool_call_timeout, deadline - start))
+        prefetched = None
+        if prefetch is not None and tool_call.function.name == "search_partselect":
+            prefetched = prefetch.take(_tool_argument(tool_call, "part_number"))
+        outcome = "ok"
+        attributes = {"tool": tool_call.function.name, "prefetched": prefetched is not None}
+        with span("tool_call", trace=trace, **attributes) as attributes:
+            try:
+                if prefetched is not None:
+                    # Shielded, the search goes on for the page cache if the request gives up on it
+                    result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(prefetched)), timeout)
+                    message = await asyncio.to_thread(run_tool_call, tool_call, query, result)
+                else:
+                    call = functools.partial(run_tool_call, tool_call, query)
+                    if trace is not None:
+                        call = functools.partial(trace.run, call)
+                    await browse_admission.acquire(min(browse_admission.wait_timeout, timeout))
+                    # The slot is held until the search is done, even if this request stops waiting for it
+                    future = browse_executor.submit(call)
+                    future.add_done_callback(lambda _: browse_admission.release())
+                    timeout = max(0.0, timeout - (loop.time() - start))
+                    message = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except AdmissionRejected as e:
+                outcome = "rejected"
+                attributes["admission"] = e.reason
+                message = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": browse_busy_message,
+                }
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                message = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": "Searching Part Select took too long, no result is available.",
+                }
+            except Exception as e:
+                outcome = "error"
+                message = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": f"Search part select function has failed: {e}",
+                }
+            attributes["outcome"] = outcome
+        if outcome != "ok" and state is not None:
+            state["tools_failed"] = True
+        tool_calls_total.inc(tool=tool_call.function.name, outcome=outcome)
+        print(
+            f"Tool call {tool_call.function.name}({tool_call.function.arguments}) took {loop.time() - start:.2f}s"
+        )
+        return message
+
+    return await asyncio.gather(*[timed_tool_call(tool_call) for tool_call in tool_calls])
+
+
+def _tool_argument(tool_call, name: str) -> str:
+    try:
+        return str(json.loads(tool_call.function.arguments).get(name, ""))
+    except (json.JSONDecodeError, AttributeError):
+        return ""
+
+
+def query_customer_agent(
+    query: str, chat_history: list, llm_client, enable_browse: bool
+):
+    """
+    Query the LLM with a user query. It attempts to gather context from the database and optionally browse PartSelect if enabled.
+    """
+    content = ""
+    for event, value in stream_customer_agent(query, chat_history, llm_client, enable_browse):
+        if event == "done":
+            content = value
+    return content
+
+
+async def query_customer_agent_async(
+    query: str, chat_history: list, llm_client, enable_browse: bool
+):
+    """
+    Async variant of query_customer_agent, for serving many conversations from one event loop
+    """
+    content = ""
+    async for event, value in stream_customer_agent_async(query, chat_history, llm_client, enable_browse):
+        if event == "done":
+            content = value
+    return content
+
+
+def stream_customer_agent(
+    query: str, chat_history: list, llm_client, enable_browse: bool
+):
+    """
+    Streaming variant of query_customer_agent. Yields events as they happen:
+    ("progress", message) while the database is searched or PartSelect is browsed,
+    ("token", text) for each piece of the answer, and finally ("done", full answer).
+
+    Runs stream_customer_agent_async on a private event loop,
+    so synchronous callers don't have to deal with the async operations.
+    """
+    loop = asyncio.new_event_loop()
+    events = stream_customer_agent_async(query, chat_history, llm_client, enable_browse)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(events.aclose())
+        loop.close()
+
+
+async def stream_customer_agent_async(
+    query: str, chat_history: list, llm_client, enable_browse: bool
+):
+    """
+    The agent itself, shared by all the variants above. Works with both the OpenAI and the AsyncOpenAI clients.
+    Database retrieval and browsing run in worker threads so they don't block the event loop.
+    """
+
+    start = time.perf_counter()
+    trace = RequestTrace("agent", browse=enable_browse, history_messages=len(chat_history))
+    yield "progress", "Searching the database"
+    with trace.span("retrieve_context"):
+        context_message, context_ids = await asyncio.to_thread(trace.run, retrieve_context, query)
+
+    # Answers depend on the conversation, only the first question of a conversation is cached
+    cache = answer_cache if not chat_history else None
+    if cache is not None:
+        # The query was just embedded for the vector search, so this comes from the query embedding cache
+        query_embedding = await asyncio.to_thread(trace.run, embed_query, query)
+        cached_answer = cache.get(query_embedding, context_ids, enable_browse)
+        if cached_answer is not None:
+            print(f"Answered from the answer cache in {time.perf_counter() - start:.2f}s")
+            stage_seconds.observe(time.perf_counter() - start, stage="agent")
+            requests_total.inc(outcome="cached")
+            trace.finish(cached=True)
+            yield "token", cached_answer
+            yield "done", cached_answer
+            return
+
+    # Every browsing slot is taken and the queue is full, answer without browsing instead of waiting for a browser
+    browse_busy = enable_browse and browse_admission.saturated()
+    if browse_busy:
+        print("Browsing is saturated, answering without browsing")
+        enable_browse = False
+    messages = build_messages(query, chat_history, enable_browse, context_message, browse_busy)
+
+    # The database doesn't know the part, start browsing for it while the LLM decides to
+    prefetch = None
+    if enable_browse and speculative_browse_enabled:
+        part_numbers = await asyncio.to_thread(unknown_part_numbers, query, context_ids, speculative_browse_max)
+        if part_numbers:
+            prefetch = BrowsePrefetch(
+                browse_executor, functools.partial(trace.run, search_partselect), browse_admission
+            )
+            for part_number in part_numbers:
+                prefetch.start(part_number)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + agent_deadline
+    state = {}
+    prompt_tokens = completion_tokens = 0
+
+    # Let the LLM call tools until it answers, for at most max_tool_rounds rounds or until the deadline passes.
+    # In the last round tools are still described but can't be called, so the LLM has to answer with what it has.
+    # The same goes for the rounds that start while browsing is saturated.
+    try:
+        for tool_round in range(max_tool_rounds + 1):
+            can_call_tools = (
+                tool_round < max_tool_rounds and loop.time() < deadline and not browse_admission.saturated()
+            )
+            stage = "llm_first" if tool_round == 0 else "llm_after_tools"
+            with trace.span(stage) as attributes:
+                # The deadline bounds the rounds that can still browse, the last answer gets a full llm_timeout
+                async for event in _stream_completion(
+                    llm_client,
+                    state,
+                    deadline if can_call_tools else None,
+                    messages=messages,
+                    tools=(tools if enable_browse else None),
+                    tool_choice=(
+                        ("auto" if can_call_tools else "none") if enable_browse else None
+                    ),  # enable tool use only if browsing is enabled
+                ):
+                    yield event
+                # The API reports the tokens at the end of the stream, count them when it doesn't
+                usage = state["usage"]
+                attributes["prompt_tokens"] = usage.prompt_tokens if usage else count_message_tokens(messages)
+                attributes["completion_tokens"] = usage.completion_tokens if usage else count_tokens(state["content"])
+            llm_calls_total.inc(stage=stage)
+            prompt_tokens += attributes["prompt_tokens"]
+            completion_tokens += attributes["completion_tokens"]
+
+            if not state["tool_calls"]:
+                break
+
+            # if the LLM decided to browse part select, gather the results of all its tool calls at once
+            part_numbers = ", ".join(
+                _tool_argument(tool_call, "part_number") for tool_call in state["tool_calls"]
+            )
+            yield "progress", f"Browsing PartSelect for {part_numbers}"
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": state["content"] or None,
+                    "tool_calls": [
+                        {
+                            "id": tool_call.id,
+                            "type": "function",
+                            "function": {
+                                "name": tool_call.function.name,
+                                "arguments": tool_call.function.arguments,
+                            },
+                        }
+                        for tool_call in state["tool_calls"]
+                    ],
+                }
+            )
+            messages.extend(await run_tool_calls(state["tool_calls"], deadline, query, trace, prefetch, state))
+    finally:
+        # The LLM didn't ask for the searches left, or the request ended early
+        wasted_prefetches = prefetch.cancel() if prefetch is not None else 0
+
+    # An answer given without browsing because it was saturated, or without the result of a search that timed out
+    # or failed, isn't the answer to cache
+    if cache is not None and state["content"] and not browse_busy and not state.get("tools_failed"):
+        cache.set(query_embedding, context_ids, enable_browse, state["content"])
+    elapsed = time.perf_counter() - start
+    context_tokens = count_tokens(context_message)
+    print(
+        f"Answered in {elapsed:.2f}s with {tool_round + 1} LLM calls, "
+        f"{prompt_tokens} prompt tokens including {context_tokens} context tokens"
     )
+    stage_seconds.observe(elapsed, stage="agent")
+    requests_total.inc(outcome="browse_busy" if browse_busy else "answered")
+    llm_tokens_total.inc(prompt_tokens, kind="prompt")
+    llm_tokens_total.inc(completion_tokens, kind="completion")
+    trace.finish(
+        llm_calls=tool_round + 1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        context_tokens=context_tokens,
+        wasted_prefetches=wasted_prefetches,
+        browse_busy=browse_busy,
+    )
+    yield "done", state["content"]
+
 
-    # query the LLM with the additional context gathered
-    completion_after_search = llm_client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        tools=tools,
+def _is_retryable(error: Exception) -> bool:
+    """
+    Timeouts, connection errors, rate limits and server errors are worth retrying, the errors of the OpenAI client
+    have the status code of the response or are named after the failure
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in (408, 409, 429) or status_code >= 500
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in (
+        "APITimeoutError",
+        "APIConnectionError",
     )
 
-    return completion_after_search.choices[0].message.content
+
+async def _create_completion(llm_client, deadline: float = None, **kwargs):
+    """
+    Create a chat completion that fails after llm_timeout seconds, or when the deadline passes, retried up to
+    llm_max_retries times when it fails with a retryable error. Retries wait a random delay, so requests that failed
+    together don't retry together, and none starts past the deadline.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(llm_max_retries + 1):
+        timeout = llm_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - loop.time())
+            if timeout <= 0:
+                raise TimeoutError("The deadline of the request passed before the chat completion")
+        try:
+            completion = llm_client.chat.completions.create(timeout=timeout, **kwargs)
+            if inspect.isawaitable(completion):
+                # The timeout of the client only applies to the reads, bound the whole call
+                completion = await asyncio.wait_for(completion, timeout)
+            return completion
+        except Exception as e:
+            delay = random.uniform(0, llm_retry_backoff * 2**attempt)
+            if attempt == llm_max_retries or not _is_retryable(e):
+                raise
+            if deadline is not None and loop.time() + delay > deadline:
+                raise
+            llm_retries_total.inc(error=type(e).__name__)
+            print(f"Chat completion failed with {e!r}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def _stream_completion(llm_client, state: dict, deadline: float = None, **kwargs):
+    """
+    Stream a chat completion, yielding ("token", text) events.
+    Stores the full content and the tool calls assembled from the streamed deltas in state.
+    Creating the completion is retried, see _create_completion, a stream that fails once it started isn't.
+    """
+    stream = await _create_completion(
+        llm_client, deadline, model="gpt-4o", stream=True, stream_options={"include_usage": True}, **kwargs
+    )
+
+    content = ""
+    tool_calls = {}
+    state["usage"] = None
+    async for chunk in _iterate(stream):
+        # With include_usage, the last chunk has the token counts and no choices
+        if getattr(chunk, "usage", None):
+            state["usage"] = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+
+        if delta.content:
+            content += delta.content
+            yield "token", delta.content
+
+        # Tool calls arrive in pieces: the id and the name first, then the arguments a few characters at a time
+        for tool_call_delta in delta.tool_calls or []:
+            tool_call = tool_calls.setdefault(
+                tool_call_delta.index,
+                SimpleNamespace(
+                    id="",
+                    function=SimpleNamespace(name="", arguments=""),
+                ),
+            )
+            if tool_call_delta.id:
+                tool_call.id = tool_call_delta.id
+            if tool_call_delta.function:
+                tool_call.function.name += tool_call_delta.function.name or ""
+                tool_call.function.arguments += tool_call_delta.function.arguments or ""
+
+    state["content"] = content
+    state["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+
+
+async def _iterate(stream):
+    """
+    Iterate over an async stream, or over a sync stream without blocking the event loop while waiting for chunks
+    """
+    if hasattr(stream, "__aiter__"):
+        async for chunk in stream:
+            yield chunk
+        return
+
+    iterator = iter(stream)
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, done)
+        if chunk is done:
+            break
+        yield chunk
@@ -0,0 +1,100 @@
+'''
+This file runs the embedding model in its own process, so several web workers share one copy of the model
+instead of each loading it in memory.
+
+Start it from the backend directory, then set ENCODER_ADDRESS in the .env file of the web workers:
+    python encoder_server.py --port 6001
+
+The connections carry pickled objects, so whoever can connect can run code in the other process. Both sides
+refuse to start without a secret ENCODER_AUTHKEY, and the server only listens on localhost unless --host says so.
+'''
+
+import argparse
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+
+
+def parse_address(address: str) -> tuple:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def authkey() -> bytes:
+    key = os.getenv("ENCODER_AUTHKEY")
+    if not key:
+        raise RuntimeError("Set ENCODER_AUTHKEY to a secret shared by the encoder process and the web workers")
+    return key.encode()
+
+
+class RemoteEncoder:
+    '''
+    Encodes texts with the encoder process, with the encode method of SentenceTransformer.
+    Each thread keeps its own connection, so concurrent requests don't wait for each other's round trips.
+    '''
+
+    def __init__(self, address: str):
+        self.address = parse_address(address)
+        self._authkey = authkey()
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = Client(self.address, authkey=self._authkey)
+        return self._local.connection
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        connection = self._connection()
+        try:
+            connection.send((sentences, batch_size))
+            result = connection.recv()
+        except (EOFError, OSError):
+            # The encoder was restarted, reconnect on the next call
+            self._local.connection = None
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def serve(address: tuple, model_name: str, backend: str):
+    from encoders import create_encoder
+
+    key = authkey()
+    model = create_encoder(backend, model_name)
+    listener = Listener(address, authkey=key)
+    print(f"Encoder {model_name} ({backend}) listening on {address[0]}:{address[1]}")
+
+    def handle(connection):
+        with connection:
+            while True:
+                try:
+                    sentences, batch_size = connection.recv()
+                except EOFError:
+                    return
+                try:
+                    connection.send(model.encode(sentences, batch_size=batch_size))
+                except Exception as e:
+                    connection.send(e)
+
+    while True:
+        connection = listener.accept()
+        threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared embedding model process")
+    parser.add_argument(
+        "--host", type=str, default="localhost", help="Interface to listen on, only expose it to trusted hosts"
+    )
+    parser.add_argument("--port", type=int, default=6001)
+    parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2")
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default=os.getenv("ENCODER_BACKEND", "sentence-transformers"),
+        help="sentence-transformers or onnx (default: ENCODER_BACKEND)",
+    )
+    args = parser.parse_args()
+
+    serve((args.host, args.port), args.model, args.backend)
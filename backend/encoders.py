@@ -0,0 +1,135 @@
+'''
+This file defines the encoders that turn documents and queries into embeddings.
+
+- "sentence-transformers" runs the model with PyTorch, like the collection was built with.
+- "onnx" runs the same model with ONNX Runtime, by default with its weights quantized to int8,
+  which is several times faster on CPU and needs less memory. Its embeddings are near-identical
+  (check with --verify), so a collection built with one backend can be queried with the other.
+
+Every encoder has the encode method of SentenceTransformer, and returns normalized embeddings.
+
+    python encoders.py --verify     compare the backends on documents from the collection
+    python encoders.py --reindex    re-encode the collection with ENCODER_BACKEND
+'''
+
+import argparse
+import os
+
+encoder_backends = ("sentence-transformers", "onnx")
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        return self.model.encode(sentences, batch_size=batch_size)
+
+
+class OnnxEncoder:
+    '''
+    Tokenizes with the model's tokenizer, runs the exported model with ONNX Runtime,
+    then mean-pools and normalizes the token embeddings like the sentence-transformers pipeline does
+    '''
+
+    def __init__(self, model_name: str, quantize: bool = True, cache_directory: str = "./onnx_models",
+                 max_length: int = 256):
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        repository = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        model_path = hf_hub_download(repository, "onnx/model.onnx")
+        if quantize:
+            model_path = self._quantized(model_path, os.path.join(cache_directory, repository.replace("/", "_")))
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repository, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    @staticmethod
+    def _quantized(model_path: str, directory: str) -> str:
+        '''
+        Quantize the weights to int8 once, and keep the quantized model for the next start
+        '''
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(directory, "model_int8.onnx")
+        if not os.path.exists(quantized_path):
+            os.makedirs(directory, exist_ok=True)
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        import numpy as np
+
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(sentences[start : start + batch_size])
+            inputs = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+
+        result = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        return result[0] if single else result
+
+
+def create_encoder(backend: str, model_name: str):
+    if backend == "onnx":
+        return OnnxEncoder(model_name, quantize=os.getenv("ENCODER_QUANTIZE", "1") == "1")
+    if backend == "sentence-transformers":
+        return SentenceTransformerEncoder(model_name)
+    raise ValueError(f"Unknown encoder backend {backend}, expected one of {', '.join(encoder_backends)}")
+
+
+def cosine_similarities(first, second) -> list:
+    '''
+    Row by row cosine similarity of two lists of embeddings
+    '''
+    import numpy as np
+
+    first, second = np.asarray(first, dtype=np.float32), np.asarray(second, dtype=np.float32)
+    dot = (first * second).sum(axis=1)
+    return list(dot / (np.linalg.norm(first, axis=1) * np.linalg.norm(second, axis=1)))
+
+
+if __name__ == "__main__":
+    import vector_db
+
+    parser = argparse.ArgumentParser(description="Embedding backends")
+    parser.add_argument("--verify", action="store_true", help="Compare every backend with sentence-transformers")
+    parser.add_argument("--reindex", action="store_true", help="Re-encode the collection with ENCODER_BACKEND")
+    parser.add_argument("--sample", type=int, default=200, help="Documents compared by --verify")
+    args = parser.parse_args()
+
+    if args.verify:
+        documents = vector_db.get_collection().get(include=["documents"], limit=args.sample)["documents"]
+        documents = documents or ["Refrigerator ice maker not making ice", "Dishwasher drain pump W10348269"]
+        reference = create_encoder("sentence-transformers", vector_db.embedding_model_name).encode(documents)
+        for backend in encoder_backends[1:]:
+            similarities = cosine_similarities(
+                reference, create_encoder(backend, vector_db.embedding_model_name).encode(documents)
+            )
+            print(
+                f"{backend}: cosine similarity with sentence-transformers over {len(documents)} documents, "
+                f"min {min(similarities):.4f}, mean {sum(similarities) / len(similarities):.4f}"
+            )
+
+    if args.reindex:
+        print(f"Re-encoded {vector_db.reindex_embeddings()} documents with {vector_db.encoder_backend}.")
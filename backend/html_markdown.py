@@ -0,0 +1,224 @@
+'''
+This file converts the HTML of browsed PartSelect pages to markdown in a single pass.
+
+The page is fed to the lxml HTML parser in chunks and the markdown is written from the parser events,
+without building a tree or an intermediate HTML string. Scripts, styles, menus, page headers, footers, forms and
+pop-ups are skipped, and only the main content region of the page is kept (the product or model details),
+or the whole body if the page has none. iter_markdown yields the markdown as the page is parsed.
+'''
+
+import re
+from urllib.parse import urljoin
+from lxml import etree
+
+# Elements skipped with everything inside them
+skipped_tags = {
+    "head", "script", "style", "noscript", "template", "svg", "iframe", "nav", "footer",
+    "form", "button", "input", "select", "textarea", "img", "picture", "video", "audio", "canvas",
+}
+
+# Elements skipped outside the main content region and articles, a header inside them holds the title of the product
+page_level_tags = {"header"}
+
+block_tags = {
+    "p", "div", "section", "article", "aside", "main", "ul", "ol", "li", "table", "thead", "tbody", "tfoot",
+    "tr", "dl", "dt", "dd", "blockquote", "pre", "figure", "figcaption", "address", "br", "hr",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+}
+
+heading_levels = {f"h{level}": level for level in range(1, 7)}
+
+# Elements whose text is collected first, then written with their markdown around it
+inline_tags = {"a", "strong", "b", "td", "th"}
+
+
+def is_main_region(tag: str, attributes: dict) -> bool:
+    return tag == "main" or attributes.get("id") == "main" or attributes.get("role") == "main"
+
+
+class MarkdownWriter:
+    '''
+    Target of the lxml parser, turns the parser events into markdown
+    '''
+
+    def __init__(self, base_url: str = None):
+        self.base_url = base_url
+        self._stack = []  # (tag, skipped, attributes) of the open elements
+        self._skip_depth = 0
+        self._buffers = [[]]  # the text of the open inline elements, on top of the output
+        self._region = "before"  # before, inside or after the main content region
+        self._main_depth = None
+        self._outside = []  # output before the main region, used when the page has none
+        self._output = []
+        self._at_line_start = True
+        self._list_stack = []
+        self._table_rows = []
+
+    # Parser events
+
+    def start(self, tag, attributes):
+        tag = tag.lower() if isinstance(tag, str) else ""
+        skipped = (
+            tag in skipped_tags
+            or (tag in page_level_tags and self._region != "inside" and not self._in_article())
+            or attributes.get("role") == "dialog"
+            or attributes.get("hidden") is not None
+        )
+        self._stack.append((tag, skipped, attributes))
+        if skipped or self._skip_depth:
+            self._skip_depth += 1
+            return
+
+        if self._region == "before" and is_main_region(tag, attributes):
+            self._region = "inside"
+            self._main_depth = len(self._stack)
+            self._at_line_start = True
+
+        if tag in block_tags:
+            self._newline()
+        if tag in heading_levels:
+            self._write("#" * heading_levels[tag] + " ")
+        elif tag in ("ul", "ol"):
+            self._list_stack.append([tag, 0])
+        elif tag == "li":
+            self._start_list_item()
+        elif tag == "tr":
+            self._table_rows.append([])
+        if tag in inline_tags:
+            self._buffers.append([])
+
+    def end(self, tag):
+        tag, skipped, attributes = self._stack.pop()
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+
+        if tag in inline_tags:
+            text = self._collapse("".join(self._buffers.pop()))
+            if tag == "a":
+                href = attributes.get("href")
+                if href and self.base_url:
+                    href = urljoin(self.base_url, href)
+                if text:
+                    self._write(f"[{text}]({href})" if href and not href.startswith("javascript:") else text)
+            elif tag in ("strong", "b"):
+                if text:
+                    self._write(f"**{text}**")
+            elif self._table_rows:
+                self._table_rows[-1].append(text)
+        elif tag == "tr":
+            self._write_table_row()
+        elif tag in ("ul", "ol") and self._list_stack:
+            self._list_stack.pop()
+        elif tag == "table":
+            self._table_rows = []
+
+        if tag in block_tags:
+            self._newline()
+        if self._main_depth is not None and len(self._stack) < self._main_depth:
+            self._region = "after"
+            self._main_depth = None
+
+    def data(self, text):
+        if self._skip_depth:
+            return
+        if any(tag == "pre" for tag, _, _ in self._stack):
+            self._write(text)
+            return
+        text = re.sub(r"\s+", " ", text)
+        if self._at_line_start and len(self._buffers) == 1:
+            text = text.lstrip()
+        if text:
+            self._write(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        if self._region == "before":
+            self._output, self._region = self._outside, "after"
+        self._outside = []
+
+    def drain(self) -> str:
+        '''
+        Returns the markdown written since the last call
+        '''
+        if self._region == "before":
+            return ""
+        chunk = "".join(self._output)
+        self._output = []
+        return chunk
+
+    def _in_article(self) -> bool:
+        return any(tag == "article" for tag, _, _ in self._stack)
+
+    # Writing
+
+    def _write(self, text: str):
+        if len(self._buffers) > 1:
+            self._buffers[-1].append(text)
+            return
+        if self._region == "inside":
+            self._output.append(text)
+        elif self._region == "before":
+            self._outside.append(text)
+        else:
+            return
+        self._at_line_start = text.endswith("\n")
+
+    def _newline(self):
+        if len(self._buffers) > 1:
+            self._buffers[-1].append(" ")
+        elif not self._at_line_start:
+            # Strip the spaces at the end of the line
+            target = self._output if self._region == "inside" else self._outside
+            if target:
+                target[-1] = target[-1].rstrip(" ")
+            self._write("\n")
+
+    def _start_list_item(self):
+        if self._list_stack and self._list_stack[-1][0] == "ol":
+            self._list_stack[-1][1] += 1
+            bullet = f"{self._list_stack[-1][1]}. "
+        else:
+            bullet = "* "
+        self._write("  " * max(len(self._list_stack) - 1, 0) + bullet)
+
+    def _write_table_row(self):
+        row = self._table_rows[-1]
+        if not any(row):
+            self._table_rows.pop()
+            return
+        self._newline()
+        self._write("| " + " | ".join(cell.replace("|", "\\|") for cell in row) + " |\n")
+        if len(self._table_rows) == 1:
+            self._write("|" + " --- |" * len(row) + "\n")
+
+    @staticmethod
+    def _collapse(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip()
+
+
+def iter_markdown(html_content: str, base_url: str = None, chunk_size: int = 65536):
+    '''
+    Converts html to markdown, yields the markdown of the main content region as it is parsed.
+    Relative links are resolved against base_url if given.
+    '''
+    if not html_content or not html_content.strip():
+        return
+    writer = MarkdownWriter(base_url)
+    parser = etree.HTMLParser(target=writer, remove_comments=True, remove_pis=True)
+    for i in range(0, len(html_content), chunk_size):
+        parser.feed(html_content[i : i + chunk_size])
+        chunk = writer.drain()
+        if chunk:
+            yield chunk
+    parser.close()
+    chunk = writer.drain()
+    if chunk:
+        yield chunk
+
+
+def html_to_markdown(html_content: str, base_url: str = None) -> str:
+    markdown_content = "".join(iter_markdown(html_content, base_url))
+    return re.sub(r"\n{3,}", "\n\n", markdown_content).strip() + "\n"
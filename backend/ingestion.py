@@ -0,0 +1,106 @@
+'''
+This file batches the ingestion of crawled product pages into the vector database.
+
+Product information is extracted from up to max_extractions pages at the same time, the extracted products are
+buffered, and every batch_size products are encoded together and written with a single upsert.
+Each submitted page gets a Future that completes once its product is in the database,
+so the crawler only marks a page as done after it has been written.
+'''
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from vector_db import add_products_to_vector_db, extract_product_info
+
+
+class IngestionPipeline:
+    def __init__(self, llm_client, batch_size: int = 32, max_extractions: int = 8):
+        self.llm_client = llm_client
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max_extractions, thread_name_prefix="extract")
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._buffer = []
+        self._extractions = []
+        self.stats = {
+            "submitted": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "extract_seconds": 0.0,
+            "write_seconds": 0.0,
+        }
+
+    def submit(self, markdown_content: str, url: str) -> Future:
+        '''
+        Queue a product page for extraction, returns a Future with the PartSelect number once it is written
+        '''
+        written = Future()
+        with self._lock:
+            self.stats["submitted"] += 1
+            self._extractions = [extraction for extraction in self._extractions if not extraction.done()]
+            self._extractions.append(self._executor.submit(self._extract, markdown_content, url, written))
+        return written
+
+    def _extract(self, markdown_content: str, url: str, written: Future):
+        start = time.perf_counter()
+        try:
+            product_info = extract_product_info(markdown_content, url, self.llm_client)
+            if not product_info or not product_info.get("PartSelect Number"):
+                raise ValueError(f"Could not extract the product information from {url}")
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            written.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self.stats["extract_seconds"] += time.perf_counter() - start
+
+        with self._lock:
+            self._buffer.append((product_info, written))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        '''
+        Encode and write the buffered products
+        '''
+        # One batch is written at a time, a thread that fills the next batch waits for the previous write
+        with self._write_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            try:
+                add_products_to_vector_db([product_info for product_info, _ in batch], self.batch_size)
+            except Exception as e:
+                with self._lock:
+                    self.stats["failed"] += len(batch)
+                for _, written in batch:
+                    written.set_exception(e)
+                return
+
+            with self._lock:
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["write_seconds"] += time.perf_counter() - start
+            for product_info, written in batch:
+                written.set_result(product_info["PartSelect Number"])
+
+    def close(self):
+        '''
+        Wait for the pending extractions and write what is left in the buffer
+        '''
+        while True:
+            with self._lock:
+                extractions, self._extractions = self._extractions, []
+            if not extractions:
+                break
+            for extraction in extractions:
+                extraction.result()
+        self.flush()
+        self._executor.shutdown()
@@ -0,0 +1,130 @@
+'''
+This file keeps a BM25 keyword index over the documents in the vector database.
+
+Embeddings are weak at exact alphanumeric tokens like model and part numbers, which is what customers type the most,
+so the keyword results are fused with the vector results in vector_db.query_chroma.
+The index lives in memory, it is built from the collection on startup and updated whenever products are added.
+'''
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+
+def tokenize(text: str) -> list:
+    '''
+    Lowercase words, part numbers are also indexed without their dashes, slashes and dots
+    so "DA97-12540G" matches both "DA9712540G" and "DA97-12540G"
+    '''
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*", text.lower()):
+        parts = re.split(r"[-/.]", word)
+        tokens += parts
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # term -> {document id: term frequency}
+        self._lengths = {}  # document id -> number of tokens
+        self._terms = {}  # document id -> its distinct terms, to remove it without scanning every posting list
+        self._total_length = 0
+
+    def add(self, document_id: str, text: str):
+        '''
+        Index a document, replacing the previous version with the same id
+        '''
+        frequencies = Counter(tokenize(text))
+        with self._lock:
+            self._remove(document_id)
+            for term, frequency in frequencies.items():
+                self._postings[term][document_id] = frequency
+            length = sum(frequencies.values())
+            self._terms[document_id] = list(frequencies)
+            self._lengths[document_id] = length
+            self._total_length += length
+
+    def add_many(self, document_ids: list, texts: list):
+        for document_id, text in zip(document_ids, texts):
+            self.add(document_id, text)
+
+    def remove(self, document_id: str):
+        with self._lock:
+            self._remove(document_id)
+
+    def _remove(self, document_id: str):
+        if document_id not in self._lengths:
+            return
+        self._total_length -= self._lengths.pop(document_id)
+        for term in self._terms.pop(document_id):
+            del self._postings[term][document_id]
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def search(self, query: str, top_n: int = 10) -> list:
+        '''
+        Returns (document id, score) of the best matching documents, best first
+        '''
+        with self._lock:
+            count = len(self._lengths)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for document_id, frequency in postings.items():
+                    length_norm = 1 - self.b + self.b * self._lengths[document_id] / average_length
+                    scores[document_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._lengths)
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60, weights: list = None) -> list:
+    '''
+    Fuse several lists of document ids, best first, by the sum of weight / (k + rank) in each list
+    '''
+    weights = weights or [1.0] * len(rankings)
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, document_id in enumerate(ranking, start=1):
+            scores[document_id] += weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def weighted_fusion(vector_results: list, lexical_results: list, lexical_weight: float = 0.5) -> list:
+    '''
+    Fuse (document id, distance) vector results and (document id, score) keyword results
+    by a weighted sum of their scores, each scaled to [0, 1]
+    '''
+    def scaled(results: list, higher_is_better: bool) -> dict:
+        if not results:
+            return {}
+        values = [value for _, value in results]
+        low, high = min(values), max(values)
+        span = (high - low) or 1.0
+        return {
+            document_id: (value - low) / span if higher_is_better else (high - value) / span
+            for document_id, value in results
+        }
+
+    vector_scores = scaled(vector_results, higher_is_better=False)
+    lexical_scores = scaled(lexical_results, higher_is_better=True)
+    scores = {
+        document_id: (1 - lexical_weight) * vector_scores.get(document_id, 0.0)
+        + lexical_weight * lexical_scores.get(document_id, 0.0)
+        for document_id in {**vector_scores, **lexical_scores}
+    }
+    return sorted(scores, key=scores.get, reverse=True)
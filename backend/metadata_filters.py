@@ -0,0 +1,123 @@
+'''
+This file classifies products and questions by appliance type, brand and part category.
+
+When products are added, product_attributes gives the metadata stored with them in Chroma. When the database is
+queried, where_filter reads the same attributes from the question with keyword lookups, no model call, and turns them
+into a Chroma where filter, so a question about a Whirlpool fridge is only compared with the Whirlpool refrigerator
+parts. A part category is only used when the question names a single one and also names the appliance or a model,
+and model numbers the compatibility index knows restrict the search to the parts that fit the model.
+Brands are stored as one boolean per brand (brand_whirlpool: true), Chroma metadata values can't be lists.
+'''
+
+import re
+from compatibility_index import MODEL
+
+appliance_keywords = {
+    "refrigerator": ("refrigerator", "fridge", "freezer"),
+    "dishwasher": ("dishwasher", "dish washer"),
+}
+
+brands = (
+    "Admiral", "Amana", "Beko", "Blomberg", "Bosch", "Crosley", "Dacor", "Electrolux", "Frigidaire", "Gaggenau", "GE",
+    "Haier", "Hotpoint", "Jenn-Air", "Kenmore", "KitchenAid", "LG", "Magic Chef", "Maytag", "Miele", "Samsung",
+    "Sharp", "Sub-Zero", "Thermador", "Viking", "Whirlpool",
+)
+
+# A product gets the first category whose keywords are in its name, the specific ones come first
+categories = (
+    ("water filter", ("water filter", "filter")),
+    ("ice maker", ("ice maker", "ice bucket", "icemaker")),
+    ("valve", ("valve",)),
+    ("pump", ("pump",)),
+    ("gasket", ("gasket", "seal")),
+    ("spray arm", ("spray arm", "wash arm")),
+    ("rack", ("rack", "dishrack", "roller", "wheel")),
+    ("shelf", ("shelf", "bin", "drawer", "crisper")),
+    ("motor", ("motor", "fan")),
+    ("control", ("control board", "board", "control", "timer")),
+    ("thermostat", ("thermostat", "sensor", "thermistor")),
+    ("heater", ("heater", "heating element", "defrost")),
+    ("light", ("light", "bulb", "lamp")),
+    ("hose", ("hose", "tube")),
+    ("switch", ("switch",)),
+    ("latch", ("latch", "hinge", "handle")),
+    ("dispenser", ("dispenser",)),
+)
+
+_brand_patterns = [
+    (brand, re.compile(r"\b" + re.escape(brand).replace(r"\-", r"[\- ]?") + r"\b", re.IGNORECASE)) for brand in brands
+]
+
+
+def brand_key(brand: str) -> str:
+    return "brand_" + re.sub(r"[^a-z0-9]", "", brand.lower())
+
+
+def _contains(text: str, keyword: str) -> bool:
+    return re.search(r"\b" + re.escape(keyword) + r"s?\b", text) is not None
+
+
+def find_appliance(text: str) -> str:
+    text = text.lower()
+    found = [appliance for appliance, keywords in appliance_keywords.items() if any(_contains(text, k) for k in keywords)]
+    # A question about both appliances isn't restricted to either
+    return found[0] if len(found) == 1 else ""
+
+
+def find_brands(text: str) -> list:
+    return [brand for brand, pattern in _brand_patterns if pattern.search(text)]
+
+
+def find_categories(text: str) -> list:
+    text = text.lower()
+    return [category for category, keywords in categories if any(_contains(text, keyword) for keyword in keywords)]
+
+
+def product_attributes(product_info: dict) -> dict:
+    '''
+    The appliance type, part category and brands of an extracted product, as Chroma metadata
+    '''
+    name = str(product_info.get("Product Name") or "")
+    works_with = " ".join(str(item) for item in product_info.get("This part works with the following products") or [])
+    attributes = {
+        "appliance": find_appliance(f"{works_with} {name}"),
+        "category": (find_categories(name) or [""])[0],
+    }
+    manufacturers = [product_info.get("Manufactured by") or ""] + list(product_info.get("Manufactured for") or [])
+    for brand in find_brands(" | ".join(str(manufacturer) for manufacturer in manufacturers)):
+        attributes[brand_key(brand)] = True
+    return attributes
+
+
+def where_filter(query: str, compatibility_index=None) -> dict:
+    '''
+    Returns the Chroma where filter for the appliance type, brands, part category and known models of the query,
+    or None if the query mentions none of them
+    '''
+    conditions = []
+    appliance = find_appliance(query)
+    if appliance:
+        conditions.append({"appliance": appliance})
+    brand_conditions = [{brand_key(brand): True} for brand in find_brands(query)]
+    if len(brand_conditions) == 1:
+        conditions += brand_conditions
+    elif brand_conditions:
+        conditions.append({"$or": brand_conditions})
+
+    parts = set()
+    if compatibility_index is not None:
+        for identifier in compatibility_index.find_identifiers(query):
+            parts.update(part for part, kind in compatibility_index.parts_for(identifier).items() if kind == MODEL)
+
+    # Category keywords like "filter", "fan" or "light" are common words, they only narrow the search of a question
+    # that also names the appliance or a known model.
+    # "the ice maker doesn't fill, is it the water valve?" names a symptom and a part, only one category is reliable
+    found_categories = find_categories(query)
+    if len(found_categories) == 1 and (appliance or parts):
+        conditions.append({"category": found_categories[0]})
+    if parts:
+        conditions.append({"partselect_number": {"$in": sorted(parts)}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
@@ -0,0 +1,231 @@
+'''
+This file collects the metrics of the agent and renders them in the Prometheus text format for /api/metrics.
+
+Stages are timed with span(stage), which records the duration in the partselect_stage_seconds histogram and,
+when a request is being traced, in the trace of the request. A trace lists the spans of one request with their
+start offsets and durations, and is written to the logs when TRACE_LOG is set: to stdout with TRACE_LOG=1,
+or appended as JSON lines to the file TRACE_LOG points to.
+The stats dicts of the caches and pools are exposed as counters with register_stats.
+'''
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+trace_log = os.getenv("TRACE_LOG")
+_trace_log_lock = threading.Lock()
+
+_metrics = []
+_stats_sources = []
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge:
+    '''
+    A value read when the metrics are rendered, from a function returning {label values: value}
+    '''
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.function = function
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.function().items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = default_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            values = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            snapshot = {key: list(values) for key, values in self._values.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, values in sorted(snapshot.items()):
+            for bound, count in zip(self.buckets, values):
+                bucket_labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            bucket_labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {values[-1]}")
+        return lines
+
+
+def counter(name: str, documentation: str, labels: tuple = ()) -> Counter:
+    metric = Counter(name, documentation, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name: str, documentation: str, function, labels: tuple = ()) -> Gauge:
+    metric = Gauge(name, documentation, labels, function)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, labels: tuple = (), buckets: tuple = default_buckets) -> Histogram:
+    metric = Histogram(name, documentation, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_stats(name: str, documentation: str, get_stats):
+    '''
+    Expose a stats dict of counters as the counter name{event="..."}, get_stats returns the dict or None
+    '''
+    _stats_sources.append((name, documentation, get_stats))
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    for name, documentation, get_stats in _stats_sources:
+        stats = get_stats()
+        if not stats:
+            continue
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} counter"]
+        for event, value in sorted(stats.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{name}{{event="{_escape(event)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = histogram("partselect_stage_seconds", "Duration of each stage of a request", ("stage",))
+
+
+class RequestTrace:
+    '''
+    The spans of one request. Functions run in worker threads need run(), contextvars don't follow them there.
+    '''
+
+    def __init__(self, name: str, **attributes):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.spans = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, seconds: float, attributes: dict):
+        with self._lock:
+            self.spans.append(
+                {
+                    "stage": stage,
+                    "start_ms": round((start - self._start) * 1000, 2),
+                    "duration_ms": round(seconds * 1000, 2),
+                    **attributes,
+                }
+            )
+
+    def span(self, stage: str, **attributes):
+        return span(stage, trace=self, **attributes)
+
+    def run(self, function, *args):
+        token = _current_trace.set(self)
+        try:
+            return function(*args)
+        finally:
+            _current_trace.reset(token)
+
+    def finish(self, **attributes):
+        self.attributes.update(attributes)
+        if not trace_log:
+            return
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        record = json.dumps(
+            {
+                "trace": self.id,
+                "name": self.name,
+                "duration_ms": round((time.perf_counter() - self._start) * 1000, 2),
+                **self.attributes,
+                "spans": spans,
+            }
+        )
+        if trace_log == "1":
+            print(f"Trace {record}")
+            return
+        with _trace_log_lock, open(trace_log, "a") as file:
+            file.write(record + "\n")
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str, trace: RequestTrace = None, **attributes):
+    '''
+    Times a stage, the attributes are added to the span in the trace
+    '''
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=stage)
+        trace = trace or _current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, seconds, attributes)
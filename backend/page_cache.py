@@ -0,0 +1,140 @@
+'''
+This file caches the markdown of browsed PartSelect pages, so repeated lookups of the same part skip the browser
+and the html to markdown conversion.
+
+Entries expire after a TTL. The in-memory tier is a bounded LRU, and an optional SQLite tier keeps entries across restarts.
+Concurrent lookups of the same key are de-duplicated: only the first caller computes the value, the others wait for its result.
+'''
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class PageCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, disk_path: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> Future of the lookup computing the value
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "coalesced": 0,
+        }
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS page_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str):
+        '''
+        Returns the cached value, or None if the key is missing or expired
+        '''
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.stats["misses"] += 1
+            return value
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_in_memory(key, value, expires_at)
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO page_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._db.execute("DELETE FROM page_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def get_or_compute(self, key: str, compute):
+        '''
+        Returns the cached value for key, calling compute() on a miss.
+        If another thread is already computing the same key, wait for its result instead of computing it again.
+        Exceptions raised by compute() are passed to every waiting caller and nothing is cached.
+        '''
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                # The previous owner may have cached the value and left since the lookup above
+                value = self._lookup(key)
+                if value is not None:
+                    return value
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db:
+                self._db.execute("DELETE FROM page_cache")
+                self._db.commit()
+
+    def _lookup(self, key: str):
+        '''
+        Returns the cached value from the memory or the disk tier, or None. Must be called with the lock held.
+        '''
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            del self._entries[key]
+            self.stats["expirations"] += 1
+
+        if self._db:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM page_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                # Promote to the memory tier with the remaining TTL
+                self._store_in_memory(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                return row[0]
+        return None
+
+    def _store_in_memory(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
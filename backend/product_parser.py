@@ -0,0 +1,203 @@
+'''
+This file extracts product information from the markdown of a PartSelect product page with plain string parsing,
+so most products don't need an LLM call during the crawl.
+
+It returns the same fields as the LLM extraction in vector_db.py, plus the compatible models from the cross reference
+and a confidence score. Pages the parser isn't confident about should still go through the LLM.
+'''
+
+import re
+
+label_fields = {
+    "product description": "Product Description",
+    "this part fixes the following symptoms": "This part fixes the following symptoms",
+    "this part works with the following products": "This part works with the following products",
+    "part replaces these": "Part replaces these",
+}
+
+# Headings of page sections that end the value of a label
+section_names = (
+    "troubleshooting",
+    "model cross reference",
+    "related parts",
+    "questions and answers",
+    "customer reviews",
+    "repair stories",
+    "installation instructions",
+    "frequently bought together",
+    "part videos",
+)
+
+# How much each field contributes to the confidence of a parsed page
+field_weights = {
+    "PartSelect Number": 0.3,
+    "Manufacturer Part Number": 0.2,
+    "Product Name": 0.15,
+    "Manufactured by": 0.1,
+    "Product Description": 0.1,
+    "This part fixes the following symptoms": 0.05,
+    "This part works with the following products": 0.05,
+    "Part replaces these": 0.05,
+}
+
+model_pattern = re.compile(r"^(?=[A-Z0-9\-/.]*\d)(?=[A-Z0-9\-/.]*[A-Z])[A-Z0-9][A-Z0-9\-/.]{4,}$")
+
+
+def clean_line(line: str) -> str:
+    '''
+    Remove markdown images, link targets, emphasis and list bullets from a line
+    '''
+    line = re.sub(r"!\[[^\]]*\]\((?:<[^>]*>|[^)]*)\)", "", line)
+    line = re.sub(r"\[([^\]]*)\]\((?:<[^>]*>|[^)]*)\)", r"\1", line)
+    line = line.replace("*", "").replace("`", "").replace("\\", "")
+    line = re.sub(r"^\s*(?:>\s*)?(?:[-+]\s+)?", "", line)
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def _label_of(line: str):
+    '''
+    Returns (label, value on the same line) if the line starts with one of the labels
+    '''
+    text = line.lstrip("#").strip()
+    for label in label_fields:
+        if text.lower().startswith(label):
+            return label, text[len(label):].lstrip(" :").strip()
+    return None, None
+
+
+def _is_boundary(line: str) -> bool:
+    text = line.lstrip("#").strip().lower().rstrip(":")
+    return (
+        line.startswith("#")
+        or _label_of(line)[0] is not None
+        or text.startswith(section_names)
+    )
+
+
+def _split_list(text: str) -> list:
+    separator = "|" if "|" in text else ","
+    items = [item.strip().rstrip(".").strip() for item in text.split(separator)]
+    return [item for item in items if item]
+
+
+def _label_values(lines: list, max_lines: int = 12) -> dict:
+    '''
+    Collect the text that follows each label, up to the next label or section heading
+    '''
+    values = {}
+    for i, line in enumerate(lines):
+        label, value = _label_of(line)
+        if not label or label in values:
+            continue
+        collected = [value] if value else []
+        for following in lines[i + 1 : i + 1 + max_lines]:
+            if _is_boundary(following):
+                break
+            collected.append(following)
+        values[label] = collected
+    return values
+
+
+def _section_lines(raw_lines: list, name: str) -> list:
+    '''
+    The raw lines of the section whose heading or title contains name
+    '''
+    section = []
+    inside = False
+    for line in raw_lines:
+        cleaned = clean_line(line)
+        if name in cleaned.lower() and len(cleaned) < 60:
+            inside = True
+            continue
+        if inside:
+            if cleaned.startswith("#") or cleaned.lower().lstrip("# ").startswith(section_names):
+                break
+            section.append(line)
+    return section
+
+
+def _compatible_models(raw_lines: list) -> list:
+    '''
+    Model numbers listed in the model cross reference, they are usually links to the model pages
+    '''
+    models = []
+    for line in _section_lines(raw_lines, "model cross reference"):
+        links = re.findall(r"\[([^\]]+)\]\(", line)
+        if links:
+            candidates = [link for link in links if re.fullmatch(r"[A-Z0-9][A-Z0-9\-/.]{3,}", link.strip())]
+        else:
+            candidates = [cell for cell in clean_line(line).split("|")[:2] if model_pattern.match(cell.strip())]
+        for candidate in candidates:
+            candidate = candidate.strip()
+            if candidate not in models:
+                models.append(candidate)
+    return models
+
+
+def parse_product_markdown(markdown_content: str) -> dict:
+    '''
+    Parse the markdown of a product page into the product fields.
+    The result has a "confidence" between 0 and 1 that says how many of the expected fields were found.
+    '''
+    raw_lines = markdown_content.splitlines()
+    lines = [line for line in (clean_line(line) for line in raw_lines) if line]
+    text = "\n".join(lines)
+
+    product = {
+        "Product Name": "",
+        "Product Description": "",
+        "PartSelect Number": "",
+        "Manufacturer Part Number": "",
+        "Manufactured by": "",
+        "Manufactured for": [],
+        "This part fixes the following symptoms": [],
+        "This part works with the following products": [],
+        "Part replaces these": [],
+        "Compatible Models": [],
+    }
+
+    match = re.search(r"PartSelect Number\s*:?\s*(PS\d{5,})", text, re.IGNORECASE)
+    if match:
+        product["PartSelect Number"] = match.group(1).upper()
+
+    match = re.search(r"Manufacturer Part Number\s*:?\s*([A-Za-z0-9][A-Za-z0-9\-./]*)", text, re.IGNORECASE)
+    if match:
+        product["Manufacturer Part Number"] = match.group(1)
+
+    match = re.search(r"Manufactured by\s*:?\s*([^\n]+?)\s+for\s+([^\n]+)", text, re.IGNORECASE)
+    if match:
+        product["Manufactured by"] = match.group(1).strip()
+        product["Manufactured for"] = _split_list(match.group(2))
+    else:
+        match = re.search(r"Manufactured by\s*:?\s*([^\n]+)", text, re.IGNORECASE)
+        if match:
+            product["Manufactured by"] = match.group(1).strip()
+
+    # Without a "for" the part is made for its own brand
+    if product["Manufactured by"] and not product["Manufactured for"]:
+        product["Manufactured for"] = [product["Manufactured by"]]
+
+    # The product name is the first top-level heading, without the brand and the manufacturer part number in it
+    for line in lines:
+        if line.startswith("# "):
+            name = line[2:].strip()
+            if product["Manufacturer Part Number"]:
+                name = name.replace(product["Manufacturer Part Number"], "")
+            if product["Manufactured by"] and name.startswith(product["Manufactured by"] + " "):
+                name = name[len(product["Manufactured by"]) :]
+            product["Product Name"] = re.sub(r"\s+", " ", name).strip(" -|")
+            break
+
+    for label, values in _label_values(lines).items():
+        field = label_fields[label]
+        if field == "Product Description":
+            product[field] = " ".join(values).strip()
+        else:
+            product[field] = [item for value in values for item in _split_list(value)]
+
+    product["Compatible Models"] = _compatible_models(raw_lines)
+
+    product["confidence"] = round(
+        sum(weight for field, weight in field_weights.items() if product[field]), 2
+    )
+    return product
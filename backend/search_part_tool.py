@@ -2,65 +2,185 @@
 This file is responsible for browsing the part select website, give a product number.
 """
 
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
-from markdownify import markdownify
+from browser_pool import BrowserPool
+from html_markdown import html_to_markdown as convert_html
+from metrics import counter, register_stats, span
+from page_cache import PageCache
+from url_resolver import fetch_page, learn_url, normalize_search_term, resolve_url
+from collections import deque
+import atexit
+import os
+import re
+import threading
 import time
 
+partselect_url = os.getenv("PARTSELECT_URL", "https://www.partselect.com/")
+
+# Seconds a search may take, including the time spent waiting for a free browser
+search_timeout = float(os.getenv("BROWSER_SEARCH_TIMEOUT", 30))
+
+
+def dismiss_popups(page):
+    '''
+    If pop-up's appear, find the decline button and close the pop-up window so that we can use the search box
+    '''
+    decline_button_locator = page.locator(
+        "button[aria-label='Decline; close the dialog']"
+    )
+    for i in range(decline_button_locator.count()):
+        if decline_button_locator.nth(i).is_visible():
+            print(f"Clicking decline button {i + 1}...")
+            decline_button_locator.nth(i).click()
+            time.sleep(0.5)
+
+
+def warm_up(page):
+    '''
+    Load the home page once on a freshly launched browser so cookies are set and pop-ups are already dismissed
+    '''
+    page.goto(partselect_url, timeout=10000)
+    page.wait_for_load_state("networkidle")
+    dismiss_popups(page)
+
+
+"""
+NOTE: The browsers are not launched in headless mode because PartSelect seems to detect it and denies access.
+Set BROWSER_HEADLESS=1 when browsing a site that allows it, e.g. the local fixture server used by the benchmarks.
+"""
+browser_pool = BrowserPool(
+    size=int(os.getenv("BROWSER_POOL_SIZE", 2)),
+    max_uses=int(os.getenv("BROWSER_POOL_MAX_USES", 50)),
+    headless=os.getenv("BROWSER_HEADLESS") == "1",
+    warmup=warm_up,
+)
+atexit.register(browser_pool.shutdown)
+register_stats("partselect_browser_pool_total", "Browser pool events", lambda: browser_pool.stats)
+
+# Markdown of recently searched pages, shared by all sessions. Set PAGE_CACHE_PATH to keep it across restarts.
+page_cache = PageCache(
+    max_entries=int(os.getenv("PAGE_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("PAGE_CACHE_TTL", 3600)),
+    disk_path=os.getenv("PAGE_CACHE_PATH") or None,
+)
+register_stats("partselect_page_cache_total", "Page cache lookups", lambda: page_cache.stats)
+
+# Functions called with (markdown, url) for every page fetched from PartSelect, e.g. WriteBackQueue.submit.
+# They run on the request path and must return quickly.
+page_listeners = []
+
 
 def search_partselect(search_term: str) -> str:
     """
     Crawl through the PartSelect website to retrieve information about a specific part or model number
     """
-    with sync_playwright() as playwright:
-        # Launch a new browser instance
-        browser = playwright.chromium.launch(headless=False)
-        page = browser.new_page()
-        """
-        NOTE: There is room for optimization here. 
-        The browser is not launched in headless mode because PartSelect seems to detect it and denies access.  
-        If PartSelect's headless browser detection can be circumvented, it'd take significantly less resources to launch a browser instance.
-        """
+    try:
+        with span("search_partselect"):
+            return page_cache.get_or_compute(
+                normalize_search_term(search_term), lambda: fetch_part_page(search_term)
+            )
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return "An error has occurred during searching Part Select."
 
-        try:
-            page.goto("https://www.partselect.com/", timeout=10000)
-            page.wait_for_load_state("networkidle")
 
-            # If pop-up's appear, find the decline button and close the pop-up window so that we can use the search box
-            decline_button_locator = page.locator(
-                "button[aria-label='Decline; close the dialog']"
-            )
-            for i in range(decline_button_locator.count()):
-                if decline_button_locator.nth(i).is_visible():
-                    print(f"Clicking decline button {i + 1}...")
-                    decline_button_locator.nth(i).click()
-                    time.sleep(0.5)
+def fetch_part_page(search_term: str) -> str:
+    '''
+    Retrieve the page for the search term in markdown format, raises an exception if it couldn't be retrieved
+    '''
+    start = time.perf_counter()
+
+    # Fast path: fetch the product or model page directly if we already know its url
+    url = resolve_url(search_term)
+    if url:
+        with span("fast_path_fetch"):
+            html_content = fetch_page(url)
+        if html_content:
+            record_search("fast_path", time.perf_counter() - start)
+            markdown_content = html_to_markdown(html_content, url)
+            notify_page_listeners(markdown_content, url)
+            return markdown_content
+
+    with span("browser_search"):
+        result = browser_pool.run(
+            lambda page: search_with_page(page, search_term), timeout=search_timeout
+        )
+    record_search("browser", time.perf_counter() - start, fast_path_miss=bool(url))
+    return result
+
+
+def search_with_page(page, search_term: str) -> str:
+    '''
+    Search PartSelect for the search_term on the given page, return the resulting site in markdown format
+    '''
+    page.goto(partselect_url, timeout=10000)
+    page.wait_for_load_state("networkidle")
+    dismiss_popups(page)
+
+    # Wait for the search box to be available, enter the search_term and hit the search button
+    page.wait_for_selector("#searchboxInput", timeout=10000)
+    page.fill("#searchboxInput", search_term)
+    with page.expect_navigation(timeout=10000):
+        page.click("button.btn--teal")
 
-            # Wait for the search box to be available, enter the search_term and hit the search button
-            page.wait_for_selector("#searchboxInput", timeout=10000)
-            page.fill("#searchboxInput", search_term)
-            with page.expect_navigation(timeout=10000):
-                page.click("button.btn--teal")
+    # Remember where the search landed so the next search for this term can skip the browser,
+    # only for pages of the site we search, not the ones a redirect or an ad led to
+    if page.url.startswith(partselect_url) and re.search(r"/PS\d+.*\.htm|/Models/", page.url):
+        learn_url(search_term, page.url)
+
+    markdown_content = html_to_markdown(page.content(), page.url)
+    notify_page_listeners(markdown_content, page.url)
+    return markdown_content
 
-            # return the resulting site in markdown format
-            return html_to_markdown(page.content())
 
+def notify_page_listeners(markdown_content: str, url: str):
+    for listener in page_listeners:
+        try:
+            listener(markdown_content, url)
         except Exception as e:
-            print(f"An error occurred: {e}")
-            return "An error has occurred during searching Part Select."
+            print(f"A page listener failed on {url}: {e}")
+
+
+# Latency of the recent searches, split by whether they were served by a direct fetch or by the browser
+search_stats = {
+    "fast_path": deque(maxlen=1000),
+    "browser": deque(maxlen=1000),
+    "fast_path_misses": 0,
+}
+_stats_lock = threading.Lock()
+searches_total = counter("partselect_searches_total", "PartSelect searches by path", ("path",))
 
-        finally:
-            browser.close()
 
+def record_search(path: str, seconds: float, fast_path_miss: bool = False):
+    with _stats_lock:
+        search_stats[path].append(seconds)
+        if fast_path_miss:
+            search_stats["fast_path_misses"] += 1
+    searches_total.inc(path=path)
+    print(f"Searched PartSelect through the {path.replace('_', ' ')} in {seconds:.2f}s")
 
-def html_to_markdown(html_content: str) -> str:
+
+def get_search_stats() -> dict:
     '''
-    Convert html to easily readable markdown format
+    Returns the fast path hit rate and the median latency of each path in milliseconds
     '''
-    soup = BeautifulSoup(html_content, "html.parser")
-    for script_or_style in soup(["script", "style"]):
-        script_or_style.extract()
-    cleaned_html = soup.prettify()
+    with _stats_lock:
+        fast_path, browser = sorted(search_stats["fast_path"]), sorted(search_stats["browser"])
+        misses = search_stats["fast_path_misses"]
 
-    markdown_content = markdownify(cleaned_html, heading_style="ATX")
-    return markdown_content
+    total = len(fast_path) + len(browser)
+    return {
+        "searches": total,
+        "fast_path_hits": len(fast_path),
+        "fast_path_misses": misses,
+        "fast_path_hit_rate": len(fast_path) / total if total else 0.0,
+        "fast_path_p50_ms": fast_path[len(fast_path) // 2] * 1000 if fast_path else 0.0,
+        "browser_p50_ms": browser[len(browser) // 2] * 1000 if browser else 0.0,
+    }
+
+
+def html_to_markdown(html_content: str, url: str = None) -> str:
+    '''
+    Convert html to easily readable markdown format, only the main content of the page is kept
+    '''
+    with span("html_to_markdown"):
+        return convert_html(html_content, base_url=url or partselect_url)
@@ -0,0 +1,316 @@
+'''
+This file exports the vector database to a snapshot file and imports it, so a new server can be bootstrapped
+without crawling PartSelect and extracting every product again, and without re-encoding the documents.
+
+A snapshot is a single file:
+    magic (8 bytes) | header length (8 bytes, little endian) | JSON header | padding
+    embeddings: float16 array of count x dimensions, little endian, at a 64 byte aligned offset
+    records: zlib compressed JSON of the ids, documents, metadata and compatibility data of the products
+The header has the format version, the embedding model and the offsets and sizes of both sections.
+The embeddings are stored uncompressed, so they can be memory-mapped.
+
+SnapshotIndex serves query_chroma from a snapshot instead of Chroma, read-only: the embeddings are memory-mapped,
+so the web workers of a server share a single copy of them in the page cache. Set SNAPSHOT_INDEX to its path.
+
+    python snapshot.py export snapshot.bin     write the collection to a snapshot
+    python snapshot.py import snapshot.bin     add the products of a snapshot to the collection
+'''
+
+import argparse
+import json
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+
+magic = b"PSSNAP\x00\x00"
+snapshot_version = 1
+alignment = 64
+
+
+def _matches(metadata: dict, where: dict) -> bool:
+    '''
+    Evaluates a Chroma where filter on a metadata dict, with the operators vector_db uses
+    '''
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            (operator, value), = condition.items()
+            present = key in metadata
+            if operator == "$eq" and metadata.get(key) != value:
+                return False
+            if operator == "$ne" and present and metadata[key] == value:
+                return False
+            if operator == "$in" and metadata.get(key) not in value:
+                return False
+            if operator == "$nin" and present and metadata[key] in value:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def export_snapshot(path: str, batch_size: int = 1000) -> int:
+    '''
+    Writes the documents, metadata and float16 embeddings of the collection, and the compatibility data of its
+    products, to a snapshot file. Returns the number of products.
+    '''
+    import numpy as np
+    import vector_db
+    from compatibility_index import MANUFACTURER_PART_NUMBER, MODEL, REPLACES
+
+    collection = vector_db.get_collection()
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        ids += batch["ids"]
+        documents += batch["documents"]
+        metadatas += batch["metadatas"]
+        embeddings.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    vectors = np.concatenate(embeddings).astype("<f2") if embeddings else np.zeros((0, 0), dtype="<f2")
+
+    index = vector_db.compatibility_index
+    compatibility = {
+        partselect_number: {
+            "models": index.identifiers_for(partselect_number, MODEL),
+            "manufacturer_part_numbers": index.identifiers_for(partselect_number, MANUFACTURER_PART_NUMBER),
+            "replaces": index.identifiers_for(partselect_number, REPLACES),
+        }
+        for partselect_number in ids
+        if index.is_indexed(partselect_number)
+    }
+    records = zlib.compress(
+        json.dumps(
+            {"ids": ids, "documents": documents, "metadatas": metadatas, "compatibility": compatibility}
+        ).encode("utf-8"),
+        6,
+    )
+
+    header = {
+        "version": snapshot_version,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "collection": vector_db.collection_name,
+        "embedding_model": vector_db.embedding_model_name,
+        "count": len(ids),
+        "dimensions": int(vectors.shape[1]) if len(ids) else 0,
+        "dtype": "float16",
+        "vectors_offset": 0,
+        "records_offset": 0,
+        "records_length": len(records),
+    }
+    # The offsets depend on the length of the header, which depends on the offsets
+    for _ in range(2):
+        header_bytes = json.dumps(header).encode("utf-8")
+        header["vectors_offset"] = _aligned(len(magic) + 8 + len(header_bytes))
+        header["records_offset"] = header["vectors_offset"] + vectors.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\x00" * (header["vectors_offset"] - f.tell()))
+        f.write(vectors.tobytes())
+        f.write(records)
+    return len(ids)
+
+
+def _aligned(offset: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a snapshot")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+    if header.get("version") != snapshot_version:
+        raise ValueError(f"{path} is a version {header.get('version')} snapshot, expected version {snapshot_version}")
+    return header
+
+
+def read_snapshot(path: str) -> tuple:
+    '''
+    Returns the header, the memory-mapped float16 embeddings and the records of a snapshot
+    '''
+    import numpy as np
+
+    header = read_header(path)
+    if header["count"]:
+        vectors = np.memmap(
+            path, dtype="<f2", mode="r", offset=header["vectors_offset"], shape=(header["count"], header["dimensions"])
+        )
+    else:
+        vectors = np.zeros((0, 0), dtype="<f2")
+    with open(path, "rb") as f:
+        f.seek(header["records_offset"])
+        records = json.loads(zlib.decompress(f.read(header["records_length"])))
+    return header, vectors, records
+
+
+def compatibility_products(records: dict) -> list:
+    '''
+    The compatibility data of a snapshot in the format of extracted products, for CompatibilityIndex.add_products
+    '''
+    return [
+        {
+            "PartSelect Number": partselect_number,
+            "Compatible Models": data["models"],
+            "Manufacturer Part Number": (data["manufacturer_part_numbers"] or [""])[0],
+            "Part replaces these": data["replaces"],
+        }
+        for partselect_number, data in records["compatibility"].items()
+    ]
+
+
+def check_embedding_model(header: dict, path: str):
+    import vector_db
+
+    if header["embedding_model"] != vector_db.embedding_model_name:
+        raise ValueError(
+            f"{path} was encoded with {header['embedding_model']}, "
+            f"queries are encoded with {vector_db.embedding_model_name}"
+        )
+
+
+def import_snapshot(path: str, batch_size: int = 1000) -> int:
+    '''
+    Adds the products of a snapshot to the collection with their stored embeddings, without encoding them.
+    Returns the number of products.
+    '''
+    import vector_db
+
+    header, vectors, records = read_snapshot(path)
+    check_embedding_model(header, path)
+    collection = vector_db.get_collection()
+    ids = records["ids"]
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            documents=records["documents"][start:end],
+            metadatas=records["metadatas"][start:end],
+            embeddings=vectors[start:end].astype("float32").tolist(),
+        )
+    vector_db.lexical_index.add_many(ids, records["documents"])
+    vector_db.compatibility_index.add_products(compatibility_products(records))
+    for listener in vector_db.collection_listeners:
+        listener(ids)
+    return len(ids)
+
+
+class SnapshotIndex:
+    '''
+    A read-only stand-in for the Chroma collection, with the count, get and query methods vector_db uses.
+    Queries are brute force over the memory-mapped embeddings, a where filter first narrows the rows that are compared.
+    Distances are squared L2 like Chroma's default.
+    '''
+
+    read_only = True
+
+    def __init__(self, path: str, chunk_size: int = 8192):
+        import numpy as np
+
+        self.path = path
+        self.chunk_size = chunk_size
+        self.header, self.vectors, records = read_snapshot(path)
+        check_embedding_model(self.header, path)
+        self.ids = records["ids"]
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+        self.compatibility_products = compatibility_products(records)
+        self._positions = {document_id: i for i, document_id in enumerate(self.ids)}
+        # Per process, 4 bytes per product
+        self._norms = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), chunk_size):
+            chunk = self.vectors[start : start + chunk_size].astype(np.float32)
+            self._norms[start : start + chunk_size] = (chunk * chunk).sum(axis=1)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> dict:
+        include = include or ["documents", "metadatas"]
+        if ids is None:
+            positions = range(len(self.ids))
+        else:
+            ids = [ids] if isinstance(ids, str) else ids
+            positions = [self._positions[document_id] for document_id in ids if document_id in self._positions]
+        if where:
+            positions = [i for i in positions if _matches(self.metadatas[i], where)]
+        positions = list(positions)[offset or 0 :]
+        if limit is not None:
+            positions = positions[:limit]
+        return self._result(positions, include)
+
+    def query(self, query_embeddings, n_results: int = 10, where=None, include=None) -> dict:
+        import numpy as np
+
+        include = include or ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        candidates = None
+        if where:
+            candidates = np.array(
+                [i for i, metadata in enumerate(self.metadatas) if _matches(metadata, where)], dtype=np.int64
+            )
+        total = len(self.ids) if candidates is None else len(candidates)
+
+        results = {key: [] for key in ["ids", *include]}
+        for query in queries:
+            distances = np.empty(total, dtype=np.float32)
+            for start in range(0, total, self.chunk_size):
+                rows = slice(start, start + self.chunk_size)
+                positions = candidates[rows] if candidates is not None else None
+                chunk = self.vectors[positions if positions is not None else rows].astype(np.float32)
+                norms = self._norms[positions if positions is not None else rows]
+                distances[rows] = norms - 2 * (chunk @ query) + float(query @ query)
+            k = min(n_results, total)
+            if k < total:
+                nearest = np.argpartition(distances, k - 1)[:k] if k else np.arange(0)
+            else:
+                nearest = np.arange(total)
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+            positions = [int(candidates[i]) if candidates is not None else int(i) for i in nearest]
+            result = self._result(positions, include)
+            result["distances"] = [float(distances[i]) for i in nearest]
+            for key in results:
+                results[key].append(result[key])
+        return results
+
+    def _result(self, positions: list, include: list) -> dict:
+        result = {"ids": [self.ids[i] for i in positions]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in positions]
+        if "embeddings" in include:
+            result["embeddings"] = [self.vectors[i].astype("float32").tolist() for i in positions]
+        return result
+
+    def upsert(self, *args, **kwargs):
+        raise RuntimeError(f"The snapshot index {self.path} is read-only")
+
+    update = upsert
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector database snapshots")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", type=str)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        count = export_snapshot(args.path, args.batch_size)
+        print(f"Exported {count} products to {args.path} in {time.perf_counter() - start:.1f}s")
+    else:
+        count = import_snapshot(args.path, args.batch_size)
+        print(f"Imported {count} products from {args.path} in {time.perf_counter() - start:.1f}s")
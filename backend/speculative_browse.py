@@ -0,0 +1,96 @@
+'''
+This file starts the PartSelect search of part numbers the database doesn't have before the LLM asks for it.
+
+When the question mentions a part number the database doesn't know, the LLM almost always calls search_partselect
+after its first completion. A BrowsePrefetch starts that search as soon as the miss is known, so it runs while the
+first completion is generated, and hands the result over if the tool is requested for the same part number.
+Prefetches that aren't requested are cancelled when the request ends. A search that already started can't be
+stopped, it finishes in the background and its page still goes to the page cache.
+Prefetches only take a browsing slot that is free right away, they are skipped when browsing is busy.
+'''
+
+import threading
+import time
+from url_resolver import normalize_search_term
+
+# saved_seconds: time the tool calls didn't wait because the search was already running or done.
+# wasted_seconds: time spent on searches the LLM didn't ask for. skipped: prefetches not started, no slot was free.
+stats = {
+    "started": 0, "used": 0, "cancelled": 0, "wasted": 0, "skipped": 0, "saved_seconds": 0.0, "wasted_seconds": 0.0
+}
+_stats_lock = threading.Lock()
+
+
+def _record(**amounts):
+    with _stats_lock:
+        for name, amount in amounts.items():
+            stats[name] += amount
+
+
+class BrowsePrefetch:
+    '''
+    The prefetched searches of one request. search(search_term) runs in executor,
+    holding a slot of admission (a BrowseAdmission) if one is given.
+    '''
+
+    def __init__(self, executor, search, admission=None):
+        self.executor = executor
+        self.search = search
+        self.admission = admission
+        self._lookups = {}  # normalized search term -> (future, start, finished)
+        self._lock = threading.Lock()
+
+    def start(self, search_term: str):
+        key = normalize_search_term(search_term)
+        with self._lock:
+            if key in self._lookups:
+                return
+            if self.admission is not None and not self.admission.try_acquire():
+                _record(skipped=1)
+                return
+            finished = []
+            future = self.executor.submit(self.search, search_term)
+            future.add_done_callback(lambda _: finished.append(time.perf_counter()))
+            if self.admission is not None:
+                # Also called when the prefetch is cancelled before it starts
+                future.add_done_callback(lambda _: self.admission.release())
+            self._lookups[key] = (future, time.perf_counter(), finished)
+        _record(started=1)
+        print(f"Prefetching {search_term} from PartSelect")
+
+    def take(self, search_term: str):
+        '''
+        Returns the future of the prefetched search for search_term and counts the time it saved, or None
+        '''
+        with self._lock:
+            lookup = self._lookups.pop(normalize_search_term(search_term), None)
+        if lookup is None:
+            return None
+        future, start, finished = lookup
+        saved = min(finished + [time.perf_counter()]) - start
+        _record(used=1, saved_seconds=saved)
+        print(f"Prefetch of {search_term} used, saved {saved:.2f}s")
+        return future
+
+    def cancel(self) -> int:
+        '''
+        Cancels the prefetches that weren't taken, returns how many there were
+        '''
+        with self._lock:
+            lookups, self._lookups = self._lookups, {}
+        for future, start, finished in lookups.values():
+            if future.cancel():
+                _record(cancelled=1)
+                continue
+            # Already running, count the time it takes once it's done
+            _record(wasted=1)
+            future.add_done_callback(
+                lambda _, start=start, finished=finished: _record(
+                    wasted_seconds=(finished[0] if finished else time.perf_counter()) - start
+                )
+            )
+        return len(lookups)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._lookups)
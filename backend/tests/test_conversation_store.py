@@ -0,0 +1,68 @@
+import threading
+from conversation_store import ConversationStore
+
+
+def turn(i: int) -> tuple:
+    return {"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}
+
+
+def test_workers_sharing_a_file_keep_each_others_messages(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    first, second = ConversationStore(path=path), ConversationStore(path=path)
+
+    first.append("session", *turn(0))
+    # The second worker reads the session before the first one appends to it again
+    assert second.get_history("session") == list(turn(0))
+    first.append("session", *turn(1))
+    second.append("session", *turn(2))
+
+    expected = list(turn(0) + turn(1) + turn(2))
+    assert first.get_history("session") == expected
+    assert second.get_history("session") == expected
+
+
+def test_concurrent_appends_from_two_workers(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    stores = [ConversationStore(path=path), ConversationStore(path=path)]
+
+    def append_turns(store, start):
+        for i in range(start, start + 20):
+            store.append("session", *turn(i))
+
+    threads = [threading.Thread(target=append_turns, args=(store, 100 * n)) for n, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    history = ConversationStore(path=path).get_history("session")
+    assert len(history) == 80
+    assert {message["content"] for message in history} == {
+        f"{kind} {i}" for i in list(range(20)) + list(range(100, 120)) for kind in ("question", "answer")
+    }
+
+
+def test_summary_of_one_worker_keeps_the_messages_of_the_other(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    summarizer = lambda summary, messages: f"{len(messages)} messages summarized"
+    first = ConversationStore(path=path, token_budget=20, keep_recent=2, summarizer=summarizer)
+    second = ConversationStore(path=path)
+
+    for i in range(3):
+        first.append("session", *turn(i))
+    first.wait()
+    second.append("session", *turn(3))
+
+    history = second.get_history("session")
+    assert history[0]["role"] == "system" and "summarized" in history[0]["content"]
+    assert history[-2:] == list(turn(3))
+
+
+def test_max_sessions_in_memory_and_in_a_file(tmp_path):
+    for store in (ConversationStore(max_sessions=2), ConversationStore(path=str(tmp_path / "c.db"), max_sessions=2)):
+        for i in range(3):
+            store.append(f"session {i}", *turn(i))
+
+        assert store.get_history("session 0") == []
+        assert store.get_history("session 1") == list(turn(1))
+        assert store.get_history("session 2") == list(turn(2))
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("crawl4ai")
+pytest.importorskip("aiohttp")
+# The crawl creates an OpenAI client for the LLM fallback of the extraction, it just needs a key to be constructed
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import crawl
+import ingestion
+from crawl_frontier import DONE, CrawlFrontier
+from benchmarks.fixture_server import FixtureSite
+from html_markdown import html_to_markdown
+
+
+class FixtureCrawler:
+    '''
+    Stands in for the browser of crawl4ai: fetches the pages of the fixture site over HTTP and converts them
+    with html_markdown.py, recording every url it fetched
+    '''
+
+    fetched = []
+
+    def __init__(self, config=None):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def arun(self, url: str, config=None):
+        return await asyncio.to_thread(self._fetch, url)
+
+    def _fetch(self, url: str):
+        self.fetched.append(url)
+        try:
+            with urllib.request.urlopen(url) as response:
+                html, headers, status = response.read().decode("utf-8"), dict(response.headers), response.status
+        except urllib.error.HTTPError as e:
+            return SimpleNamespace(success=False, status_code=e.code, error_message=str(e), markdown="")
+        return SimpleNamespace(
+            success=True, status_code=status, error_message="", markdown=html_to_markdown(html, url),
+            response_headers=headers,
+        )
+
+
+@pytest.fixture
+def site():
+    with FixtureSite() as site:
+        yield site
+
+
+@pytest.fixture
+def added(monkeypatch):
+    '''
+    The urls of the products the crawl adds, products are recorded instead of being extracted and stored
+    '''
+    added = []
+    FixtureCrawler.fetched = []
+    monkeypatch.setattr(crawl, "AsyncWebCrawler", FixtureCrawler)
+    monkeypatch.setattr(crawl, "is_in_vector_db", lambda url: False)
+    monkeypatch.setattr(
+        ingestion, "extract_product_info", lambda markdown, url, llm_client: {"PartSelect Number": url, "URL": url}
+    )
+    monkeypatch.setattr(
+        ingestion, "add_products_to_vector_db",
+        lambda product_infos, batch_size: added.extend(product_info["URL"] for product_info in product_infos),
+    )
+    return added
+
+
+def run_crawl(site, tmp_path, limit: int, **kwargs):
+    return asyncio.run(
+        crawl.find_and_add_products_async(
+            limit, site.url, concurrency=4, requests_per_second=0, frontier_path=str(tmp_path / "frontier.db"),
+            **kwargs,
+        )
+    )
+
+
+def test_crawl_finds_every_product(site, tmp_path, added):
+    stats = run_crawl(site, tmp_path, limit=100)
+
+    assert set(added) == {site.product_url(product) for product in site.products}
+    assert stats.products_added == len(site.products)
+    assert stats.failures == 0
+
+
+def test_crawl_fetches_and_adds_each_page_once(site, tmp_path, added):
+    run_crawl(site, tmp_path, limit=100)
+
+    assert len(added) == len(set(added))
+    assert len(FixtureCrawler.fetched) == len(set(FixtureCrawler.fetched))
+
+
+def test_crawl_respects_the_product_limit(site, tmp_path, added):
+    limit = len(site.products) // 2
+    stats = run_crawl(site, tmp_path, limit=limit)
+
+    assert len(added) == limit
+    assert stats.products_added == limit
+    assert sum(1 for url in FixtureCrawler.fetched if url in added) == limit
+
+
+def test_resumed_crawl_skips_the_pages_of_the_previous_run(site, tmp_path, added):
+    run_crawl(site, tmp_path, limit=100)
+    FixtureCrawler.fetched.clear()
+    added.clear()
+
+    stats = run_crawl(site, tmp_path, limit=100)
+
+    assert FixtureCrawler.fetched == []
+    assert added == []
+    assert stats.pages == 0
+
+
+def test_recrawl_revisits_the_listing_pages(site, tmp_path, added):
+    run_crawl(site, tmp_path, limit=len(site.products))
+    FixtureCrawler.fetched.clear()
+
+    # The products found by the first run don't count against the limit of the second
+    stats = run_crawl(site, tmp_path, limit=len(site.products), recrawl_after=0)
+
+    frontier = CrawlFrontier(str(tmp_path / "frontier.db"))
+    assert frontier.counts() == {DONE: stats.pages + stats.unchanged}
+    frontier.close()
+    assert stats.pages > 0
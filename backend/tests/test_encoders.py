@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+from encoders import OnnxEncoder, SentenceTransformerEncoder, cosine_similarities
+from vector_db import embedding_model_name
+
+queries = [
+    "My refrigerator ice maker is not making ice",
+    "How do I install the door shelf bin PS11752778?",
+    "Is W10348269 compatible with my WDT780SAEM1 dishwasher?",
+    "The dishwasher is not draining and makes a humming noise",
+    "Replacement water filter for a Whirlpool side by side fridge",
+    "Which lower dishrack wheel fits a Kenmore dishwasher?",
+]
+
+
+@pytest.fixture(scope="module")
+def encoders(tmp_path_factory):
+    # The models are downloaded on first use, without network access there is nothing to compare
+    try:
+        reference = SentenceTransformerEncoder(embedding_model_name)
+        onnx = OnnxEncoder(embedding_model_name, cache_directory=str(tmp_path_factory.mktemp("onnx_models")))
+    except Exception as e:
+        pytest.skip(f"The embedding model couldn't be loaded: {e}")
+    return reference, onnx
+
+
+def test_int8_onnx_embeddings_match_sentence_transformers(encoders):
+    reference, onnx = encoders
+
+    similarities = cosine_similarities(reference.encode(queries), onnx.encode(queries))
+
+    assert sum(similarities) / len(similarities) > 0.98
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("markdownify")
+from benchmarks.bench_html_markdown import fixture_corpus, main_region_html, previous_html_to_markdown, words
+from html_markdown import html_to_markdown
+from product_parser import parse_product_markdown
+
+pages = fixture_corpus(20)
+
+
+@pytest.mark.parametrize("name, page", pages, ids=[name for name, _ in pages])
+def test_content_matches_the_previous_converter(name, page):
+    new = html_to_markdown(page)
+    previous = previous_html_to_markdown(main_region_html(page))
+
+    assert words(new) == words(previous)
+    assert parse_product_markdown(new) == parse_product_markdown(previous)
+
+
+def test_keeps_the_header_of_the_main_region():
+    page = """
+    <html><body>
+    <header><a href="/">PartSelect</a> Call us</header>
+    <main><header><h1>Refrigerator Door Shelf Bin</h1></header><p>Fits most models.</p></main>
+    <footer>Terms of use</footer>
+    </body></html>
+    """
+
+    markdown = html_to_markdown(page)
+
+    assert "# Refrigerator Door Shelf Bin" in markdown
+    assert "Call us" not in markdown and "Terms of use" not in markdown
+
+
+def test_keeps_the_header_of_an_article_without_main_region():
+    page = """
+    <html><body>
+    <header>Call us</header>
+    <article><header><h1>Refrigerator Door Shelf Bin</h1></header><p>Fits most models.</p></article>
+    </body></html>
+    """
+
+    markdown = html_to_markdown(page)
+
+    assert "# Refrigerator Door Shelf Bin" in markdown
+    assert "Call us" not in markdown
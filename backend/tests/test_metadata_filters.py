@@ -0,0 +1,27 @@
+from compatibility_index import CompatibilityIndex
+from metadata_filters import where_filter
+
+
+def test_category_alone_doesnt_filter():
+    assert where_filter("Which filter do I need?") is None
+    assert where_filter("The light stays on and the fan is loud") is None
+
+
+def test_category_with_an_appliance_filters():
+    assert where_filter("Water filter for my fridge") == {
+        "$and": [{"appliance": "refrigerator"}, {"category": "water filter"}]
+    }
+
+
+def test_category_with_a_known_model_filters():
+    compatibility_index = CompatibilityIndex()
+    compatibility_index.add_products([{
+        "PartSelect Number": "PS11752778",
+        "Manufacturer Part Number": "WPW10321304",
+        "This part works with the following products": ["WDT780SAEM1"],
+        "Part replaces these": [],
+    }])
+
+    where = where_filter("Which rack wheel fits WDT780SAEM1?", compatibility_index)
+
+    assert where == {"$and": [{"category": "rack"}, {"partselect_number": {"$in": ["PS11752778"]}}]}
@@ -0,0 +1,47 @@
+import threading
+from page_cache import PageCache
+
+
+def test_get_or_compute_computes_once_for_concurrent_callers():
+    cache = PageCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+    owner.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute))) for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    release.set()
+    for thread in [owner, *waiters]:
+        thread.join(5)
+
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_get_or_compute_rechecks_the_cache_before_computing(monkeypatch):
+    cache = PageCache()
+    cache.set("key", "value")
+    # A lookup that missed just before the previous owner cached the value and left
+    monkeypatch.setattr(cache, "get", lambda key: None)
+
+    assert cache.get_or_compute("key", lambda: "computed again") == "value"
+    assert cache.get_or_compute("other", lambda: "computed") == "computed"
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "page_cache.db")
+    PageCache(disk_path=path).set("key", "value")
+
+    cache = PageCache(disk_path=path)
+    assert cache.get("key") == "value"
+    assert cache.stats["disk_hits"] == 1
@@ -0,0 +1,191 @@
+import json
+import os
+import time
+import pytest
+
+pytest.importorskip("flask")
+# The OpenAI client created by app.py is replaced by the fake, it just needs a key to be constructed
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("FLASK_SECRET_KEY", "test")
+os.environ.setdefault("WRITE_BACK", "0")
+import app as app_module
+import chat_server
+import customer_agent
+from benchmarks.fakes import FakeLLMClient
+
+reply = "The door shelf bin fits your refrigerator."
+part_number = "PS11752778"
+
+
+@pytest.fixture(autouse=True)
+def agent(monkeypatch):
+    '''
+    The agent without the database and the browser: no products are found, and browsing returns a fake page
+    '''
+    searches = []
+
+    def fake_search_partselect(part_number):
+        searches.append(part_number)
+        return f"# Door Shelf Bin\nPartSelect Number **{part_number}**\nFits most refrigerators."
+
+    monkeypatch.setattr(customer_agent, "retrieve_context", lambda query: ("No products were found.", []))
+    monkeypatch.setattr(customer_agent, "search_partselect", fake_search_partselect)
+    monkeypatch.setattr(customer_agent, "answer_cache", None)
+    monkeypatch.setattr(customer_agent, "llm_retry_backoff", 0)
+    return searches
+
+
+def failing_reply(messages):
+    raise ValueError("The model is unavailable")
+
+
+def test_stream_yields_progress_tokens_then_done():
+    llm_client = FakeLLMClient(reply=reply)
+
+    events = list(customer_agent.stream_customer_agent("Does it fit my fridge?", [], llm_client, False))
+
+    assert events[0] == ("progress", "Searching the database")
+    assert [event for event, _ in events[1:-1]] == ["token"] * len(reply.split(" "))
+    assert "".join(value for _, value in events[1:-1]) == reply
+    assert events[-1] == ("done", reply)
+
+
+def test_stream_browses_for_the_tool_calls(agent):
+    llm_client = FakeLLMClient(reply=reply, tool_calls=[("search_partselect", {"part_number": part_number})])
+
+    events = list(customer_agent.stream_customer_agent(f"How do I install {part_number}?", [], llm_client, True))
+
+    progress = [value for event, value in events if event == "progress"]
+    assert progress == ["Searching the database", f"Browsing PartSelect for {part_number}"]
+    # The answer is only streamed once the browsing is done
+    names = [event for event, _ in events]
+    assert names.index("token") > names.index("progress", 1)
+    assert events[-1] == ("done", reply)
+    assert agent == [part_number]
+    # The second round answers with the browsed page
+    assert len(llm_client.calls) == 2
+    tool_messages = [m for m in llm_client.calls[1]["messages"] if isinstance(m, dict) and m["role"] == "tool"]
+    assert len(tool_messages) == 1 and part_number in tool_messages[0]["content"]
+
+
+def test_stream_raises_the_error_of_the_llm():
+    llm_client = FakeLLMClient(reply=failing_reply)
+
+    events = customer_agent.stream_customer_agent("Does it fit my fridge?", [], llm_client, False)
+
+    assert next(events) == ("progress", "Searching the database")
+    with pytest.raises(ValueError):
+        next(events)
+
+
+def read_events(response) -> list:
+    '''
+    The (event, data) pairs of a server-sent events response
+    '''
+    events = []
+    for raw_event in response.get_data(as_text=True).split("\n\n"):
+        if raw_event:
+            event, data = raw_event.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def post_message(monkeypatch, llm_client, message: str, enable_browsing: bool = False):
+    monkeypatch.setattr(app_module, "llm_client", llm_client)
+    client = app_module.app.test_client()
+    response = client.post("/api/message/stream", json={"message": message, "enable_browsing": enable_browsing})
+    return client, response
+
+
+def test_endpoint_streams_server_sent_events(monkeypatch):
+    client, response = post_message(monkeypatch, FakeLLMClient(reply=reply), "Does it fit my fridge?")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = read_events(response)
+    assert events[0] == ("progress", {"message": "Searching the database"})
+    assert "".join(data["content"] for event, data in events if event == "token") == reply
+    assert events[-1] == ("done", {"response": reply})
+
+    with client.session_transaction() as session:
+        history = app_module.conversation_store.get_history(session["session_id"])
+    assert history[-2:] == [
+        {"role": "user", "content": "Does it fit my fridge?"},
+        {"role": "assistant", "content": reply},
+    ]
+
+
+def test_endpoint_streams_the_tool_call_rounds(monkeypatch, agent):
+    llm_client = FakeLLMClient(reply=reply, tool_calls=[("search_partselect", {"part_number": part_number})])
+
+    _, response = post_message(monkeypatch, llm_client, f"How do I install {part_number}?", enable_browsing=True)
+
+    events = read_events(response)
+    assert [data["message"] for event, data in events if event == "progress"] == [
+        "Searching the database",
+        f"Browsing PartSelect for {part_number}",
+    ]
+    assert events[-1] == ("done", {"response": reply})
+    assert agent == [part_number]
+
+
+def test_endpoint_ends_a_failed_stream_with_an_error_event(monkeypatch):
+    client, response = post_message(monkeypatch, FakeLLMClient(reply=failing_reply), "Does it fit my fridge?")
+
+    assert response.status_code == 200
+    events = read_events(response)
+    assert events[0] == ("progress", {"message": "Searching the database"})
+    assert events[-1] == ("error", {"error": chat_server.stream_error_message})
+    assert "done" not in [event for event, _ in events]
+
+    with client.session_transaction() as session:
+        assert app_module.conversation_store.get_history(session["session_id"]) == []
+
+
+def test_endpoint_rejects_an_empty_message(monkeypatch):
+    _, response = post_message(monkeypatch, FakeLLMClient(reply=reply), "")
+
+    assert response.status_code == 400
+
+
+def test_agent_answers_after_the_deadline(monkeypatch):
+    # The search outlives the deadline of the request, the LLM still answers without tools
+    monkeypatch.setattr(customer_agent, "agent_deadline", 0.2)
+    monkeypatch.setattr(customer_agent, "search_partselect", lambda part_number: time.sleep(1) or "")
+    llm_client = FakeLLMClient(reply=reply, tool_calls=[("search_partselect", {"part_number": part_number})])
+
+    content = customer_agent.query_customer_agent(f"How do I install {part_number}?", [], llm_client, True)
+
+    assert content == reply
+    assert len(llm_client.calls) == 2
+    tool_messages = [m for m in llm_client.calls[1]["messages"] if isinstance(m, dict) and m["role"] == "tool"]
+    assert tool_messages[0]["content"] == "Searching Part Select took too long, no result is available."
+
+
+class RecordingAnswerCache:
+    def __init__(self):
+        self.answers = []
+
+    def get(self, embedding, context_ids, enable_browse):
+        return None
+
+    def set(self, embedding, context_ids, enable_browse, answer):
+        self.answers.append(answer)
+
+
+@pytest.mark.parametrize("search, cached", [
+    (lambda part_number: f"PartSelect Number **{part_number}**", True),
+    (lambda part_number: time.sleep(1) or "", False),
+], ids=["search found the part", "search timed out"])
+def test_answers_after_a_failed_search_are_not_cached(monkeypatch, search, cached):
+    cache = RecordingAnswerCache()
+    monkeypatch.setattr(customer_agent, "answer_cache", cache)
+    monkeypatch.setattr(customer_agent, "embed_query", lambda query: [1.0])
+    monkeypatch.setattr(customer_agent, "tool_call_timeout", 0.2)
+    monkeypatch.setattr(customer_agent, "search_partselect", search)
+    llm_client = FakeLLMClient(reply=reply, tool_calls=[("search_partselect", {"part_number": part_number})])
+
+    content = customer_agent.query_customer_agent(f"How do I install {part_number}?", [], llm_client, True)
+
+    assert content == reply
+    assert cache.answers == ([reply] if cached else [])
@@ -0,0 +1,20 @@
+import pytest
+import tokens
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    def encoding_for_model(model):
+        raise ConnectionError("Failed to download the tokenizer")
+
+    monkeypatch.setattr(tokens.tiktoken, "encoding_for_model", encoding_for_model)
+    monkeypatch.setattr(tokens, "_encoding", None)
+
+
+def test_tokens_are_estimated_without_the_tokenizer(offline):
+    assert tokens.count_tokens("") == 0
+    assert tokens.count_tokens("abcd") == 1
+    assert tokens.count_tokens("abcdefghi") == 3
+    assert tokens.count_message_tokens([{"role": "user", "content": "abcdefgh"}]) == (
+        tokens.tokens_per_reply + tokens.tokens_per_message + 2
+    )
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("chromadb")
+import vector_db
+from benchmarks.bench_retrieval import generate_catalog
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index
+
+
+@pytest.fixture
+def cold_process(monkeypatch):
+    '''
+    vector_db as in a new process, nothing opened yet, with a collection that already holds the catalog
+    '''
+    from chromadb import chromadb
+
+    catalog = [product_info for product_info, _ in generate_catalog(12)]
+    stored = chromadb.EphemeralClient().get_or_create_collection("test_cold_process")
+    stored.upsert(
+        ids=[product_info["PartSelect Number"] for product_info in catalog],
+        documents=[vector_db.build_document(product_info) for product_info in catalog],
+        embeddings=[[float(i), 1.0] for i in range(len(catalog))],
+        metadatas=[vector_db.product_metadata(product_info) for product_info in catalog],
+    )
+    client = type("Client", (), {"get_or_create_collection": lambda self, name: stored})()
+    monkeypatch.setattr(chromadb, "PersistentClient", lambda path: client)
+    monkeypatch.setattr(vector_db, "snapshot_index_path", None)
+    monkeypatch.setattr(vector_db, "client", None)
+    monkeypatch.setattr(vector_db, "collection", None)
+    monkeypatch.setattr(vector_db, "compatibility_index", CompatibilityIndex())
+    monkeypatch.setattr(vector_db, "lexical_index", BM25Index())
+    return catalog
+
+
+def test_lexical_query_from_a_cold_process(cold_process):
+    product_info = cold_process[3]
+
+    results = vector_db.query_chroma(product_info["Manufacturer Part Number"], 1, mode="lexical")
+
+    assert results["ids"] == [[product_info["PartSelect Number"]]]
+    assert len(vector_db.lexical_index) == len(cold_process)
@@ -0,0 +1,66 @@
+import threading
+import time
+import pytest
+import ingestion
+import write_back
+from write_back import WriteBackQueue
+
+
+def product_page(i: int) -> tuple:
+    partselect_number = f"PS{11700000 + i}"
+    return f"PartSelect Number **{partselect_number}**", f"https://www.partselect.com/{partselect_number}-Part.htm"
+
+
+@pytest.fixture
+def written(monkeypatch):
+    '''
+    The PartSelect numbers written to the database, pages are extracted and written without the LLM or the database
+    '''
+    written = []
+    monkeypatch.setattr(write_back, "is_in_vector_db", lambda url: False)
+    monkeypatch.setattr(
+        ingestion, "extract_product_info",
+        lambda markdown, url, llm_client: {"PartSelect Number": markdown.split("**")[1], "URL": url},
+    )
+    monkeypatch.setattr(
+        ingestion, "add_products_to_vector_db",
+        lambda product_infos, batch_size: written.extend(product_info["PartSelect Number"] for product_info in product_infos),
+    )
+    return written
+
+
+def test_close_writes_the_queued_pages(written):
+    queue = WriteBackQueue(None, batch_size=8, max_pending=8)
+    for i in range(5):
+        queue.submit(*product_page(i))
+
+    queue.close()
+
+    assert sorted(written) == [f"PS{11700000 + i}" for i in range(5)]
+    assert queue.stats["written"] == 5
+
+
+def test_close_doesnt_hang_on_a_full_queue(monkeypatch, written):
+    # The thread is stuck on the first page, the queue behind it is full
+    stuck, release = threading.Event(), threading.Event()
+
+    def slow_is_in_vector_db(url):
+        stuck.set()
+        release.wait(5)
+        return False
+
+    monkeypatch.setattr(write_back, "is_in_vector_db", slow_is_in_vector_db)
+    queue = WriteBackQueue(None, max_pending=2)
+    queue.submit(*product_page(0))
+    stuck.wait(5)
+    for i in range(1, 3):
+        queue.submit(*product_page(i))
+
+    start = time.perf_counter()
+    queue.close(timeout=0.2)
+
+    assert time.perf_counter() - start < 2
+    # Pages browsed after close are dropped
+    queue.submit(*product_page(10))
+    assert queue.stats["dropped"] == 1
+    release.set()
@@ -0,0 +1,55 @@
+'''
+This file counts the prompt tokens of chat messages with the tokenizer of the OpenAI models, so the prompt
+sent to the LLM can be kept within a budget.
+
+tiktoken downloads the tokenizer the first time it is used, or reads it from TIKTOKEN_CACHE_DIR. When it can't be
+loaded, e.g. on a server without internet access, tokens are estimated as 4 characters each instead.
+'''
+
+import threading
+import tiktoken
+
+# Tokens the chat format adds around every message, and before the reply
+tokens_per_message = 3
+tokens_per_reply = 3
+
+# Characters per token of the estimate used without the tokenizer
+characters_per_token = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding(model: str = "gpt-4o"):
+    '''
+    Returns the tokenizer, loaded on first use, or False if it can't be loaded
+    '''
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.encoding_for_model(model)
+                except Exception as e:
+                    print(f"Failed to load the tokenizer, estimating tokens from the text length: {e}")
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is False:
+        return (len(text or "") + characters_per_token - 1) // characters_per_token
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+
+def count_message_tokens(messages: list) -> int:
+    '''
+    Counts the prompt tokens of a list of chat messages
+    '''
+    if not messages:
+        return 0
+    total = tokens_per_reply
+    for message in messages:
+        total += tokens_per_message + count_tokens(message.get("content") or "")
+    return total
@@ -0,0 +1,89 @@
+'''
+This file resolves part and model numbers to their PartSelect page, so the browsing tool can fetch the page directly
+instead of loading the home page, closing pop-ups and going through the search box in a browser.
+
+URLs come from the product metadata in the vector database first, then from a map of urls learned from earlier browser searches.
+'''
+
+import json
+import os
+import threading
+import requests
+from vector_db import get_product_url
+
+url_map_path = os.getenv("URL_MAP_PATH", "./url_map.json")
+
+request_headers = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+_lock = threading.Lock()
+_learned_urls = None
+
+
+def normalize_search_term(search_term: str) -> str:
+    return search_term.strip().upper()
+
+
+def _load_learned_urls() -> dict:
+    global _learned_urls
+    if _learned_urls is None:
+        try:
+            with open(url_map_path) as f:
+                _learned_urls = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _learned_urls = {}
+    return _learned_urls
+
+
+def resolve_url(search_term: str) -> str:
+    '''
+    Returns the canonical product or model page url for a search term, or an empty string if it's unknown
+    '''
+    search_term = normalize_search_term(search_term)
+
+    try:
+        url = get_product_url(search_term)
+        if url:
+            return url
+    except Exception as e:
+        print(f"Could not look up the url in the vector db: {e}")
+
+    with _lock:
+        return _load_learned_urls().get(search_term, "")
+
+
+def learn_url(search_term: str, url: str):
+    '''
+    Remember which page a browser search landed on, and persist the map so it survives restarts
+    '''
+    search_term = normalize_search_term(search_term)
+    with _lock:
+        learned_urls = _load_learned_urls()
+        if learned_urls.get(search_term) == url:
+            return
+        learned_urls[search_term] = url
+        with open(url_map_path, "w") as f:
+            json.dump(learned_urls, f, indent=2)
+
+
+def fetch_page(url: str, timeout: float = 10) -> str:
+    '''
+    Fetch a page with a plain HTTP client. Returns an empty string if the page couldn't be fetched,
+    e.g. when the site denies non-browser clients, so the caller can fall back to the browser.
+    '''
+    try:
+        response = requests.get(url, headers=request_headers, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Direct fetch of {url} failed: {e}")
+        return ""
+
+    if response.status_code != 200 or "access denied" in response.text[:2000].lower():
+        print(f"Direct fetch of {url} returned status {response.status_code}")
+        return ""
+    return response.text
@@ -3,19 +3,67 @@ This file is responsible for handling queries and insertions to our vector datab
 It is also responsible for making the necessary LLM calls to extract product information before inserting data into the database.
 '''
 
+import os
 import re
 import copy
+import threading
 import yaml
-from chromadb import chromadb
-from sentence_transformers import SentenceTransformer
+from collections import OrderedDict
+from product_parser import parse_product_markdown
+from compatibility_index import CompatibilityIndex
+from lexical_index import BM25Index, reciprocal_rank_fusion, weighted_fusion
+from metadata_filters import product_attributes, where_filter
+from metrics import register_stats, span
 
 persist_directory = "./chroma_persistent_data"
-client = chromadb.PersistentClient(path=persist_directory)
-
 collection_name = "product_support"
-collection = client.get_or_create_collection(collection_name)
+embedding_model_name = "all-MiniLM-L6-v2"
+
+# With SNAPSHOT_INDEX set to the path of a snapshot, queries are served from its memory-mapped embeddings instead of
+# Chroma, read-only, see snapshot.py
+snapshot_index_path = os.getenv("SNAPSHOT_INDEX")
+
+# The client, the collection and the embedding model are created on first use, see get_collection and get_embedding_model,
+# so importing this file is cheap. They can also be assigned directly, e.g. to use another collection.
+client = None
+collection = None
+embedding_model = None
+_init_lock = threading.Lock()
+
+# sentence-transformers or onnx, see encoders.py
+encoder_backend = os.getenv("ENCODER_BACKEND", "sentence-transformers")
+
+# With ENCODER_ADDRESS set (host:port), texts are encoded by a shared encoder_server.py process instead of loading the model
+encoder_address = os.getenv("ENCODER_ADDRESS")
+
+# Functions called with the ids of the documents whenever documents are added or changed
+collection_listeners = []
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Embeddings of recent queries, keyed by the normalized query text
+query_embedding_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+query_embedding_stats = {"hits": 0, "misses": 0}
+register_stats("partselect_query_embedding_cache_total", "Query embedding cache lookups", lambda: query_embedding_stats)
+
+# Models, manufacturer part numbers and replaced part numbers of the products in the collection,
+# the file is opened on first use
+compatibility_index = CompatibilityIndex(os.getenv("COMPATIBILITY_INDEX_PATH", "./compatibility_index.db"))
+
+# Keyword index fused with the vector search, see query_chroma
+lexical_index = BM25Index()
+retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")  # vector, lexical or hybrid
+fusion_strategy = os.getenv("RETRIEVAL_FUSION", "rrf")  # rrf or weighted
+lexical_weight = float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", "0.5"))  # share of the keyword search in the fusion
+
+# Restrict the vector search to the appliance type, brands, part category and models of the question,
+# see metadata_filters.py. RETRIEVAL_FILTERS=0 searches the whole collection.
+metadata_filters_enabled = os.getenv("RETRIEVAL_FILTERS", "1") == "1"
+
+# Pages parsed with a lower confidence than this are sent to the LLM instead
+parser_confidence_threshold = float(os.getenv("PARSER_CONFIDENCE_THRESHOLD", "0.7"))
+extraction_stats = {"parser": 0, "llm": 0}
+register_stats("partselect_extractions_total", "Product extractions by method", lambda: extraction_stats)
 
 # Make sure all the information is in strict YAML format for ease of processing
 messages_template = [
@@ -64,17 +112,147 @@ messages_template = [
 ]
 
 
+def get_collection():
+    '''
+    Opens the Chroma collection, or the snapshot index, on first use, and builds the indexes that are kept next to it
+    '''
+    global client, collection
+    if collection is None:
+        with _init_lock:
+            if collection is None:
+                if snapshot_index_path:
+                    from snapshot import SnapshotIndex
+
+                    opened = SnapshotIndex(snapshot_index_path)
+                    if len(compatibility_index) == 0:
+                        compatibility_index.add_products(opened.compatibility_products)
+                else:
+                    from chromadb import chromadb
+
+                    client = chromadb.PersistentClient(path=persist_directory)
+                    opened = client.get_or_create_collection(collection_name)
+                build_indexes(opened)
+                collection = opened
+    return collection
+
+
+def get_embedding_model():
+    '''
+    Loads the encoder of ENCODER_BACKEND on first use, or connects to the shared encoder process if ENCODER_ADDRESS is set.
+    All of them have the encode method of SentenceTransformer.
+    '''
+    global embedding_model
+    if embedding_model is None:
+        with _init_lock:
+            if embedding_model is None:
+                if encoder_address:
+                    from encoder_server import RemoteEncoder
+
+                    embedding_model = RemoteEncoder(encoder_address)
+                else:
+                    from encoders import create_encoder
+
+                    embedding_model = create_encoder(encoder_backend, embedding_model_name)
+    return embedding_model
+
+
+def reindex_embeddings(batch_size: int = 64) -> int:
+    '''
+    Re-encode every document of the collection with the current encoder, only needed when switching
+    to an encoder whose embeddings are not near-identical to the ones the collection was built with
+    '''
+    collection = get_collection()
+    result = collection.get(include=["documents"])
+    ids, documents = result["ids"], result["documents"]
+    for start in range(0, len(ids), batch_size):
+        embeddings = get_embedding_model().encode(documents[start : start + batch_size], batch_size=batch_size)
+        collection.update(
+            ids=ids[start : start + batch_size], embeddings=[embedding.tolist() for embedding in embeddings]
+        )
+    with _query_embeddings_lock:
+        _query_embeddings.clear()
+    for listener in collection_listeners:
+        listener(ids)
+    return len(ids)
+
+
+def normalize_query(query: str) -> str:
+    # The model is uncased, so queries that only differ in case or spacing have the same embedding
+    return " ".join(query.lower().split())
+
+
+def embed_query(query: str):
+    '''
+    Encode a query, recent queries are served from a bounded LRU cache
+    '''
+    key = normalize_query(query)
+    with _query_embeddings_lock:
+        embedding = _query_embeddings.get(key)
+        if embedding is not None:
+            _query_embeddings.move_to_end(key)
+            query_embedding_stats["hits"] += 1
+            return embedding
+        query_embedding_stats["misses"] += 1
+
+    with span("embed_query"):
+        embedding = get_embedding_model().encode(key)
+    with _query_embeddings_lock:
+        _query_embeddings[key] = embedding
+        while len(_query_embeddings) > query_embedding_cache_size:
+            _query_embeddings.popitem(last=False)
+    return embedding
+
+
 def add_to_vector_db(product_markdown: str, url: str, llm_client):
     '''
     Add product information to the database, given the product information in markdown format, and the product url
     '''
 
-    # LLM call to get the product information
-    product_info = extract_product_info(product_markdown, url, llm_client)
-    print("adding to vector db " + product_info["Product Name"])
+    # Parser or LLM call to get the product information
+    with span("extract_product"):
+        product_info = extract_product_info(product_markdown, url, llm_client)
+    add_products_to_vector_db([product_info])
 
-    # Create the document to add to the database
-    document = f"""
+
+def add_products_to_vector_db(product_infos: list, batch_size: int = 64):
+    '''
+    Add already extracted products to the database.
+    The documents are encoded in batches and written with a single upsert, which is much faster than one product at a time.
+    '''
+    # A batch can't have the same id twice, keep the last version of each product
+    by_id = {product_info["PartSelect Number"]: product_info for product_info in product_infos}
+    product_infos = list(by_id.values())
+    if not product_infos:
+        return
+
+    documents = [build_document(product_info) for product_info in product_infos]
+
+    # Create and add the embeddings and the metadata
+    with span("embed_documents", documents=len(documents)):
+        embeddings = get_embedding_model().encode(documents, batch_size=batch_size)
+    collection = get_collection()
+    with span("chroma_upsert", documents=len(documents)):
+        collection.upsert(
+            documents=documents,
+            embeddings=[embedding.tolist() for embedding in embeddings],
+            metadatas=[product_metadata(product_info) for product_info in product_infos],
+            ids=list(by_id.keys()),
+        )
+        compatibility_index.add_products(product_infos)
+        lexical_index.add_many(list(by_id.keys()), documents)
+    for listener in collection_listeners:
+        listener(list(by_id.keys()))
+
+    names = ", ".join(product_info["Product Name"] for product_info in product_infos[:3])
+    more = f" and {len(product_infos) - 3} more" if len(product_infos) > 3 else ""
+    print(f"Add {names}{more}, vector-db now has {collection.count()} items.")
+
+
+def build_document(product_info: dict) -> str:
+    '''
+    The text of a product that is embedded and given to the LLM as context
+    '''
+    return f"""
     Product Name: {product_info['Product Name']}
     Product Description: {product_info['Product Description']}
     PartSelect Number: {product_info['PartSelect Number']}
@@ -87,25 +265,81 @@ def add_to_vector_db(product_markdown: str, url: str, llm_client):
     URL: {product_info['URL']}
     """
 
-    # Create and add the embedding and the metadata
-    embedding = embedding_model.encode(document)
-    collection.add(
-        documents=[document],
-        embeddings=[embedding],
-        metadatas=[
-            {
-                "partselect_number": product_info["PartSelect Number"],
-                "manufacturer_part_number": product_info["Manufacturer Part Number"],
-                "manufacturer": product_info["Manufactured by"],
-                "url": product_info["URL"],
-            }
-        ],
-        ids=[product_info["PartSelect Number"]],
-    )
 
-    print(
-        f"Add {product_info['Product Name']}, vector-db now has {collection.count()} items."
+def product_metadata(product_info: dict) -> dict:
+    return {
+        "partselect_number": product_info["PartSelect Number"],
+        "manufacturer_part_number": product_info["Manufacturer Part Number"],
+        "manufacturer": product_info["Manufactured by"],
+        "url": product_info["URL"],
+        **product_attributes(product_info),
+    }
+
+
+def document_product_info(document: str) -> dict:
+    '''
+    The product information that can be read back from a document of the collection, None if it has no PartSelect number.
+    The model cross reference isn't in the documents.
+    '''
+    fields = dict(
+        line.strip().split(": ", 1) for line in document.splitlines() if ": " in line
     )
+    if not fields.get("PartSelect Number"):
+        return None
+    return {
+        "Product Name": fields.get("Product Name", ""),
+        "PartSelect Number": fields["PartSelect Number"],
+        "Manufacturer Part Number": fields.get("Manufacturer Part Number", ""),
+        "Manufactured by": fields.get("Manufactured by", ""),
+        "Manufactured for": fields.get("Manufactured for", "").split(", "),
+        "This part works with the following products": fields.get(
+            "This part works with the following products", ""
+        ).split(", "),
+        "Part replaces these": fields.get("Part replaces these", "").split(", "),
+        "URL": fields.get("URL", ""),
+    }
+
+
+def rebuild_compatibility_index(documents: list):
+    '''
+    Index the products that were added to the collection before the compatibility index existed.
+    Only the fields stored in the documents can be recovered, the model cross reference needs a re-crawl.
+    '''
+    product_infos = [product_info for product_info in map(document_product_info, documents) if product_info]
+    compatibility_index.add_products(product_infos)
+    print(f"Rebuilt the compatibility index for {len(product_infos)} products.")
+
+
+def add_missing_metadata(opened_collection, result: dict):
+    '''
+    Add the appliance type, brands and category to the metadata of products added before they were stored,
+    otherwise the filtered searches would never find them
+    '''
+    ids, metadatas = [], []
+    for document_id, document, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+        if metadata and "appliance" in metadata:
+            continue
+        product_info = document_product_info(document)
+        if product_info:
+            ids.append(document_id)
+            metadatas.append({**(metadata or {}), **product_attributes(product_info)})
+    if ids:
+        opened_collection.update(ids=ids, metadatas=metadatas)
+        print(f"Added the appliance, brand and category metadata of {len(ids)} products.")
+
+
+def build_indexes(opened_collection):
+    '''
+    Index the documents of the collection for the keyword search,
+    the compatibility data of products added before the compatibility index existed,
+    and the metadata of products added before it was stored
+    '''
+    result = opened_collection.get(include=["documents", "metadatas"])
+    lexical_index.add_many(result["ids"], result["documents"])
+    if len(compatibility_index) == 0 and result["ids"]:
+        rebuild_compatibility_index(result["documents"])
+    if not getattr(opened_collection, "read_only", False):
+        add_missing_metadata(opened_collection, result)
 
 
 def is_in_vector_db(url: str) -> bool:
@@ -117,29 +351,117 @@ def is_in_vector_db(url: str) -> bool:
     if not match:
         return False
 
-    result = collection.get(ids=match.group(0))
+    result = get_collection().get(ids=match.group(0))
     return len(result.get("ids")) > 0
 
 
-def query_chroma(query, top_n=4):
+def query_chroma(query, top_n=4, mode=None, filters=None):
     '''
-    Query the the database
+    Query the the database.
+    mode is "vector" for the embedding search only, "lexical" for the keyword search only,
+    or "hybrid" to fuse both, by default RETRIEVAL_MODE. The results have the format of collection.query.
+    filters restricts the vector search with the metadata filters of the query, by default RETRIEVAL_FILTERS.
+    The keyword search isn't filtered, an exact part number match is kept whatever the question says.
     '''
-    query_embedding = embedding_model.encode(query)
+    # Opening the collection builds the keyword and compatibility indexes, they are empty until then
+    get_collection()
+    mode = mode or retrieval_mode
+    filters = metadata_filters_enabled if filters is None else filters
+    where = where_filter(query, compatibility_index) if filters and mode != "lexical" else None
+    if mode == "vector":
+        return vector_query(query, top_n, where)
 
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_n,
-    )
+    # Fuse more candidates than needed, a document ranked low by one search can be ranked high by the other
+    candidates = top_n * 3
+    with span("lexical_search"):
+        lexical_results = lexical_index.search(query, candidates)
+    if mode == "lexical":
+        return results_for_ids([document_id for document_id, _ in lexical_results[:top_n]])
+
+    vector_results = vector_query(query, candidates, where)
+    vector_ids = vector_results["ids"][0] if vector_results["ids"] else []
+    vector_distances = vector_results["distances"][0] if vector_results.get("distances") else []
+    if fusion_strategy == "weighted":
+        ranked = weighted_fusion(list(zip(vector_ids, vector_distances)), lexical_results, lexical_weight)
+    else:
+        ranked = reciprocal_rank_fusion(
+            [vector_ids, [document_id for document_id, _ in lexical_results]],
+            weights=[1 - lexical_weight, lexical_weight],
+        )
+    return results_for_ids(ranked[:top_n], vector_results)
+
+
+def vector_query(query, top_n, where=None):
+    '''
+    Nearest neighbours of the query, among the products matching the where filter first.
+    If fewer than top_n products match, the closest of the others fill the results.
+    '''
+    query_embedding = embed_query(query)
 
+    results = None
+    if where:
+        with span("chroma_query", filtered=True):
+            try:
+                results = get_collection().query(query_embeddings=[query_embedding], n_results=top_n, where=where)
+            except Exception as e:
+                # Some versions of Chroma fail when fewer products than n_results match
+                print(f"Filtered query failed, querying without the filter: {e}")
+        if results and results["ids"] and len(results["ids"][0]) >= top_n:
+            return results
+
+    with span("chroma_query"):
+        unfiltered = get_collection().query(
+            query_embeddings=[query_embedding],
+            n_results=top_n,
+        )
+    if not results or not results["ids"] or not results["ids"][0]:
+        return unfiltered
+
+    # Keep the matching products first, then the closest others
+    seen = set(results["ids"][0])
+    for i, document_id in enumerate(unfiltered["ids"][0]):
+        if document_id in seen or len(results["ids"][0]) >= top_n:
+            continue
+        for key in ("ids", "documents", "metadatas", "distances"):
+            if results.get(key) and unfiltered.get(key):
+                results[key][0].append(unfiltered[key][0][i])
     return results
 
 
+def results_for_ids(ids: list, vector_results: dict = None) -> dict:
+    '''
+    Put fused ids in the format of collection.query, documents that the vector search didn't return are fetched by id.
+    Documents only found by the keyword search have no distance.
+    '''
+    known = {}
+    if vector_results and vector_results["ids"]:
+        for i, document_id in enumerate(vector_results["ids"][0]):
+            known[document_id] = (
+                vector_results["documents"][0][i],
+                vector_results["metadatas"][0][i],
+                vector_results["distances"][0][i],
+            )
+
+    missing = [document_id for document_id in ids if document_id not in known]
+    if missing:
+        fetched = get_collection().get(ids=missing, include=["documents", "metadatas"])
+        for document_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            known[document_id] = (document, metadata, None)
+
+    ids = [document_id for document_id in ids if document_id in known]
+    return {
+        "ids": [ids],
+        "documents": [[known[document_id][0] for document_id in ids]],
+        "metadatas": [[known[document_id][1] for document_id in ids]],
+        "distances": [[known[document_id][2] for document_id in ids]],
+    }
+
+
 def query_chroma_with_exact_id(id: str) -> str:
     '''
     Query the database with an exact product number
     '''
-    result = collection.get(ids=id)
+    result = get_collection().get(ids=id)
     if result and "documents" in result and len(result["documents"]) > 0:
         first_document = result["documents"][0]
         return str(first_document)
@@ -147,13 +469,44 @@ def query_chroma_with_exact_id(id: str) -> str:
         return ""
 
 
+def get_product_url(search_term: str) -> str:
+    '''
+    Look up the product page url of a PartSelect number or a manufacturer part number from the stored metadata
+    '''
+    if re.fullmatch(r"PS\d{8}", search_term):
+        result = get_collection().get(ids=search_term, include=["metadatas"])
+    else:
+        result = get_collection().get(
+            where={"manufacturer_part_number": search_term}, include=["metadatas"], limit=1
+        )
+
+    for metadata in result.get("metadatas") or []:
+        if metadata and metadata.get("url"):
+            return metadata["url"]
+    return ""
+
+
 def extract_product_info(markdown_content, url, llm_client) -> dict:
+    '''
+    Extracts the product information from the markdown of a product page.
+    The page is parsed with plain string parsing first, and only goes to the LLM
+    when the parser couldn't find enough of the fields, e.g. after a change to the layout of the website.
+    '''
+    data = parse_product_markdown(markdown_content)
+    if data["PartSelect Number"] and data["confidence"] >= parser_confidence_threshold:
+        extraction_stats["parser"] += 1
+        data["URL"] = url
+        return data
+
+    print(f"Parser confidence {data['confidence']} for {url}, using the LLM")
+    extraction_stats["llm"] += 1
+    return extract_product_info_with_llm(markdown_content, url, llm_client)
+
+
+def extract_product_info_with_llm(markdown_content, url, llm_client) -> dict:
     '''
     Queries the LLM to extract product information. Expects the LLM response to be in strict YAML format.
     Then validates and parses the YAML text.
-
-    NOTE: LLM call to extract each product information is costly and slow, this can be optimized by manual string parsing instead. 
-    However, then the parsing algorithm may need to be updated if there are changes to the way the website is organized. 
     '''
     messages = copy.deepcopy(messages_template)
     messages[0]["content"] = messages[0]["content"].format(
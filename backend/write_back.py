@@ -0,0 +1,122 @@
+'''
+This file adds the product pages browsed during chats to the vector database, so the next question about the same
+part is answered from the database instead of browsing PartSelect again.
+
+search_part_tool.py hands every page it fetches to submit(), which only queues it: the request doesn't wait.
+A background thread skips the pages that aren't product pages, that are already queued or already in the database,
+and passes the others to an IngestionPipeline, which extracts a few products at a time and writes them in batches.
+The batch is written when it's full, or when no page has been queued for flush_interval seconds.
+The queue holds at most max_pending pages, pages browsed while it's full are dropped.
+close() never blocks on a full queue, and gives up on the pages left after its timeout so shutdown can't hang.
+'''
+
+import queue
+import re
+import threading
+import time
+from ingestion import IngestionPipeline
+from vector_db import is_in_vector_db
+
+product_url_pattern = re.compile(r"/(PS\d{8})[^/]*\.htm")
+
+
+class WriteBackQueue:
+    def __init__(self, llm_client, batch_size: int = 8, max_extractions: int = 2, max_pending: int = 256,
+                 flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._pipeline = IngestionPipeline(llm_client, batch_size, max_extractions)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()  # PartSelect numbers queued or being written
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"queued": 0, "duplicates": 0, "dropped": 0, "written": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name="write-back", daemon=True)
+        self._thread.start()
+
+    def submit(self, markdown_content: str, url: str):
+        '''
+        Queue a browsed page to be added to the database, returns immediately
+        '''
+        match = product_url_pattern.search(url or "")
+        if not match or not markdown_content:
+            return
+        partselect_number = match.group(1)
+        with self._lock:
+            if self._stop.is_set():
+                self.stats["dropped"] += 1
+                return
+            if partselect_number in self._pending:
+                self.stats["duplicates"] += 1
+                return
+            try:
+                self._queue.put_nowait((markdown_content, url, partselect_number))
+            except queue.Full:
+                self.stats["dropped"] += 1
+                return
+            self._pending.add(partselect_number)
+            self.stats["queued"] += 1
+
+    def _run(self):
+        while True:
+            stopping = self._stop.is_set()
+            try:
+                item = self._queue.get(block=not stopping, timeout=self.flush_interval)
+            except queue.Empty:
+                if stopping:
+                    return
+                # Nothing browsed lately, write what is buffered instead of waiting for a full batch
+                self._pipeline.flush()
+                continue
+            if item is None:
+                return
+
+            markdown_content, url, partselect_number = item
+            try:
+                in_database = is_in_vector_db(url)
+            except Exception as e:
+                print(f"Could not check whether {partselect_number} is in the database: {e}")
+                in_database = False
+            if in_database:
+                self._finish(partselect_number, "duplicates")
+                continue
+            written = self._pipeline.submit(markdown_content, url)
+            written.add_done_callback(
+                lambda future, partselect_number=partselect_number: self._finish(
+                    partselect_number, "failed" if future.exception() else "written"
+                )
+            )
+
+    def _finish(self, partselect_number: str, outcome: str):
+        with self._lock:
+            self._pending.discard(partselect_number)
+            self.stats[outcome] += 1
+        if outcome == "written":
+            print(f"Wrote {partselect_number} browsed during a chat to the database")
+
+    def wait(self):
+        '''
+        Writes the queued pages, for tests and benchmarks
+        '''
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+            self._pipeline.flush()
+            time.sleep(0.05)
+
+    def close(self, timeout: float = 30.0):
+        '''
+        Stops the thread and writes the pages that are queued, waiting at most timeout seconds for the thread
+        '''
+        self._stop.set()
+        try:
+            # Wakes the thread up if it is waiting for pages
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # The thread is busy with the queued pages, it stops once the queue is empty
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Write-back didn't finish in {timeout}s, {self._queue.qsize()} browsed pages aren't written")
+            return
+        self._pipeline.close()
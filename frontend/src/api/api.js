@@ -23,6 +23,58 @@ export const getAIMessage = async (userQuery, enableBrowsing) => {
   }
 };
 
+// Stream the response as server-sent events. onProgress receives status updates while tools run,
+// onToken receives each piece of the answer. Resolves to the full message once the stream completes.
+export const streamAIMessage = async (userQuery, enableBrowsing, onProgress, onToken) => {
+  try {
+    const response = await fetch(`${API_URL}/api/message/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message: userQuery, enable_browsing: enableBrowsing }),
+    });
+
+    if (!response.ok) {
+      throw new Error(`Error: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let content = "";
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      const events = buffer.split("\n\n");
+      buffer = events.pop();
+      for (const rawEvent of events) {
+        const event = rawEvent.match(/^event: (.*)$/m)?.[1];
+        const data = JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] || "{}");
+        if (event === "progress") {
+          onProgress(data.message);
+        } else if (event === "token") {
+          content += data.content;
+          onToken(content);
+        } else if (event === "done") {
+          content = data.response;
+        } else if (event === "error") {
+          throw new Error(data.error);
+        }
+      }
+    }
+
+    return { role: "assistant", content: content };
+  } catch (error) {
+    console.error('Error streaming AI message:', error);
+    return { role: "assistant", content: "Error fetching message!"};
+  }
+};
+
 export const resetSession = async () => {
   try {
     const response = await fetch(`${API_URL}/api/reset_session`, {
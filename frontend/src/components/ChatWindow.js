@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import "./ChatWindow.css";
-import { getAIMessage, resetSession } from "../api/api";
+import { streamAIMessage, resetSession } from "../api/api";
 import { marked } from "marked";
 
 function ChatWindow() {
@@ -35,9 +35,18 @@ function ChatWindow() {
       setMessages(prevMessages => [...prevMessages, { role: "user", content: input }]);
       setInput("");
 
-      // Call API & set assistant message
-      const newMessage = await getAIMessage(input, enableBrowsing);
-      setMessages(prevMessages => [...prevMessages, newMessage]);
+      // Call API & stream the assistant message into a placeholder that shows progress until the first token arrives
+      setMessages(prevMessages => [...prevMessages, { role: "assistant", content: "_Thinking..._" }]);
+      const updateLastMessage = (content) => {
+        setMessages(prevMessages => [...prevMessages.slice(0, -1), { role: "assistant", content: content }]);
+      };
+      const newMessage = await streamAIMessage(
+        input,
+        enableBrowsing,
+        (progress) => updateLastMessage(`_${progress}..._`),
+        updateLastMessage
+      );
+      updateLastMessage(newMessage.content);
     }
   };
 